@@ -1,8 +1,9 @@
 import numpy as np
 cimport numpy as np
 cimport cython
-from cython.parallel import parallel, prange
+from cython.parallel import parallel, prange, threadid
 from libc.math cimport exp as cexp, pow as cpow, sqrt as csqrt
+from libc.stdlib cimport malloc, free
 from libcpp cimport bool
 from libcpp.algorithm cimport binary_search
 from libcpp.vector cimport vector
@@ -13,30 +14,136 @@ from ..utils.misc import shuffle_data
 cdef extern from "<random>" namespace "std" nogil:
     cdef cppclass mt19937:
         mt19937(unsigned int)
-    
+
     cdef cppclass uniform_int_distribution[T]:
         uniform_int_distribution(T, T)
         T operator()(mt19937)
 
+    cdef cppclass uniform_real_distribution[T]:
+        uniform_real_distribution(T, T)
+        T operator()(mt19937)
+
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef bool check_consumed(const int[:] indices, const int[:] indptr, 
+cdef bool check_consumed(const int[:] indices, const int[:] indptr,
                          int user, int item_neg) nogil:
-    return binary_search(&indices[indptr[user]], 
-                         &indices[indptr[user+1]], 
+    return binary_search(&indices[indptr[user]],
+                         &indices[indptr[user+1]],
                          item_neg)
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline int draw_item(mt19937 &rng,
+                          uniform_int_distribution[long] &dist,
+                          uniform_real_distribution[double] &real_dist,
+                          const double[:] alias_prob,
+                          const int[:] alias_idx,
+                          bool use_alias) nogil:
+    cdef int item = dist(rng)
+    if use_alias and real_dist(rng) >= alias_prob[item]:
+        item = alias_idx[item]
+    return item
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void sample_negatives(mt19937 &rng,
+                                  uniform_int_distribution[long] &dist,
+                                  uniform_real_distribution[double] &real_dist,
+                                  const double[:] alias_prob,
+                                  const int[:] alias_idx,
+                                  bool use_alias,
+                                  const int[:] sparse_indices,
+                                  const int[:] sparse_indptr,
+                                  const int[:] unique_counts,
+                                  int n_support,
+                                  const int[:, ::1] hard_items,
+                                  double hard_ratio,
+                                  int user,
+                                  int num_neg,
+                                  int *neg_items) noexcept nogil:
+    cdef int n, k, item_neg
+    cdef int n_hard = hard_items.shape[1]
+    cdef bool use_hard = hard_ratio > 0.0 and user < hard_items.shape[0]
+    for n in range(num_neg):
+        # hard items are indexed without consumed items, -1 if not enough
+        if use_hard and real_dist(rng) < hard_ratio:
+            k = <int> (real_dist(rng) * n_hard)
+            if k >= n_hard:
+                k = n_hard - 1
+            if hard_items[user, k] >= 0:
+                neg_items[n] = hard_items[user, k]
+                continue
+        item_neg = draw_item(rng, dist, real_dist,
+                             alias_prob, alias_idx, use_alias)
+        # users who have consumed all items can't get a true negative
+        if unique_counts[user] < n_support:
+            while check_consumed(sparse_indices, sparse_indptr,
+                                 user, item_neg):
+                item_neg = draw_item(rng, dist, real_dist,
+                                     alias_prob, alias_idx, use_alias)
+        neg_items[n] = item_neg
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg, 
-                 n_users, n_items, shuffle, num_threads, seed, epoch, 
-                 u_velocity=None, i_velocity=None, momentum=0.9, 
-                 u_1st_mom=None, i_1st_mom=None, u_2nd_mom=None, 
-                 i_2nd_mom=None, rho1=0.9, rho2=0.999):
+cdef inline int pairwise_grads(const float *user_vector,
+                               const float *item_embed,
+                               Py_ssize_t row_size,
+                               int item_pos,
+                               int *neg_items,
+                               int num_neg,
+                               bool use_max,
+                               float *neg_grads,
+                               float *pos_grad) nogil:
+    """Gradient coefficients of the log sigmoid of all (pos, neg) pairs.
+
+    With max aggregation only the highest-scoring negative is kept, which
+    is moved to the front. Returns the number of negatives to update, and
+    `pos_grad` is the sum of their coefficients.
+    """
+    cdef Py_ssize_t j
+    cdef int n, hardest = 0
+    cdef float pos_score = 0.0, neg_score, max_score = 0.0
+    cdef const float *item_ptr = item_embed + item_pos * row_size
+
+    for j in range(row_size):
+        pos_score += user_vector[j] * item_ptr[j]
+    pos_grad[0] = 0.0
+    for n in range(num_neg):
+        item_ptr = item_embed + neg_items[n] * row_size
+        neg_score = 0.0
+        for j in range(row_size):
+            neg_score += user_vector[j] * item_ptr[j]
+        if use_max:
+            if n == 0 or neg_score > max_score:
+                max_score = neg_score
+                hardest = n
+        else:
+            neg_grads[n] = 1.0 / (1.0 + cexp(pos_score - neg_score))
+            pos_grad[0] += neg_grads[n]
+
+    if use_max:
+        neg_items[0] = neg_items[hardest]
+        neg_grads[0] = 1.0 / (1.0 + cexp(pos_score - max_score))
+        pos_grad[0] = neg_grads[0]
+        return 1
+    return num_neg
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
+                 n_users, n_items, shuffle, num_threads, seed, epoch,
+                 u_velocity=None, i_velocity=None, momentum=0.9,
+                 u_1st_mom=None, i_1st_mom=None, u_2nd_mom=None,
+                 i_2nd_mom=None, rho1=0.9, rho2=0.999, neg_sampler=None,
+                 num_neg=1, neg_agg="sum", hard_sampler=None):
 
     if train_data.has_sampled:
         user_indices = train_data.user_indices_orig.astype(np.int32)
@@ -44,7 +151,7 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
     else:
         user_indices = train_data.user_indices.astype(np.int32)
         item_indices = train_data.item_indices.astype(np.int32)
-    
+
     sparse_interaction = train_data.sparse_interaction
     sparse_indices = sparse_interaction.indices
     sparse_indptr = sparse_interaction.indptr
@@ -52,6 +159,32 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
     if not reg:
         reg = 0.0
 
+    # draw negatives from an `AliasTable` if provided, otherwise uniformly
+    if neg_sampler is not None:
+        alias_prob = neg_sampler.prob.astype(np.float64)
+        alias_idx = neg_sampler.alias.astype(np.int32)
+        n_support = neg_sampler.n_support
+    else:
+        alias_prob = np.empty(0, dtype=np.float64)
+        alias_idx = np.empty(0, dtype=np.int32)
+        n_support = n_items
+    # rows of the summed csr matrix hold distinct items
+    unique_counts = np.diff(sparse_indptr).astype(np.int32)
+
+    # some negatives come from the index of a `HardNegativeSampler`
+    if hard_sampler is not None and hard_sampler.hard_items is not None:
+        hard_items = hard_sampler.hard_items
+        hard_ratio = hard_sampler.hard_ratio
+    else:
+        hard_items = np.empty((0, 1), dtype=np.int32)
+        hard_ratio = 0.0
+
+    # k negatives per positive, either summing the pairwise gradients of
+    # all of them or only using the highest-scoring one, as in WARP
+    if neg_agg not in ("sum", "max"):
+        raise ValueError("neg_agg must either be 'sum' or 'max'")
+    use_max = neg_agg == "max"
+
     if shuffle:
         user_indices, item_indices = shuffle_data(
             len(user_indices), user_indices, item_indices)
@@ -61,12 +194,20 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                         item_indices,
                         sparse_indices,
                         sparse_indptr,
+                        unique_counts,
+                        n_support,
                         user_embed,
                         item_embed,
                         lr,
                         reg,
                         n_users,
                         n_items,
+                        alias_prob,
+                        alias_idx,
+                        hard_items,
+                        hard_ratio,
+                        num_neg,
+                        use_max,
                         num_threads,
                         seed)
 
@@ -75,15 +216,23 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                              item_indices,
                              sparse_indices,
                              sparse_indptr,
+                             unique_counts,
+                             n_support,
                              user_embed,
                              item_embed,
                              lr,
                              reg,
                              n_users,
                              n_items,
-                             u_velocity, 
-                             i_velocity,  
-                             momentum, 
+                             alias_prob,
+                             alias_idx,
+                             u_velocity,
+                             i_velocity,
+                             momentum,
+                             hard_items,
+                             hard_ratio,
+                             num_neg,
+                             use_max,
                              num_threads,
                              seed)
 
@@ -92,19 +241,27 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
                          item_indices,
                          sparse_indices,
                          sparse_indptr,
+                         unique_counts,
+                         n_support,
                          user_embed,
                          item_embed,
                          lr,
                          reg,
                          n_users,
                          n_items,
-                         u_1st_mom, 
-                         i_1st_mom, 
-                         u_2nd_mom, 
-                         i_2nd_mom, 
-                         rho1, 
-                         rho2, 
-                         epoch, 
+                         alias_prob,
+                         alias_idx,
+                         u_1st_mom,
+                         i_1st_mom,
+                         u_2nd_mom,
+                         i_2nd_mom,
+                         rho1,
+                         rho2,
+                         epoch,
+                         hard_items,
+                         hard_ratio,
+                         num_neg,
+                         use_max,
                          num_threads,
                          seed)
 
@@ -112,299 +269,374 @@ cpdef bpr_update(optimizer, train_data, user_embed, item_embed, lr, reg,
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef void _bpr_update_sgd(const int[:] user_indices, 
-                          const int[:] item_indices, 
-                          const int[:] sparse_indices, 
-                          const int[:] sparse_indptr, 
-                          float[:, ::1] user_embed, 
-                          float[:, ::1] item_embed, 
-                          double lr, 
-                          double reg, 
-                          int n_users, 
-                          int n_items, 
-                          int num_threads, 
+cdef void _bpr_update_sgd(const int[:] user_indices,
+                          const int[:] item_indices,
+                          const int[:] sparse_indices,
+                          const int[:] sparse_indptr,
+                          const int[:] unique_counts,
+                          int n_support,
+                          float[:, ::1] user_embed,
+                          float[:, ::1] item_embed,
+                          double lr,
+                          double reg,
+                          int n_users,
+                          int n_items,
+                          const double[:] alias_prob,
+                          const int[:] alias_idx,
+                          const int[:, ::1] hard_items,
+                          double hard_ratio,
+                          int num_neg,
+                          bool use_max,
+                          int num_threads,
                           int seed):
 
-    cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef Py_ssize_t i, j, t, random_seed, user, item_pos
+    cdef int n, n_used
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
-    cdef float user_grad, item_pos_grad, item_neg_grad
+    cdef Py_ssize_t row_size = embed_size + 1
+    cdef float user_grad, pos_grad
     cdef long lower_bound = 0, upper_bound = n_items - 1
+    cdef bool use_alias = alias_prob.shape[0] > 0
 
     cdef float *user_embed_ptr
     cdef float *item_pos_embed_ptr
     cdef float *item_neg_embed_ptr
-    
+    cdef float *item_embed_start = &item_embed[0, 0]
+
+    # thread-local buffers
+    cdef float *user_vector
+    cdef int *neg_items
+    cdef float *neg_grads
+
     cdef vector[mt19937] rng
     cdef vector[uniform_int_distribution[long]] dist
+    cdef vector[uniform_real_distribution[double]] real_dist
 
     for i in range(num_threads):
         random_seed = (seed + i * 11) % 7
         rng.push_back(mt19937(random_seed))
         dist.push_back(uniform_int_distribution[long](
             lower_bound, upper_bound))
+        real_dist.push_back(uniform_real_distribution[double](0.0, 1.0))
 
     with nogil, parallel(num_threads=num_threads):
+        user_vector = <float *> malloc(sizeof(float) * row_size)
+        neg_items = <int *> malloc(sizeof(int) * num_neg)
+        neg_grads = <float *> malloc(sizeof(float) * num_neg)
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
-                item_neg = dist[t](rng[t])
+            sample_negatives(rng[t], dist[t], real_dist[t], alias_prob,
+                             alias_idx, use_alias, sparse_indices,
+                             sparse_indptr, unique_counts, n_support,
+                             hard_items, hard_ratio, user,
+                             num_neg, neg_items)
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
-            item_neg_embed_ptr = &item_embed[item_neg, 0]
-
-            item_diff = 0
-            for j in range(embed_size + 1):
-                item_diff = item_diff + user_embed_ptr[j] * (
-                    item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
+            # load the user vector once, all gradients use the old values
+            for j in range(row_size):
+                user_vector[j] = user_embed_ptr[j]
+            # assigned here to be private to every thread
+            pos_grad = 0.0
+            n_used = pairwise_grads(user_vector, item_embed_start, row_size,
+                                    item_pos, neg_items, num_neg, use_max,
+                                    neg_grads, &pos_grad)
 
             for j in range(embed_size):
-                user_grad = log_sigmoid_grad * (
-                    item_pos_embed_ptr[j] - item_neg_embed_ptr[j]
-                ) - reg * user_embed_ptr[j]
-                item_pos_grad = (
-                    log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_pos_embed_ptr[j]
-                )
-                item_neg_grad = (
-                    - log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_neg_embed_ptr[j]
-                )
-
+                user_grad = (
+                    pos_grad * item_pos_embed_ptr[j] - reg * user_vector[j])
+                for n in range(n_used):
+                    user_grad = user_grad - neg_grads[n] * item_embed_start[
+                        neg_items[n] * row_size + j]
                 user_embed_ptr[j] += lr * user_grad
-                item_pos_embed_ptr[j] += lr * item_pos_grad
-                item_neg_embed_ptr[j] += lr * item_neg_grad
 
-            item_pos_embed_ptr[embed_size] += lr * (
-                log_sigmoid_grad - reg * item_pos_embed_ptr[embed_size])
-            item_neg_embed_ptr[embed_size] += lr * (
-                -log_sigmoid_grad - reg * item_neg_embed_ptr[embed_size])
+            # last dimension is item bias, where user vector is 1.0
+            for j in range(row_size):
+                item_pos_embed_ptr[j] += lr * (
+                    pos_grad * user_vector[j] - reg * item_pos_embed_ptr[j])
+            for n in range(n_used):
+                item_neg_embed_ptr = item_embed_start + neg_items[n] * row_size
+                for j in range(row_size):
+                    item_neg_embed_ptr[j] += lr * (
+                        - neg_grads[n] * user_vector[j]
+                        - reg * item_neg_embed_ptr[j]
+                    )
+        free(user_vector)
+        free(neg_items)
+        free(neg_grads)
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef void _bpr_update_momentum(const int[:] user_indices, 
-                               const int[:] item_indices, 
-                               const int[:] sparse_indices, 
-                               const int[:] sparse_indptr, 
-                               float[:, ::1] user_embed, 
-                               float[:, ::1] item_embed, 
-                               double lr, 
-                               double reg, 
-                               int n_users, 
-                               int n_items, 
-                               float[:, ::1] u_velocity, 
-                               float[:, ::1] i_velocity, 
-                               double momentum, 
-                               int num_threads, 
+cdef void _bpr_update_momentum(const int[:] user_indices,
+                               const int[:] item_indices,
+                               const int[:] sparse_indices,
+                               const int[:] sparse_indptr,
+                               const int[:] unique_counts,
+                               int n_support,
+                               float[:, ::1] user_embed,
+                               float[:, ::1] item_embed,
+                               double lr,
+                               double reg,
+                               int n_users,
+                               int n_items,
+                               const double[:] alias_prob,
+                               const int[:] alias_idx,
+                               float[:, ::1] u_velocity,
+                               float[:, ::1] i_velocity,
+                               double momentum,
+                               const int[:, ::1] hard_items,
+                               double hard_ratio,
+                               int num_neg,
+                               bool use_max,
+                               int num_threads,
                                int seed):
 
-    cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef Py_ssize_t i, j, t, random_seed, user, item_pos
+    cdef int n, n_used
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
-    cdef float user_grad, item_pos_grad, item_neg_grad
+    cdef Py_ssize_t row_size = embed_size + 1
+    cdef float user_grad, pos_grad, item_pos_grad, item_neg_grad
     cdef long lower_bound = 0, upper_bound = n_items - 1
+    cdef bool use_alias = alias_prob.shape[0] > 0
 
     cdef float *user_embed_ptr
     cdef float *item_pos_embed_ptr
     cdef float *item_neg_embed_ptr
+    cdef float *item_embed_start = &item_embed[0, 0]
 
     cdef float *user_embed_v_ptr
     cdef float *item_pos_embed_v_ptr
     cdef float *item_neg_embed_v_ptr
-    
+    cdef float *item_v_start = &i_velocity[0, 0]
+
+    # thread-local buffers
+    cdef float *user_vector
+    cdef int *neg_items
+    cdef float *neg_grads
+
     cdef vector[mt19937] rng
     cdef vector[uniform_int_distribution[long]] dist
+    cdef vector[uniform_real_distribution[double]] real_dist
 
     for i in range(num_threads):
         random_seed = (seed + i * 11) % 7
         rng.push_back(mt19937(random_seed))
         dist.push_back(uniform_int_distribution[long](
             lower_bound, upper_bound))
+        real_dist.push_back(uniform_real_distribution[double](0.0, 1.0))
 
     with nogil, parallel(num_threads=num_threads):
+        user_vector = <float *> malloc(sizeof(float) * row_size)
+        neg_items = <int *> malloc(sizeof(int) * num_neg)
+        neg_grads = <float *> malloc(sizeof(float) * num_neg)
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
-                item_neg = dist[t](rng[t])
+            sample_negatives(rng[t], dist[t], real_dist[t], alias_prob,
+                             alias_idx, use_alias, sparse_indices,
+                             sparse_indptr, unique_counts, n_support,
+                             hard_items, hard_ratio, user,
+                             num_neg, neg_items)
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
-            item_neg_embed_ptr = &item_embed[item_neg, 0]
-
             user_embed_v_ptr = &u_velocity[user, 0]
             item_pos_embed_v_ptr = &i_velocity[item_pos, 0]
-            item_neg_embed_v_ptr = &i_velocity[item_neg, 0]
-
-            item_diff = 0
-            for j in range(embed_size + 1):
-                item_diff = item_diff + user_embed_ptr[j] * (
-                    item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
-
-            for j in range(embed_size + 1):
-                if j < embed_size:
-                    user_grad = log_sigmoid_grad * (
-                        item_pos_embed_ptr[j] - item_neg_embed_ptr[j]
-                    ) - reg * user_embed_ptr[j]
-                item_pos_grad = (
-                    log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_pos_embed_ptr[j]
-                )
-                item_neg_grad = (
-                    - log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_neg_embed_ptr[j]
-                )
-
-                if j < embed_size:
-                    user_embed_v_ptr[j] = (
-                        momentum * user_embed_v_ptr[j] + lr * user_grad)
-                    user_embed_ptr[j] += user_embed_v_ptr[j]
+            # load the user vector once, all gradients use the old values
+            for j in range(row_size):
+                user_vector[j] = user_embed_ptr[j]
+            # assigned here to be private to every thread
+            pos_grad = 0.0
+            n_used = pairwise_grads(user_vector, item_embed_start, row_size,
+                                    item_pos, neg_items, num_neg, use_max,
+                                    neg_grads, &pos_grad)
 
+            for j in range(embed_size):
+                user_grad = (
+                    pos_grad * item_pos_embed_ptr[j] - reg * user_vector[j])
+                for n in range(n_used):
+                    user_grad = user_grad - neg_grads[n] * item_embed_start[
+                        neg_items[n] * row_size + j]
+                user_embed_v_ptr[j] = (
+                    momentum * user_embed_v_ptr[j] + lr * user_grad)
+                user_embed_ptr[j] += user_embed_v_ptr[j]
+
+            for j in range(row_size):
+                item_pos_grad = (
+                    pos_grad * user_vector[j] - reg * item_pos_embed_ptr[j])
                 item_pos_embed_v_ptr[j] = (
                     momentum * item_pos_embed_v_ptr[j] + lr * item_pos_grad)
                 item_pos_embed_ptr[j] += item_pos_embed_v_ptr[j]
+            for n in range(n_used):
+                item_neg_embed_ptr = item_embed_start + neg_items[n] * row_size
+                item_neg_embed_v_ptr = item_v_start + neg_items[n] * row_size
+                for j in range(row_size):
+                    item_neg_grad = (
+                        - neg_grads[n] * user_vector[j]
+                        - reg * item_neg_embed_ptr[j]
+                    )
+                    item_neg_embed_v_ptr[j] = (
+                        momentum * item_neg_embed_v_ptr[j]
+                        + lr * item_neg_grad
+                    )
+                    item_neg_embed_ptr[j] += item_neg_embed_v_ptr[j]
+        free(user_vector)
+        free(neg_items)
+        free(neg_grads)
+
 
-                item_neg_embed_v_ptr[j] = (
-                    momentum * item_neg_embed_v_ptr[j] + lr * item_neg_grad)
-                item_neg_embed_ptr[j] += item_neg_embed_v_ptr[j]
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline void adam_step(float *param,
+                           float *first_moment,
+                           float *second_moment,
+                           float grad,
+                           double lr,
+                           double rho1,
+                           double rho2,
+                           double bias_correction1,
+                           double bias_correction2) noexcept nogil:
+    cdef float unbias_v, unbias_h
+    first_moment[0] = rho1 * first_moment[0] + (1.0 - rho1) * grad
+    second_moment[0] = rho2 * second_moment[0] + (
+        1.0 - rho2) * cpow(grad, 2)
+    unbias_v = first_moment[0] / bias_correction1
+    unbias_h = second_moment[0] / bias_correction2
+    param[0] = param[0] + lr * unbias_v / (csqrt(unbias_h) + 1e-8)
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cdef void _bpr_update_adam(const int[:] user_indices, 
-                           const int[:] item_indices, 
-                           const int[:] sparse_indices, 
-                           const int[:] sparse_indptr, 
-                           float[:, ::1] user_embed, 
-                           float[:, ::1] item_embed, 
-                           double lr, 
-                           double reg, 
-                           int n_users, 
-                           int n_items, 
-                           float[:, ::1] u_1st_mom, 
-                           float[:, ::1] i_1st_mom, 
-                           float[:, ::1] u_2nd_mom, 
-                           float[:, ::1] i_2nd_mom,  
-                           double rho1, 
-                           double rho2, 
-                           int epoch, 
-                           int num_threads, 
+cdef void _bpr_update_adam(const int[:] user_indices,
+                           const int[:] item_indices,
+                           const int[:] sparse_indices,
+                           const int[:] sparse_indptr,
+                           const int[:] unique_counts,
+                           int n_support,
+                           float[:, ::1] user_embed,
+                           float[:, ::1] item_embed,
+                           double lr,
+                           double reg,
+                           int n_users,
+                           int n_items,
+                           const double[:] alias_prob,
+                           const int[:] alias_idx,
+                           float[:, ::1] u_1st_mom,
+                           float[:, ::1] i_1st_mom,
+                           float[:, ::1] u_2nd_mom,
+                           float[:, ::1] i_2nd_mom,
+                           double rho1,
+                           double rho2,
+                           int epoch,
+                           const int[:, ::1] hard_items,
+                           double hard_ratio,
+                           int num_neg,
+                           bool use_max,
+                           int num_threads,
                            int seed):
 
-    cdef Py_ssize_t i, j, t, random_seed, user, item_pos, item_neg
+    cdef Py_ssize_t i, j, t, random_seed, user, item_pos
+    cdef Py_ssize_t neg_offset
+    cdef int n, n_used
     cdef int length = len(user_indices), embed_size = user_embed.shape[1] - 1
-    cdef float item_diff, log_sigmoid_grad
-    cdef float user_grad, item_pos_grad, item_neg_grad
-    cdef float unbias_v_user, unbias_h_user
-    cdef float unbias_v_pos_item, unbias_h_pos_item
-    cdef float unbias_v_neg_item, unbias_h_neg_item
+    cdef Py_ssize_t row_size = embed_size + 1
+    cdef float user_grad, pos_grad, item_pos_grad, item_neg_grad
+    cdef double bias_correction1 = 1.0 - cpow(rho1, epoch)
+    cdef double bias_correction2 = 1.0 - cpow(rho2, epoch)
     cdef long lower_bound = 0, upper_bound = n_items - 1
+    cdef bool use_alias = alias_prob.shape[0] > 0
 
     cdef float *user_embed_ptr
     cdef float *item_pos_embed_ptr
-    cdef float *item_neg_embed_ptr
+    cdef float *item_embed_start = &item_embed[0, 0]
+    cdef float *item_v_start = &i_1st_mom[0, 0]
+    cdef float *item_h_start = &i_2nd_mom[0, 0]
 
     cdef float *user_embed_v_ptr
     cdef float *user_embed_h_ptr
     cdef float *item_pos_embed_v_ptr
     cdef float *item_pos_embed_h_ptr
-    cdef float *item_neg_embed_v_ptr
-    cdef float *item_neg_embed_h_ptr
-    
+
+    # thread-local buffers
+    cdef float *user_vector
+    cdef int *neg_items
+    cdef float *neg_grads
+
     cdef vector[mt19937] rng
     cdef vector[uniform_int_distribution[long]] dist
+    cdef vector[uniform_real_distribution[double]] real_dist
 
     for i in range(num_threads):
         random_seed = (seed + i * 11) % 7
         rng.push_back(mt19937(random_seed))
         dist.push_back(uniform_int_distribution[long](
             lower_bound, upper_bound))
+        real_dist.push_back(uniform_real_distribution[double](0.0, 1.0))
 
     with nogil, parallel(num_threads=num_threads):
+        user_vector = <float *> malloc(sizeof(float) * row_size)
+        neg_items = <int *> malloc(sizeof(int) * num_neg)
+        neg_grads = <float *> malloc(sizeof(float) * num_neg)
         for i in prange(length):
-            t = i % num_threads
+            t = threadid()
             user = user_indices[i]
             item_pos = item_indices[i]
-            item_neg = dist[t](rng[t])
-            while check_consumed(sparse_indices, sparse_indptr, 
-                                 user, item_neg):
-                item_neg = dist[t](rng[t])
+            sample_negatives(rng[t], dist[t], real_dist[t], alias_prob,
+                             alias_idx, use_alias, sparse_indices,
+                             sparse_indptr, unique_counts, n_support,
+                             hard_items, hard_ratio, user,
+                             num_neg, neg_items)
 
             user_embed_ptr = &user_embed[user, 0]
             item_pos_embed_ptr = &item_embed[item_pos, 0]
-            item_neg_embed_ptr = &item_embed[item_neg, 0]
-
             user_embed_v_ptr = &u_1st_mom[user, 0]
             user_embed_h_ptr = &u_2nd_mom[user, 0]
             item_pos_embed_v_ptr = &i_1st_mom[item_pos, 0]
             item_pos_embed_h_ptr = &i_2nd_mom[item_pos, 0]
-            item_neg_embed_v_ptr = &i_1st_mom[item_neg, 0]
-            item_neg_embed_h_ptr = &i_2nd_mom[item_neg, 0]
-
-            item_diff = 0
-            for j in range(embed_size + 1):
-                item_diff = item_diff + user_embed_ptr[j] * (
-                    item_pos_embed_ptr[j] - item_neg_embed_ptr[j])
-            log_sigmoid_grad = 1.0 / (1.0 + cexp(item_diff))
-
-            for j in range(embed_size + 1):
-                if j < embed_size:
-                    user_grad = log_sigmoid_grad * (
-                        item_pos_embed_ptr[j] - item_neg_embed_ptr[j]
-                    ) - reg * user_embed_ptr[j]
-                item_pos_grad = (
-                    log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_pos_embed_ptr[j]
-                )
-                item_neg_grad = (
-                    - log_sigmoid_grad * user_embed_ptr[j] 
-                    - reg * item_neg_embed_ptr[j]
-                )
-
-                if j < embed_size:
-                    user_embed_v_ptr[j] = rho1 * user_embed_v_ptr[j] + (
-                        1.0 - rho1) * user_grad
-                    user_embed_h_ptr[j] = rho2 * user_embed_h_ptr[j] + (
-                        1.0 - rho2) * cpow(user_grad, 2)
-                    unbias_v_user = user_embed_v_ptr[j] / (
-                        1.0 - cpow(rho1, epoch))
-                    unbias_h_user = user_embed_h_ptr[j] / (
-                        1.0 - cpow(rho2, epoch))
-                    user_embed_ptr[j] = user_embed_ptr[j] + (
-                        lr * unbias_v_user / (csqrt(unbias_h_user) + 1e-8))
-
-                item_pos_embed_v_ptr[j] = rho1 * item_pos_embed_v_ptr[j] + (
-                    1.0 - rho1) * item_pos_grad
-                item_pos_embed_h_ptr[j] = rho2 * item_pos_embed_h_ptr[j] + (
-                    1.0 - rho2) * cpow(item_pos_grad, 2)
-                unbias_v_pos_item = item_pos_embed_v_ptr[j] / (
-                    1.0 - cpow(rho1, epoch))
-                unbias_h_pos_item = item_pos_embed_h_ptr[j] / (
-                    1.0 - cpow(rho2, epoch))
-                item_pos_embed_ptr[j] = item_pos_embed_ptr[j] + (
-                    lr * unbias_v_pos_item / (csqrt(unbias_h_pos_item) + 1e-8))
-
-                item_neg_embed_v_ptr[j] = rho1 * item_neg_embed_v_ptr[j] + (
-                    1.0 - rho1) * item_neg_grad
-                item_neg_embed_h_ptr[j] = rho2 * item_neg_embed_h_ptr[j] + (
-                    1.0 - rho2) * cpow(item_neg_grad, 2)
-                unbias_v_neg_item = item_neg_embed_v_ptr[j] / (
-                    1.0 - cpow(rho1, epoch))
-                unbias_h_neg_item = item_neg_embed_h_ptr[j] / (
-                    1.0 - cpow(rho2, epoch))
-                item_neg_embed_ptr[j] = item_neg_embed_ptr[j] + (
-                    lr * unbias_v_neg_item / (csqrt(unbias_h_neg_item) + 1e-8))
+            # load the user vector once, all gradients use the old values
+            for j in range(row_size):
+                user_vector[j] = user_embed_ptr[j]
+            # assigned here to be private to every thread
+            pos_grad = 0.0
+            n_used = pairwise_grads(user_vector, item_embed_start, row_size,
+                                    item_pos, neg_items, num_neg, use_max,
+                                    neg_grads, &pos_grad)
 
+            for j in range(embed_size):
+                user_grad = (
+                    pos_grad * item_pos_embed_ptr[j] - reg * user_vector[j])
+                for n in range(n_used):
+                    user_grad = user_grad - neg_grads[n] * item_embed_start[
+                        neg_items[n] * row_size + j]
+                adam_step(&user_embed_ptr[j], &user_embed_v_ptr[j],
+                          &user_embed_h_ptr[j], user_grad, lr, rho1, rho2,
+                          bias_correction1, bias_correction2)
+
+            for j in range(row_size):
+                item_pos_grad = (
+                    pos_grad * user_vector[j] - reg * item_pos_embed_ptr[j])
+                adam_step(&item_pos_embed_ptr[j], &item_pos_embed_v_ptr[j],
+                          &item_pos_embed_h_ptr[j], item_pos_grad, lr, rho1,
+                          rho2, bias_correction1, bias_correction2)
+            for n in range(n_used):
+                neg_offset = neg_items[n] * row_size
+                for j in range(row_size):
+                    item_neg_grad = (
+                        - neg_grads[n] * user_vector[j]
+                        - reg * item_embed_start[neg_offset + j]
+                    )
+                    adam_step(item_embed_start + neg_offset + j,
+                              item_v_start + neg_offset + j,
+                              item_h_start + neg_offset + j,
+                              item_neg_grad, lr, rho1, rho2,
+                              bias_correction1, bias_correction2)
+        free(user_vector)
+        free(neg_items)
+        free(neg_grads)
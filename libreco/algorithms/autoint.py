@@ -159,7 +159,7 @@ class AutoInt(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
+                self.multi_sparse_combiner)
         else:
             sparse_embed = tf.nn.embedding_lookup(sparse_feat, self.sparse_indices)
 
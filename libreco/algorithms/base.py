@@ -8,10 +8,12 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf2
 from tqdm import tqdm
+from ..data.data_generator import DataPrefetcher
 from ..feature import features_from_batch_data
 from ..utils.tf_ops import modify_variable_names
 from ..utils.misc import time_block, colorize
 from ..utils.exception import NotSamplingError
+from ..utils.sampling import HardNegativeSampler
 tf = tf2.compat.v1
 tf.disable_v2_behavior()
 
@@ -215,12 +217,12 @@ class Base(abc.ABC):
     def _sparse_feat_size(data_info):
         if (data_info.user_sparse_unique is not None
                 and data_info.item_sparse_unique is not None):
-            return max(np.max(data_info.user_sparse_unique),
-                       np.max(data_info.item_sparse_unique)) + 1
+            return int(max(np.max(data_info.user_sparse_unique),
+                           np.max(data_info.item_sparse_unique))) + 1
         elif data_info.user_sparse_unique is not None:
-            return np.max(data_info.user_sparse_unique) + 1
+            return int(np.max(data_info.user_sparse_unique)) + 1
         elif data_info.item_sparse_unique is not None:
-            return np.max(data_info.item_sparse_unique) + 1
+            return int(np.max(data_info.item_sparse_unique)) + 1
 
     @staticmethod
     def _sparse_field_size(data_info):
@@ -301,8 +303,74 @@ class TfMixin(object):
         config = tf.ConfigProto(**tf_sess_config)
         return tf.Session(config=config)
 
+    @staticmethod
+    def _prefetch(data_generator, **kwargs):
+        """Wrap the data generator to build batches in background threads.
+
+        `prefetch_size` is the number of batches built ahead, the default 0
+        disables prefetching. `prefetch_workers` is the number of building
+        threads. Samplers draw from the global `np.random` state, so with
+        more than one worker the order of draws, and the results, are no
+        longer reproducible.
+        `shuffle_block_size` enables block-wise shuffling of the generator,
+        which trades some randomness for locality on large arrays.
+        """
+        if kwargs.get("shuffle_block_size"):
+            data_generator.block_size = kwargs["shuffle_block_size"]
+        prefetch_size = kwargs.get("prefetch_size", 0)
+        if not prefetch_size:
+            return data_generator
+        return DataPrefetcher(data_generator,
+                              queue_size=prefetch_size,
+                              num_workers=kwargs.get("prefetch_workers", 1))
+
+    @staticmethod
+    def _hard_negative_sampler(**kwargs):
+        """Build the hard negative sampler of pairwise models.
+
+        `hard_neg_ratio` is the fraction of hard negatives in every batch,
+        0 disables it. `hard_neg_candidates` is the number of highest-scoring
+        items indexed for every user, and `hard_neg_seed` seeds the draws.
+        The model snapshots its vectors into the sampler at the start of
+        every epoch.
+        """
+        hard_ratio = kwargs.get("hard_neg_ratio", 0.0)
+        if not hard_ratio:
+            return None
+        return HardNegativeSampler(
+            hard_ratio,
+            kwargs.get("hard_neg_candidates", 8),
+            seed=kwargs.get("hard_neg_seed", 42)
+        )
+
+    @staticmethod
+    def _print_data_wait(data_generator):
+        if isinstance(data_generator, DataPrefetcher):
+            wait_str = (f"data waiting time: {data_generator.wait_time:.3f}s "
+                        f"({data_generator.wait_ratio:.1%} of epoch)")
+            print(f"\t {colorize(wait_str, 'blue')}")
+
+    def _sampled_softmax_loss(self):
+        """Softmax loss over the positive item and the shared negatives of
+        every row, see `libreco.utils.sampling.SharedNegativeSampling`.
+
+        The output of every (user, candidate) pair is reshaped to
+        `(batch_size, num_neg + 1)` with the positive item first, and the fed
+        logQ correction is subtracted from the logits, so popular items are
+        not over-penalized.
+        """
+        self.sample_log_q = tf.placeholder(tf.float32, shape=[None, None])
+        logits = tf.reshape(self.output, tf.shape(self.sample_log_q))
+        logits = logits - self.sample_log_q
+        return tf.reduce_mean(
+            tf.nn.sparse_softmax_cross_entropy_with_logits(
+                labels=tf.zeros(tf.shape(logits)[0], dtype=tf.int32),
+                logits=logits)
+        )
+
     def train_pure(self, data_generator, verbose, shuffle, eval_data, metrics,
                    **kwargs):
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             with time_block(f"Epoch {epoch}", verbose):
                 train_total_loss = []
@@ -325,6 +393,7 @@ class TfMixin(object):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
 
                 class_name = self.__class__.__name__.lower()
                 if class_name.startswith("svd"):
@@ -337,16 +406,19 @@ class TfMixin(object):
 
     def train_feat(self, data_generator, verbose, shuffle, eval_data, metrics,
                    **kwargs):
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
                       f"{self.sess.run(self.lr)}")
             with time_block(f"Epoch {epoch}", verbose):
                 train_total_loss = []
-                for u, i, label, si, dv in data_generator(
+                for u, i, label, si, dv, *shared in data_generator(
                         shuffle, self.batch_size
                 ):
                     feed_dict = self._get_feed_dict(u, i, si, dv, label, True)
+                    if shared:
+                        feed_dict.update(self._get_shared_feed_dict(*shared))
                     train_loss, _ = self.sess.run(
                         [self.loss, self.training_op], feed_dict)
                     train_total_loss.append(train_loss)
@@ -356,6 +428,7 @@ class TfMixin(object):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
                                    **kwargs)
                 print("="*30)
@@ -378,6 +451,19 @@ class TfMixin(object):
             feed_dict.update({self.labels: label})
         return feed_dict
 
+    def _get_shared_feed_dict(self, log_q, candidate_index,
+                              item_sparse_indices=None,
+                              item_dense_values=None):
+        """Feed of `SharedNegativeSampling` batches, where the item feeds
+        hold one row for every distinct candidate."""
+        feed_dict = {self.sample_log_q: log_q,
+                     self.candidate_index: candidate_index}
+        if self.sparse:
+            feed_dict.update({self.item_sparse_indices: item_sparse_indices})
+        if self.dense:
+            feed_dict.update({self.item_dense_values: item_dense_values})
+        return feed_dict
+
     def _get_seq_feed_dict(self, u_interacted_seq, u_interacted_len,
                            user_indices, item_indices, label, sparse_indices,
                            dense_values, is_training):
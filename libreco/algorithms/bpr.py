@@ -34,6 +34,11 @@ tf.disable_v2_behavior()
 class BPR(Base, TfMixin, EvalMixin):
     """
     BPR is only suitable for ranking task
+
+    In the cython version, every positive item is paired with `num_neg`
+    negative items, and `neg_agg` decides how to aggregate the pairs:
+    "sum" sums the gradients of all pairs, "max" only uses the
+    highest-scoring negative, similar to WARP.
     """
     user_variables = ["user_embed_var"]
     item_variables = ["item_embed_var", "item_bias_var"]
@@ -51,6 +56,9 @@ class BPR(Base, TfMixin, EvalMixin):
             batch_size=256,
             num_neg=1,
             use_tf=True,
+            item_gen_mode="random",
+            popular_power=1.0,
+            neg_agg="sum",
             seed=42
     ):
 
@@ -58,6 +66,8 @@ class BPR(Base, TfMixin, EvalMixin):
         EvalMixin.__init__(self, task, data_info)
         if use_tf:
             TfMixin.__init__(self)
+        else:
+            self.graph_built = False
 
         self.task = task
         self.data_info = data_info
@@ -70,6 +80,9 @@ class BPR(Base, TfMixin, EvalMixin):
         self.n_users = data_info.n_users
         self.n_items = data_info.n_items
         self.use_tf = use_tf
+        self.item_gen_mode = item_gen_mode
+        self.popular_power = popular_power
+        self.neg_agg = neg_agg
         self.seed = seed
         self.user_consumed = data_info.user_consumed
         self.user_embed = None
@@ -165,7 +178,8 @@ class BPR(Base, TfMixin, EvalMixin):
 
         if self.use_tf:
             self._fit_tf(train_data, verbose=verbose, shuffle=shuffle,
-                         eval_data=eval_data, metrics=metrics, **kwargs)
+                         num_threads=num_threads, eval_data=eval_data,
+                         metrics=metrics, **kwargs)
         else:
             self._fit_cython(train_data, verbose=verbose, shuffle=shuffle,
                              num_threads=num_threads, eval_data=eval_data,
@@ -205,7 +219,23 @@ class BPR(Base, TfMixin, EvalMixin):
             raise ValueError("optimizer must be one of these: "
                              "('sgd', 'momentum', 'adam')")
 
+        if self.item_gen_mode not in ["random", "popular"]:
+            raise ValueError(
+                "sampling item_gen_mode must either be 'random' or 'popular'"
+            )
+        hard_sampler = self._hard_negative_sampler(**kwargs)
+        neg_sampler = (
+            PairwiseSampling(train_data, self.data_info).popular_sampler(
+                self.popular_power)
+            if self.item_gen_mode == "popular"
+            else None
+        )
+
         for epoch in range(1, self.n_epochs + 1):
+            if hard_sampler is not None:
+                hard_sampler.update(self.user_embed, self.item_embed,
+                                    self.data_info.user_consumed,
+                                    self.n_items)
             with time_block(f"Epoch {epoch}", verbose):
                 trainer(optimizer=optimizer,
                         train_data=train_data,
@@ -218,7 +248,11 @@ class BPR(Base, TfMixin, EvalMixin):
                         shuffle=shuffle,
                         num_threads=num_threads,
                         seed=self.seed,
-                        epoch=epoch)
+                        epoch=epoch,
+                        neg_sampler=neg_sampler,
+                        num_neg=self.num_neg,
+                        neg_agg=self.neg_agg,
+                        hard_sampler=hard_sampler)
 
             if verbose > 1:
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
@@ -226,13 +260,24 @@ class BPR(Base, TfMixin, EvalMixin):
                 print("="*30)
         assign_oov_vector(self)
 
-    def _fit_tf(self, train_data, verbose=1, shuffle=True,
+    def _fit_tf(self, train_data, verbose=1, shuffle=True, num_threads=1,
                 eval_data=None, metrics=None, **kwargs):
+        hard_sampler = self._hard_negative_sampler(**kwargs)
         data_generator = PairwiseSampling(train_data,
                                           self.data_info,
-                                          self.num_neg)
+                                          self.num_neg,
+                                          self.item_gen_mode,
+                                          self.popular_power,
+                                          num_threads,
+                                          hard_sampler)
+        data_generator = self._prefetch(data_generator, **kwargs)
 
         for epoch in range(1, self.n_epochs + 1):
+            if hard_sampler is not None:
+                self._set_latent_factors()
+                hard_sampler.update(self.user_embed, self.item_embed,
+                                    self.data_info.user_consumed,
+                                    self.n_items)
             with time_block(f"Epoch {epoch}", verbose):
                 for user, item_pos, item_neg in data_generator(
                         shuffle=shuffle, batch_size=self.batch_size
@@ -243,6 +288,7 @@ class BPR(Base, TfMixin, EvalMixin):
                                              self.item_indices_neg: item_neg})
 
             if verbose > 1:
+                self._print_data_wait(data_generator)
                 # set up parameters for evaluation
                 self._set_latent_factors()
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
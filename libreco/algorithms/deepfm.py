@@ -193,10 +193,10 @@ class DeepFM(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             linear_sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, linear_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, 1)
+                self.multi_sparse_combiner)
             pairwise_sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, embed_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
+                self.multi_sparse_combiner)
         else:
             linear_sparse_embed = tf.nn.embedding_lookup(    # B * F1
                 linear_sparse_feat, self.sparse_indices)
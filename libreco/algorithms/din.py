@@ -197,7 +197,7 @@ class DIN(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             multi_sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, self.sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size
+                self.multi_sparse_combiner
             )
             self.concat_embed.append(tf.reshape(
                 multi_sparse_embed, [-1, self.true_sparse_field_size * self.embed_size])
@@ -390,6 +390,7 @@ class DIN(Base, TfMixin, EvalMixin):
                                          mode=self.interaction_mode,
                                          num=self.max_seq_len,
                                          padding_idx=0)
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
@@ -411,6 +412,7 @@ class DIN(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_last_interacted()
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
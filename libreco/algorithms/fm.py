@@ -26,7 +26,7 @@ from ..utils.tf_ops import (
     lr_decay_config,
     multi_sparse_combine_embedding
 )
-from ..utils.sampling import NegativeSampling
+from ..utils.sampling import NegativeSampling, SharedNegativeSampling
 from ..utils.misc import count_params
 from ..feature import (
     get_predict_indices_and_values,
@@ -61,6 +61,7 @@ class FM(Base, TfMixin, EvalMixin):
             use_bn=True,
             dropout_rate=None,
             batch_sampling=False,
+            neg_sampling=None,
             multi_sparse_combiner="sqrtn",
             seed=42,
             lower_upper_bound=None,
@@ -82,6 +83,7 @@ class FM(Base, TfMixin, EvalMixin):
         self.use_bn = use_bn
         self.dropout_rate = dropout_config(dropout_rate)
         self.batch_sampling = batch_sampling
+        self.neg_sampling = neg_sampling
         self.n_users = data_info.n_users
         self.n_items = data_info.n_items
         self.seed = seed
@@ -104,7 +106,12 @@ class FM(Base, TfMixin, EvalMixin):
         tf.set_random_seed(self.seed)
         self.labels = tf.placeholder(tf.float32, shape=[None])
         self.is_training = tf.placeholder_with_default(False, shape=[])
+        self.shared = self.task == "ranking" and bool(self.neg_sampling)
+        # with shared negatives, item fields of the candidates are embedded
+        # separately from the user fields of the batch rows
         self.linear_embed, self.pairwise_embed = [], []
+        self.item_linear_embed, self.item_pairwise_embed = [], []
+        self.user_field_mask = []
 
         self._build_user_item()
         if self.sparse:
@@ -112,6 +119,11 @@ class FM(Base, TfMixin, EvalMixin):
         if self.dense:
             self._build_dense()
 
+        if self.shared:
+            self._build_shared_output()
+            count_params()
+            return
+
         linear_embed = tf.concat(self.linear_embed, axis=1)
         pairwise_embed = tf.concat(self.pairwise_embed, axis=1)
 
@@ -125,17 +137,65 @@ class FM(Base, TfMixin, EvalMixin):
             tf.square(tf.reduce_sum(pairwise_embed, axis=1)),
             tf.reduce_sum(tf.square(pairwise_embed), axis=1)
         )
+        self.output = tf.squeeze(
+            tf.add(linear_term, self._pairwise_output(pairwise_term)))
+        count_params()
 
+    def _pairwise_output(self, pairwise_term):
     #    For original FM, just add K dim together:
     #    pairwise_term = 0.5 * tf.reduce_sum(pairwise_term, axis=1)
         if self.use_bn:
             pairwise_term = tf.layers.batch_normalization(
                 pairwise_term, training=self.is_training)
-        pairwise_term = tf.layers.dense(inputs=pairwise_term,
-                                        units=1,
-                                        activation=tf.nn.elu)
-        self.output = tf.squeeze(tf.add(linear_term, pairwise_term))
-        count_params()
+        return tf.layers.dense(inputs=pairwise_term,
+                               units=1,
+                               activation=tf.nn.elu)
+
+    def _build_shared_output(self):
+        # Both terms are split into a user part and an item part, so every
+        # candidate is embedded once and paired with the user rows through
+        # `candidate_index`. In predicting it defaults to one item per user.
+        # The pairwise term of a pair is
+        # 0.5 * ((S_u + S_i)^2 - Q_u - Q_i), where S and Q are the sums of
+        # field embeddings and of their squares on either side.
+        self.candidate_index = tf.placeholder_with_default(
+            tf.reshape(tf.range(tf.shape(self.user_indices)[0]), [-1, 1]),
+            shape=[None, None])
+        user_mask = tf.constant(self.user_field_mask, dtype=tf.float32)
+        item_mask = 1.0 - user_mask
+        linear_embed = tf.concat(self.linear_embed, axis=1) * user_mask
+        item_linear_embed = (
+            tf.concat(self.item_linear_embed, axis=1) * item_mask)
+        pairwise_embed = (
+            tf.concat(self.pairwise_embed, axis=1)
+            * tf.reshape(user_mask, [1, -1, 1]))
+        item_pairwise_embed = (
+            tf.concat(self.item_pairwise_embed, axis=1)
+            * tf.reshape(item_mask, [1, -1, 1]))
+
+        linear_layer = tf.layers.Dense(units=1, activation=None)
+        # B * 1 and C * 1, the bias is only added on the user side
+        user_linear = linear_layer(linear_embed)
+        item_linear = tf.matmul(item_linear_embed, linear_layer.kernel)
+        linear_term = (
+            user_linear + tf.squeeze(
+                tf.gather(item_linear, self.candidate_index), axis=2))
+
+        user_sum = tf.reduce_sum(pairwise_embed, axis=1)
+        user_square = tf.reduce_sum(tf.square(pairwise_embed), axis=1)
+        item_sum = tf.reduce_sum(item_pairwise_embed, axis=1)
+        item_square = tf.reduce_sum(tf.square(item_pairwise_embed), axis=1)
+        # B * (num_neg + 1) * K
+        pairwise_term = 0.5 * (
+            tf.square(tf.expand_dims(user_sum, axis=1)
+                      + tf.gather(item_sum, self.candidate_index))
+            - tf.expand_dims(user_square, axis=1)
+            - tf.gather(item_square, self.candidate_index)
+        )
+        pairwise_term = self._pairwise_output(
+            tf.reshape(pairwise_term, [-1, self.embed_size]))
+        self.output = tf.reshape(
+            tf.reshape(linear_term, [-1, 1]) + pairwise_term, [-1])
 
     def _build_user_item(self):
         self.user_indices = tf.placeholder(tf.int32, shape=[None])
@@ -167,8 +227,6 @@ class FM(Base, TfMixin, EvalMixin):
                                                    self.user_indices)
         linear_item_embed = tf.nn.embedding_lookup(linear_item_feat,
                                                    self.item_indices)
-        self.linear_embed.extend([linear_user_embed, linear_item_embed])
-
         pairwise_user_embed = tf.expand_dims(
             tf.nn.embedding_lookup(pairwise_user_feat, self.user_indices),
             axis=1)
@@ -176,7 +234,22 @@ class FM(Base, TfMixin, EvalMixin):
             tf.nn.embedding_lookup(pairwise_item_feat, self.item_indices),
             axis=1
         )
-        self.pairwise_embed.extend([pairwise_user_embed, pairwise_item_embed])
+        if self.shared:
+            # user rows and candidates differ in number, so the missing
+            # side is zero and masked out anyway
+            self.linear_embed.extend(
+                [linear_user_embed, tf.zeros_like(linear_user_embed)])
+            self.pairwise_embed.extend(
+                [pairwise_user_embed, tf.zeros_like(pairwise_user_embed)])
+            self.item_linear_embed.extend(
+                [tf.zeros_like(linear_item_embed), linear_item_embed])
+            self.item_pairwise_embed.extend(
+                [tf.zeros_like(pairwise_item_embed), pairwise_item_embed])
+            self.user_field_mask.extend([1.0, 0.0])
+        else:
+            self.linear_embed.extend([linear_user_embed, linear_item_embed])
+            self.pairwise_embed.extend(
+                [pairwise_user_embed, pairwise_item_embed])
 
     def _build_sparse(self):
         self.sparse_indices = tf.placeholder(
@@ -193,29 +266,43 @@ class FM(Base, TfMixin, EvalMixin):
             initializer=tf_truncated_normal(0.0, 0.03),
             regularizer=self.reg)
 
-        if (self.data_info.multi_sparse_combine_info
-                and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
-            linear_sparse_embed = multi_sparse_combine_embedding(
-                self.data_info, linear_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, 1)
-            pairwise_sparse_embed = multi_sparse_combine_embedding(
-                self.data_info, pairwise_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
-        else:
-            linear_sparse_embed = tf.nn.embedding_lookup(    # B * F1
-                linear_sparse_feat, self.sparse_indices)
-            pairwise_sparse_embed = tf.nn.embedding_lookup(  # B * F1 * K
-                pairwise_sparse_feat, self.sparse_indices)
-
-        self.linear_embed.append(linear_sparse_embed)
-        self.pairwise_embed.append(pairwise_sparse_embed)
+        combined = (self.data_info.multi_sparse_combine_info
+                    and self.multi_sparse_combiner in ("sum", "mean", "sqrtn"))
+
+        def lookup(variables, sparse_indices):
+            if combined:
+                return multi_sparse_combine_embedding(
+                    self.data_info, variables, sparse_indices,
+                    self.multi_sparse_combiner)
+            return tf.nn.embedding_lookup(variables, sparse_indices)
+
+        # B * F1 and B * F1 * K
+        self.linear_embed.append(
+            lookup(linear_sparse_feat, self.sparse_indices))
+        self.pairwise_embed.append(
+            lookup(pairwise_sparse_feat, self.sparse_indices))
+
+        if self.shared:
+            self.item_sparse_indices = tf.placeholder_with_default(
+                self.sparse_indices, shape=[None, self.sparse_field_size])
+            self.item_linear_embed.append(
+                lookup(linear_sparse_feat, self.item_sparse_indices))
+            self.item_pairwise_embed.append(
+                lookup(pairwise_sparse_feat, self.item_sparse_indices))
+            # combined multi_sparse fields follow the normal sparse columns
+            if combined:
+                combine_info = self.data_info.multi_sparse_combine_info
+                field_cols = (list(range(combine_info.field_offset[0]))
+                              + list(combine_info.field_offset))
+            else:
+                field_cols = range(self.sparse_field_size)
+            user_cols = set(self.data_info.user_sparse_col.index)
+            self.user_field_mask.extend(
+                [float(col in user_cols) for col in field_cols])
 
     def _build_dense(self):
         self.dense_values = tf.placeholder(
             tf.float32, shape=[None, self.dense_field_size])
-        dense_values_reshape = tf.reshape(
-            self.dense_values, [-1, self.dense_field_size, 1])
-        batch_size = tf.shape(self.dense_values)[0]
 
         linear_dense_feat = tf.get_variable(
             name="linear_dense_feat",
@@ -228,27 +315,48 @@ class FM(Base, TfMixin, EvalMixin):
             initializer=tf_truncated_normal(0.0, 0.03),
             regularizer=self.reg)
 
-        # B * F2
-        linear_dense_embed = tf.tile(linear_dense_feat, [batch_size])
-        linear_dense_embed = tf.reshape(
-            linear_dense_embed, [-1, self.dense_field_size])
-        linear_dense_embed = tf.multiply(
-            linear_dense_embed, self.dense_values)
-
-        pairwise_dense_embed = tf.expand_dims(pairwise_dense_feat, axis=0)
-        # B * F2 * K
-        pairwise_dense_embed = tf.tile(
-            pairwise_dense_embed, [batch_size, 1, 1])
-        pairwise_dense_embed = tf.multiply(
-            pairwise_dense_embed, dense_values_reshape)
-
+        def embed(dense_values):
+            dense_values_reshape = tf.reshape(
+                dense_values, [-1, self.dense_field_size, 1])
+            batch_size = tf.shape(dense_values)[0]
+
+            # B * F2
+            linear_dense_embed = tf.tile(linear_dense_feat, [batch_size])
+            linear_dense_embed = tf.reshape(
+                linear_dense_embed, [-1, self.dense_field_size])
+            linear_dense_embed = tf.multiply(
+                linear_dense_embed, dense_values)
+
+            pairwise_dense_embed = tf.expand_dims(pairwise_dense_feat, axis=0)
+            # B * F2 * K
+            pairwise_dense_embed = tf.tile(
+                pairwise_dense_embed, [batch_size, 1, 1])
+            pairwise_dense_embed = tf.multiply(
+                pairwise_dense_embed, dense_values_reshape)
+            return linear_dense_embed, pairwise_dense_embed
+
+        linear_dense_embed, pairwise_dense_embed = embed(self.dense_values)
         self.linear_embed.append(linear_dense_embed)
         self.pairwise_embed.append(pairwise_dense_embed)
 
+        if self.shared:
+            self.item_dense_values = tf.placeholder_with_default(
+                self.dense_values, shape=[None, self.dense_field_size])
+            linear_dense_embed, pairwise_dense_embed = embed(
+                self.item_dense_values)
+            self.item_linear_embed.append(linear_dense_embed)
+            self.item_pairwise_embed.append(pairwise_dense_embed)
+            user_cols = set(self.data_info.user_dense_col.index)
+            self.user_field_mask.extend(
+                [float(col in user_cols)
+                 for col in range(self.dense_field_size)])
+
     def _build_train_ops(self, **kwargs):
         if self.task == "rating":
             self.loss = tf.losses.mean_squared_error(labels=self.labels,
                                                      predictions=self.output)
+        elif self.task == "ranking" and self.neg_sampling:
+            self.loss = self._sampled_softmax_loss()
         elif self.task == "ranking":
             self.loss = tf.reduce_mean(
                 tf.nn.sigmoid_cross_entropy_with_logits(labels=self.labels,
@@ -281,7 +389,16 @@ class FM(Base, TfMixin, EvalMixin):
             self._build_model()
             self._build_train_ops(**kwargs)
 
-        if self.task == "ranking" and self.batch_sampling:
+        if self.task == "ranking" and self.neg_sampling:
+            self._check_has_sampled(train_data, verbose)
+            data_generator = SharedNegativeSampling(train_data,
+                                                    self.data_info,
+                                                    self.num_neg,
+                                                    mode=self.neg_sampling,
+                                                    seed=self.seed,
+                                                    sparse=self.sparse,
+                                                    dense=self.dense)
+        elif self.task == "ranking" and self.batch_sampling:
             self._check_has_sampled(train_data, verbose)
             data_generator = NegativeSampling(train_data,
                                               self.data_info,
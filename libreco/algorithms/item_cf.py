@@ -48,7 +48,7 @@ class ItemCF(Base, EvalMixin):
 
     def fit(self, train_data, block_size=None, num_threads=1, min_common=1,
             mode="invert", verbose=1, eval_data=None, metrics=None,
-            store_top_k=True):
+            store_top_k=True, top_k_only=False):
         self.show_start_time()
         self.user_interaction = train_data.sparse_interaction
         self.item_interaction = self.user_interaction.T.tocsr()
@@ -65,9 +65,12 @@ class ItemCF(Base, EvalMixin):
                     "sim_type must be one of ('cosine', 'pearson', 'jaccard')"
                 )
 
+            # with top_k_only, only the k nearest neighbors of each item are
+            # kept, so prediction only considers those neighbors as well
             self.sim_matrix = sim_func(
                 self.item_interaction, self.user_interaction, self.n_items,
-                self.n_users, block_size, num_threads, min_common, mode
+                self.n_users, block_size, num_threads, min_common, mode,
+                top_k=self.k if top_k_only else None
             )
 
         assert self.sim_matrix.has_sorted_indices
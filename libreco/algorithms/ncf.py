@@ -154,7 +154,6 @@ class NCF(Base, TfMixin, EvalMixin):
             data_generator = NegativeSampling(train_data,
                                               self.data_info,
                                               self.num_neg,
-                                              self.batch_size,
                                               batch_sampling=True)
 
         else:
@@ -272,11 +272,14 @@ class RNN4Rec(Base, TfMixin, EvalMixin):
             self._build_train_ops(**kwargs)
 
         if self.task == "rating" or self.loss_type == "cross_entropy":
-            self._fit(train_data, verbose, shuffle, eval_data, metrics)
+            self._fit(train_data, verbose, shuffle, eval_data, metrics,
+                      **kwargs)
         elif self.loss_type == "bpr":
-            self._fit_bpr(train_data, verbose, shuffle, eval_data, metrics)
+            self._fit_bpr(train_data, verbose, shuffle, eval_data, metrics,
+                          **kwargs)
 
-    def _fit(self, train_data, verbose, shuffle, eval_data, metrics):
+    def _fit(self, train_data, verbose, shuffle, eval_data, metrics,
+             **kwargs):
         data_generator = DataGenSequence(
             data=train_data,
             data_info=self.data_info,
@@ -287,6 +290,7 @@ class RNN4Rec(Base, TfMixin, EvalMixin):
             padding_idx=self.n_items
         )
 
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
@@ -311,6 +315,7 @@ class RNN4Rec(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_latent_factors()
                 self.print_metrics(eval_data=eval_data, metrics=metrics)
@@ -320,19 +325,28 @@ class RNN4Rec(Base, TfMixin, EvalMixin):
         self._set_latent_factors()
         assign_oov_vector(self)
 
-    def _fit_bpr(self, train_data, verbose, shuffle, eval_data, metrics):
+    def _fit_bpr(self, train_data, verbose, shuffle, eval_data, metrics,
+                 **kwargs):
+        hard_sampler = self._hard_negative_sampler(**kwargs)
         data_generator = PairwiseSamplingSeq(
             dataset=train_data,
             data_info=self.data_info,
             num_neg=self.num_neg,
             mode=self.interaction_mode,
-            num=self.max_seq_len
+            num=self.max_seq_len,
+            hard_sampler=hard_sampler
         )
 
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
                       f"{self.sess.run(self.lr)}")
+            if hard_sampler is not None:
+                self._set_latent_factors()
+                hard_sampler.update(self.user_vector, self.item_vector,
+                                    self.data_info.user_consumed,
+                                    self.n_items)
 
             with time_block(f"Epoch {epoch}", verbose):
                 train_total_loss = []
@@ -354,6 +368,7 @@ class RNN4Rec(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_latent_factors()
                 self.print_metrics(eval_data=eval_data, metrics=metrics)
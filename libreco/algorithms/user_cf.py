@@ -48,7 +48,7 @@ class UserCF(Base, EvalMixin):
 
     def fit(self, train_data, block_size=None, num_threads=1, min_common=1,
             mode="invert", verbose=1, eval_data=None, metrics=None,
-            store_top_k=True):
+            store_top_k=True, top_k_only=False):
         self.show_start_time()
         self.user_interaction = train_data.sparse_interaction
         self.item_interaction = self.user_interaction.T.tocsr()
@@ -64,9 +64,12 @@ class UserCF(Base, EvalMixin):
                 raise ValueError("sim_type must be one of "
                                  "('cosine', 'pearson', 'jaccard')")
 
+            # with top_k_only, only the k nearest neighbors of each user are
+            # kept, so prediction only considers those neighbors as well
             self.sim_matrix = sim_func(
                 self.user_interaction, self.item_interaction, self.n_users,
-                self.n_items, block_size, num_threads, min_common, mode)
+                self.n_items, block_size, num_threads, min_common, mode,
+                top_k=self.k if top_k_only else None)
 
         assert self.sim_matrix.has_sorted_indices
         if issparse(self.sim_matrix):
@@ -238,6 +238,7 @@ class WaveNet(Base, TfMixin, EvalMixin):
             padding_idx=self.n_items
         )
 
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
@@ -262,6 +263,7 @@ class WaveNet(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_latent_factors()
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
@@ -189,10 +189,10 @@ class WideDeep(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             wide_sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, wide_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, 1)
+                self.multi_sparse_combiner)
             deep_sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, deep_sparse_feat, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
+                self.multi_sparse_combiner)
         else:
             wide_sparse_embed = tf.nn.embedding_lookup(
                 wide_sparse_feat, self.sparse_indices)
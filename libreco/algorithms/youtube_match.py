@@ -165,7 +165,7 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, sparse_features, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
+                self.multi_sparse_combiner)
         else:
             sparse_embed = tf.nn.embedding_lookup(
                 sparse_features, self.sparse_indices)
@@ -275,6 +275,7 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
             mode=self.interaction_mode, num=self.interaction_num,
             class_name="YoutubeMatch", padding_idx=self.n_items
         )
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             with time_block(f"Epoch {epoch}", verbose):
                 train_total_loss = []
@@ -298,6 +299,7 @@ class YouTubeMatch(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_latent_vectors()
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
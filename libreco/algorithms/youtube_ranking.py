@@ -172,7 +172,7 @@ class YouTubeRanking(Base, TfMixin, EvalMixin):
                 and self.multi_sparse_combiner in ("sum", "mean", "sqrtn")):
             sparse_embed = multi_sparse_combine_embedding(
                 self.data_info, sparse_features, self.sparse_indices,
-                self.multi_sparse_combiner, self.embed_size)
+                self.multi_sparse_combiner)
         else:
             sparse_embed = tf.nn.embedding_lookup(
                 sparse_features, self.sparse_indices)
@@ -241,6 +241,7 @@ class YouTubeRanking(Base, TfMixin, EvalMixin):
                                          mode=self.interaction_mode,
                                          num=self.interaction_num,
                                          padding_idx=self.n_items)
+        data_generator = self._prefetch(data_generator, **kwargs)
         for epoch in range(1, self.n_epochs + 1):
             if self.lr_decay:
                 print(f"With lr_decay, epoch {epoch} learning rate: "
@@ -261,6 +262,7 @@ class YouTubeRanking(Base, TfMixin, EvalMixin):
                     round(float(np.mean(train_total_loss)), 4)
                 )
                 print(f"\t {colorize(train_loss_str, 'green')}")
+                self._print_data_wait(data_generator)
                 # for evaluation
                 self._set_last_interacted()
                 self.print_metrics(eval_data=eval_data, metrics=metrics,
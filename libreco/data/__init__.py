@@ -1,6 +1,6 @@
 from .dataset import DatasetPure, DatasetFeat
-from .data_info import DataInfo, MultiSparseInfo
-from .processing import process_data, split_multi_value
+from .data_info import DataInfo, Interactions, MultiSparseInfo
+from .processing import DenseScaler, process_data, split_multi_value
 from .split import (
     split_by_num,
     split_by_ratio,
@@ -1,6 +1,11 @@
-import numpy as np
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import tqdm
 from .sequence import sparse_user_interacted, user_interacted_seq
+from ..utils.misc import batch_rows, shuffle_order
 
 
 class DataGenPure(object):
@@ -9,24 +14,30 @@ class DataGenPure(object):
         self.user_indices = data.user_indices
         self.item_indices = data.item_indices
         self.labels = data.labels
+        self.block_size = None
+        self.order = None
 
     def __iter__(self, batch_size):
         for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            yield (
-                self.user_indices[batch_slice],
-                self.item_indices[batch_slice],
-                self.labels[batch_slice],
-                None,
-                None
-            )
+            yield self.get_batch(slice(i, i + batch_size))
+
+    def get_batch(self, batch_slice):
+        rows = batch_rows(self.order, batch_slice)
+        return (
+            self.user_indices[rows],
+            self.item_indices[rows],
+            self.labels[rows],
+            None,
+            None
+        )
 
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
+        # data arrays are never rewritten, since they may be memory-mapped
+        self.order = (
+            shuffle_order(self.data_size, self.block_size)
+            if shuffle
+            else None
+        )
         return self.__iter__(batch_size)
 
 
@@ -41,38 +52,38 @@ class DataGenFeat(object):
         self.dense = dense
         self.data_size = len(data)
         self.class_name = class_name
+        self.block_size = None
+        self.order = None
 
     def __iter__(self, batch_size):
         for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            pure_part = (
-                self.user_indices[batch_slice],
-                self.item_indices[batch_slice],
-                self.labels[batch_slice]
-            )
-            sparse_part = (
-                (self.sparse_indices[batch_slice],)
-                if self.sparse
-                else (None,)
-            )
-            dense_part = (
-                (self.dense_values[batch_slice],)
-                if self.dense
-                else (None,)
-            )
-            yield pure_part + sparse_part + dense_part
+            yield self.get_batch(slice(i, i + batch_size))
 
-    def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            if self.sparse:
-                self.sparse_indices = self.sparse_indices[mask]
-            if self.dense:
-                self.dense_values = self.dense_values[mask]
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
+    def get_batch(self, batch_slice):
+        rows = batch_rows(self.order, batch_slice)
+        pure_part = (
+            self.user_indices[rows],
+            self.item_indices[rows],
+            self.labels[rows]
+        )
+        sparse_part = (
+            (self.sparse_indices[rows],)
+            if self.sparse
+            else (None,)
+        )
+        dense_part = (
+            (self.dense_values[rows],)
+            if self.dense
+            else (None,)
+        )
+        return pure_part + sparse_part + dense_part
 
+    def __call__(self, shuffle=True, batch_size=None):
+        self.order = (
+            shuffle_order(self.data_size, self.block_size)
+            if shuffle
+            else None
+        )
         return self.__iter__(batch_size)
 
 
@@ -94,81 +105,200 @@ class DataGenSequence(object):
             self.labels = data.labels
             self.sparse_indices = data.sparse_indices
             self.dense_values = data.dense_values
-            self.user_consumed_set = {
-                u: set(items) for u, items in self.user_consumed.items()
-            }
+            self.positions = data.interaction_positions(self.user_consumed)
         self.data_size = len(self.user_indices)
         self.sparse = sparse
         self.dense = dense
         self.mode = mode
         self.num = num
+        self.block_size = None
+        self.order = None
 
     def __iter__(self, batch_size):
         for i in tqdm.trange(0, self.data_size, batch_size, desc="train"):
-            batch_slice = slice(i, i + batch_size)
-            if self.class_name == "YoutubeMatch":
-                (
-                    interacted_indices,
-                    interacted_values,
-                    modified_batch_size
-                ) = sparse_user_interacted(
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.user_consumed,
-                    self.mode,
-                    self.num
-                )
-                pure_part = (
-                    modified_batch_size,
-                    interacted_indices,
-                    interacted_values,
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.labels[batch_slice]
-                )
-            else:
-                (
-                    batch_interacted,
-                    batch_interacted_len
-                ) = user_interacted_seq(
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.user_consumed,
-                    self.padding_idx,
-                    self.mode,
-                    self.num,
-                    self.user_consumed_set
-                )
-                pure_part = (
-                    batch_interacted,
-                    batch_interacted_len,
-                    self.user_indices[batch_slice],
-                    self.item_indices[batch_slice],
-                    self.labels[batch_slice]
-                )
-
-            sparse_part = (
-                (self.sparse_indices[batch_slice],)
-                if self.sparse
-                else (None,)
+            yield self.get_batch(slice(i, i + batch_size))
+
+    def get_batch(self, batch_slice):
+        rows = batch_rows(self.order, batch_slice)
+        batch_user_indices = self.user_indices[rows]
+        batch_item_indices = self.item_indices[rows]
+        if self.class_name == "YoutubeMatch":
+            (
+                interacted_indices,
+                interacted_values,
+                modified_batch_size
+            ) = sparse_user_interacted(
+                batch_user_indices,
+                batch_item_indices,
+                self.user_consumed,
+                self.mode,
+                self.num
+            )
+            pure_part = (
+                modified_batch_size,
+                interacted_indices,
+                interacted_values,
+                batch_user_indices,
+                batch_item_indices,
+                self.labels[rows]
+            )
+        else:
+            (
+                batch_interacted,
+                batch_interacted_len
+            ) = user_interacted_seq(
+                batch_user_indices,
+                batch_item_indices,
+                self.user_consumed,
+                self.padding_idx,
+                self.mode,
+                self.num,
+                self.positions[rows]
             )
-            dense_part = (
-                (self.dense_values[batch_slice],)
-                if self.dense
-                else (None,)
+            pure_part = (
+                batch_interacted,
+                batch_interacted_len,
+                batch_user_indices,
+                batch_item_indices,
+                self.labels[rows]
             )
-            yield pure_part + sparse_part + dense_part
 
-    def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            if self.sparse:
-                self.sparse_indices = self.sparse_indices[mask]
-            if self.dense:
-                self.dense_values = self.dense_values[mask]
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-            self.labels = self.labels[mask]
+        sparse_part = (
+            (self.sparse_indices[rows],)
+            if self.sparse
+            else (None,)
+        )
+        dense_part = (
+            (self.dense_values[rows],)
+            if self.dense
+            else (None,)
+        )
+        return pure_part + sparse_part + dense_part
 
+    def __call__(self, shuffle=True, batch_size=None):
+        self.order = (
+            shuffle_order(self.data_size, self.block_size)
+            if shuffle
+            else None
+        )
         return self.__iter__(batch_size)
 
+
+class DataPrefetcher(object):
+    """Build training batches in background threads.
+
+    Wraps any data generator in this module or `libreco.utils.sampling`,
+    i.e. an object called as `data_generator(shuffle, batch_size)`, so that
+    batch slicing, negative sampling and sequence building overlap with the
+    training step. Batches are always yielded in the original order.
+
+    Parameters
+    ----------
+    data_generator : object
+        The wrapped data generator.
+    queue_size : int, optional
+        Maximum number of batches built ahead of the consumer.
+    num_workers : int, optional
+        Number of threads building batches. More than one worker requires
+        the generator to provide `get_batch(batch_slice)`, otherwise a single
+        background thread consumes the generator.
+    """
+
+    def __init__(self, data_generator, queue_size=4, num_workers=1):
+        self.data_generator = data_generator
+        self.queue_size = max(1, queue_size)
+        self.num_workers = max(1, num_workers)
+        self.wait_time = 0.0
+        self.epoch_time = 0.0
+
+    @property
+    def wait_ratio(self):
+        """Fraction of the last epoch spent waiting for data."""
+        return self.wait_time / self.epoch_time if self.epoch_time > 0 else 0.0
+
+    def __call__(self, shuffle=True, batch_size=None):
+        self.wait_time = 0.0
+        self.epoch_time = 0.0
+        # shuffling happens here, in the caller's thread
+        batches = self.data_generator(shuffle, batch_size)
+        if self.num_workers > 1 and hasattr(self.data_generator, "get_batch"):
+            return self._iter_workers(batch_size)
+        return self._iter_thread(batches)
+
+    def _iter_thread(self, batches):
+        buffer = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for batch in batches:
+                    if not _put_until_stopped(buffer, (True, batch), stop):
+                        return
+                _put_until_stopped(buffer, (True, _END), stop)
+            except Exception as e:
+                _put_until_stopped(buffer, (False, e), stop)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        start = time.perf_counter()
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                ok, batch = buffer.get()
+                self.wait_time += time.perf_counter() - wait_start
+                if not ok:
+                    raise batch
+                if batch is _END:
+                    break
+                yield batch
+        finally:
+            stop.set()
+            self.epoch_time = time.perf_counter() - start
+
+    def _iter_workers(self, batch_size):
+        data_size = self.data_generator.data_size
+        batch_slices = iter([
+            slice(i, i + batch_size) for i in range(0, data_size, batch_size)
+        ])
+        executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        pending = deque()
+        for batch_slice in batch_slices:
+            pending.append(
+                executor.submit(self.data_generator.get_batch, batch_slice))
+            if len(pending) >= self.queue_size:
+                break
+
+        start = time.perf_counter()
+        progress = tqdm.tqdm(total=len(range(0, data_size, batch_size)),
+                             desc="train")
+        try:
+            while pending:
+                wait_start = time.perf_counter()
+                batch = pending.popleft().result()
+                self.wait_time += time.perf_counter() - wait_start
+                batch_slice = next(batch_slices, None)
+                if batch_slice is not None:
+                    pending.append(executor.submit(
+                        self.data_generator.get_batch, batch_slice))
+                progress.update(1)
+                yield batch
+        finally:
+            progress.close()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+            self.epoch_time = time.perf_counter() - start
+
+
+_END = object()
+
+
+def _put_until_stopped(buffer, item, stop):
+    # avoid blocking forever if the consumer has quit early
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -4,9 +4,16 @@ import json
 import os
 import numpy as np
 import pandas as pd
+from .processing import DenseScaler
+from .streaming import interaction_frame
 from ..feature import (
+    ConsumedCSR,
     interaction_consumed,
+    unordered_sparse_indices,
+    compact_sparse_indices,
+    compact_dense_values,
     compute_sparse_feat_indices,
+    HashBuckets,
     _check_oov,
 )
 
@@ -17,6 +24,13 @@ Empty_Feature = Feature(name=[], index=[])
 MultiSparseInfo = namedtuple("MultiSparseInfo",
                              ["field_offset", "field_len", "feat_oov"])
 
+# encoded training interactions, raw ids only live in the unique values
+Interactions = namedtuple("Interactions",
+                          ["user_indices", "item_indices", "labels"])
+
+# version of the directory format written by `DataInfo.save(mmap=True)`
+DATA_INFO_VERSION = 2
+
 
 class DataInfo(object):
     def __init__(
@@ -36,27 +50,45 @@ class DataInfo(object):
             sparse_oov=None,
             multi_sparse_unique_vals=None,
             multi_sparse_combine_info=None,
+            compact=False,
+            dense_scaler=None,
     ):
+        self._init_cache()
         self.col_name_mapping = col_name_mapping
-        self.interaction_data = interaction_data
         self.user_sparse_unique = user_sparse_unique
         self.user_dense_unique = user_dense_unique
         self.item_sparse_unique = item_sparse_unique
         self.item_dense_unique = item_dense_unique
         self.user_consumed, self.item_consumed = interaction_consumed(
-            user_indices, item_indices
+            user_indices,
+            item_indices,
+            None if user_unique_vals is None else len(user_unique_vals),
+            None if item_unique_vals is None else len(item_unique_vals)
         )
         self.user_unique_vals = user_unique_vals
         self.item_unique_vals = item_unique_vals
+        self.interactions = None
+        if interaction_data is not None:
+            self.set_interactions(interaction_data)
         self.sparse_unique_vals = sparse_unique_vals
-        self.sparse_unique_idxs = DataInfo.map_unique_vals(
-            sparse_unique_vals)
         self.sparse_offset = sparse_offset
         self.sparse_oov = sparse_oov
         self.multi_sparse_unique_vals = multi_sparse_unique_vals
-        self.multi_sparse_unique_idxs = DataInfo.map_unique_vals(
-            multi_sparse_unique_vals)
         self.multi_sparse_combine_info = multi_sparse_combine_info
+        self.compact = bool(compact)
+        self.dense_scaler = dense_scaler
+        self.all_args = locals()
+        if self.compact:
+            self.compact_features()
+            # don't keep the original wide matrices alive
+            for name in ("user_sparse_unique", "user_dense_unique",
+                         "item_sparse_unique", "item_dense_unique"):
+                self.all_args[name] = getattr(self, name)
+        self.add_oov()
+        if self.popular_items is None:
+            self.set_popular_items(100)
+
+    def _init_cache(self):
         self._n_users = None
         self._n_items = None
         self._user2id = None
@@ -64,15 +96,17 @@ class DataInfo(object):
         self._id2user = None
         self._id2item = None
         self._data_size = None
+        self._label_stats = None
+        self._sparse_unique_idxs = None
+        self._multi_sparse_unique_idxs = None
+        self._sort_perms = dict()
         self.popular_items = None
+        self._item_user_counts = None
+        self._unique_buffers = dict()
         # store old sparse len and oov
         self.old_sparse_len = None
         self.old_sparse_oov = None
         self.old_sparse_offset = None
-        self.all_args = locals()
-        self.add_oov()
-        if self.popular_items is None:
-            self.set_popular_items(100)
 
     @staticmethod
     def map_unique_vals(sparse_unique_vals):
@@ -81,20 +115,100 @@ class DataInfo(object):
         res = dict()
         for col in sparse_unique_vals:
             vals = sparse_unique_vals[col]
+            if isinstance(vals, HashBuckets):
+                # hashed columns are encoded without a dict
+                continue
             size = len(vals)
             res[col] = dict(zip(vals, range(size)))
         return res
 
+    def sort_perm(self, key, unique_vals):
+        """Cached stable argsort of a vocabulary, used to look up values
+        with `searchsorted`.
+
+        Vocabularies only grow by appending in revolution, so the cache is
+        recomputed whenever the length of `unique_vals` changes.
+        """
+        perm = self._sort_perms.get(key)
+        if perm is None or len(perm) != len(unique_vals):
+            perm = np.argsort(unique_vals, kind="mergesort")
+            self._sort_perms[key] = perm
+        return perm
+
+    @property
+    def sparse_unique_idxs(self):
+        if self._sparse_unique_idxs is None:
+            self._sparse_unique_idxs = DataInfo.map_unique_vals(
+                self.sparse_unique_vals)
+        return self._sparse_unique_idxs
+
+    @property
+    def multi_sparse_unique_idxs(self):
+        if self._multi_sparse_unique_idxs is None:
+            self._multi_sparse_unique_idxs = DataInfo.map_unique_vals(
+                self.multi_sparse_unique_vals)
+        return self._multi_sparse_unique_idxs
+
+    def set_interactions(self, interactions):
+        """Store training interactions as encoded columns.
+
+        Parameters
+        ----------
+        interactions : `Interactions` or `pandas.DataFrame`
+            Encoded user/item indices and labels, or a DataFrame with raw
+            `user`, `item`, `label` columns, which are encoded with the
+            current unique values.
+        """
+        if isinstance(interactions, pd.DataFrame):
+            user_indices, _ = unordered_sparse_indices(
+                interactions["user"].to_numpy(), self.user_unique_vals)
+            item_indices, _ = unordered_sparse_indices(
+                interactions["item"].to_numpy(), self.item_unique_vals)
+            labels = interactions["label"].to_numpy()
+        else:
+            user_indices, item_indices, labels = interactions
+        self.interactions = Interactions(
+            np.asarray(user_indices, dtype=np.int32),
+            np.asarray(item_indices, dtype=np.int32),
+            np.asarray(labels, dtype=np.float32)
+        )
+        self._label_stats = None
+        self._data_size = None
+
+    @property
+    def interaction_data(self):
+        """Training interactions as a DataFrame of raw ids."""
+        if self.interactions is None:
+            return None
+        return interaction_frame(*self.interactions,
+                                 self.user_unique_vals,
+                                 self.item_unique_vals)
+
+    @interaction_data.setter
+    def interaction_data(self, data):
+        self.set_interactions(data)
+
+    @property
+    def label_stats(self):
+        """Cached mean, min and max of the training labels."""
+        if self._label_stats is None:
+            labels = self.interactions.labels
+            if len(labels) > 0:
+                # accumulate in float64 to keep the mean precise
+                self._label_stats = (float(np.mean(labels, dtype=np.float64)),
+                                     float(np.min(labels)),
+                                     float(np.max(labels)))
+            else:
+                self._label_stats = (np.nan, np.nan, np.nan)
+        return self._label_stats
+
     @property
     def global_mean(self):
-        return self.interaction_data.label.mean()
+        return self.label_stats[0]
 
     @property
     def min_max_rating(self):
-        return (
-            self.interaction_data.label.min(),
-            self.interaction_data.label.max()
-        )
+        return self.label_stats[1:]
 
     @property
     def sparse_col(self):
@@ -209,38 +323,58 @@ class DataInfo(object):
     @property
     def data_size(self):
         if self._data_size is None:
-            self._data_size = len(self.interaction_data)
+            self._data_size = len(self.interactions.labels)
         return self._data_size
 
     def __repr__(self):
         n_users = self.n_users
         n_items = self.n_items
-        n_labels = len(self.interaction_data)
+        n_labels = self.data_size
         return "n_users: %d, n_items: %d, data sparsity: %.4f %%" % (
             n_users, n_items, 100 * n_labels / (n_users*n_items)
         )
 
     def get_indexed_interaction(self):
-        data = self.interaction_data.copy()
-        data.user = data.user.map(self.user2id)
-        data.item = data.item.map(self.item2id)
-        if data.user.isnull().any():
-            data["user"].fillna(self.n_users, inplace=True)
-            data["user"] = data["user"].astype("int")
-        if data.item.isnull().any():
-            data["item"].fillna(self.n_items, inplace=True)
-            data["item"] = data["item"].astype("int")
-        return data
+        return pd.DataFrame({
+            "user": self.interactions.user_indices,
+            "item": self.interactions.item_indices,
+            "label": self.interactions.labels
+        })
 
     def update_consumed(self, user_indices, item_indices, merge):
+        """Update consumed items and item counts with new interactions.
+
+        When merging, new pairs are appended to the existing consumed csr,
+        whose sorted order is merged instead of recomputed, so apart from a
+        linear copy the cost only depends on the size of new data. Item
+        counts only consider the new data, same as the popular items.
+        """
+        user_indices = np.asarray(user_indices)
+        item_indices = np.asarray(item_indices)
         if merge:
-            old_data = self.get_indexed_interaction()
-            user_indices = np.append(old_data.user.to_numpy(), user_indices)
-            item_indices = np.append(old_data.item.to_numpy(), item_indices)
-        self.user_consumed, self.item_consumed = interaction_consumed(
-            user_indices, item_indices)
+            # distinct user-item pairs of the new data
+            keys = user_indices.astype(np.int64) * self.n_items + item_indices
+            _, first_index = np.unique(keys, return_index=True)
+            self._item_user_counts = np.bincount(
+                item_indices[first_index], minlength=self.n_items)
+            self.user_consumed = self.user_consumed.append(
+                user_indices, item_indices, self.n_users, self.n_items)
+            self.item_consumed = self.item_consumed.append(
+                item_indices, user_indices, self.n_items, self.n_users)
+        else:
+            self.user_consumed, self.item_consumed = interaction_consumed(
+                user_indices, item_indices, self.n_users, self.n_items)
+            self._item_user_counts = None
         return user_indices, item_indices
 
+    @property
+    def item_user_counts(self):
+        """Number of distinct users who have consumed every item in the
+        latest training data, used to select popular items."""
+        if self._item_user_counts is None:
+            self._item_user_counts = self.item_consumed.unique_row_counts()
+        return self._item_user_counts
+
     def reset_property(self):
         self._n_users = None
         self._n_items = None
@@ -278,6 +412,8 @@ class DataInfo(object):
                     self.old_sparse_offset.append(self.sparse_offset[pos])
 
     def expand_sparse_unique_vals_and_matrix(self, data):
+        n_old_users, n_old_items = self.n_users, self.n_items
+        mappings = (self._user2id, self._item2id, self._id2user, self._id2item)
         self.reset_property()
         self.store_old_info()
 
@@ -291,62 +427,93 @@ class DataInfo(object):
             self.item_unique_vals = np.append(self.item_unique_vals, item_diff)
             self.extend_unique_matrix("item", len(item_diff))
 
+        # extend the cached id mappings instead of rebuilding them
+        user2id, item2id, id2user, id2item = mappings
+        self._user2id = _extend_mapping(user2id, user_diff, n_old_users)
+        self._item2id = _extend_mapping(item2id, item_diff, n_old_items)
+        self._id2user = _extend_mapping(
+            id2user, user_diff, n_old_users, inverse=True)
+        self._id2item = _extend_mapping(
+            id2item, item_diff, n_old_items, inverse=True)
+
         def update_sparse_unique(unique_dicts, unique_idxs):
             for sparse_col in unique_dicts:
-                unique_vals = list(unique_dicts[sparse_col])
+                unique_vals = unique_dicts[sparse_col]
+                if isinstance(unique_vals, HashBuckets):
+                    continue
                 sparse_diff = np.setdiff1d(data[sparse_col].to_numpy(),
                                            unique_vals)
                 if len(sparse_diff) > 0:
-                    unique_vals = np.append(unique_vals, sparse_diff)
-                    unique_dicts[sparse_col] = unique_vals
-                    size = len(unique_vals)
-                    unique_idxs[sparse_col] = dict(
-                        zip(unique_vals, range(size))
-                    )
+                    old_size = len(unique_vals)
+                    unique_dicts[sparse_col] = np.append(
+                        unique_vals, sparse_diff)
+                    # mappings not built yet will be built from new values
+                    if unique_idxs is not None:
+                        unique_idxs[sparse_col].update(
+                            zip(sparse_diff,
+                                range(old_size, old_size + len(sparse_diff)))
+                        )
 
         if self.sparse_unique_vals is not None:
             update_sparse_unique(self.sparse_unique_vals,
-                                 self.sparse_unique_idxs)
+                                 self._sparse_unique_idxs)
         if self.multi_sparse_unique_vals is not None:
             update_sparse_unique(self.multi_sparse_unique_vals,
-                                 self.multi_sparse_unique_idxs)
+                                 self._multi_sparse_unique_idxs)
 
     def extend_unique_matrix(self, mode, diff_num):
-        if mode == "user":
-            if self.user_sparse_unique is not None:
-                new_users = np.zeros(
-                    [diff_num, self.user_sparse_unique.shape[1]],
-                    dtype=self.user_sparse_unique.dtype
-                )
+        if mode not in ("user", "item"):
+            raise ValueError("mode must be user or item.")
+        for name in (f"{mode}_sparse_unique", f"{mode}_dense_unique"):
+            matrix = getattr(self, name)
+            if matrix is not None:
                 # exclude last oov unique values
-                self.user_sparse_unique = np.vstack(
-                    [self.user_sparse_unique[:-1], new_users]
-                )
-            if self.user_dense_unique is not None:
-                new_users = np.zeros(
-                    [diff_num, self.user_dense_unique.shape[1]],
-                    dtype=self.user_dense_unique.dtype
-                )
-                self.user_dense_unique = np.vstack(
-                    [self.user_dense_unique[:-1], new_users]
-                )
-        elif mode == "item":
-            if self.item_sparse_unique is not None:
-                new_items = np.zeros(
-                    [diff_num, self.item_sparse_unique.shape[1]],
-                    dtype=self.item_sparse_unique.dtype
-                )
-                self.item_sparse_unique = np.vstack(
-                    [self.item_sparse_unique[:-1], new_items]
-                )
-            if self.item_dense_unique is not None:
-                new_items = np.zeros(
-                    [diff_num, self.item_dense_unique.shape[1]],
-                    dtype=self.item_dense_unique.dtype
-                )
-                self.item_dense_unique = np.vstack(
-                    [self.item_dense_unique[:-1], new_items]
-                )
+                n_keep = len(matrix) - 1
+                n_rows = n_keep + diff_num
+                self._resize_unique(name, n_keep, n_rows,
+                                    capacity=n_rows + 1 + n_rows // 2)
+
+    def _resize_unique(self, name, n_keep, n_rows, capacity=None):
+        """Resize a unique feature matrix to `n_rows` rows, keeping the first
+        `n_keep` rows and zeroing the rest.
+
+        The matrix is a view of a larger buffer, which grows geometrically,
+        so repeated incremental updates cost amortized O(new rows).
+        """
+        matrix = getattr(self, name)
+        buffer = self._unique_buffers.get(name)
+        if buffer is None or matrix.base is not buffer:
+            buffer = matrix
+        if len(buffer) < n_rows:
+            capacity = max(n_rows, capacity or 0)
+            new_buffer = np.zeros((capacity,) + matrix.shape[1:],
+                                  dtype=matrix.dtype)
+            new_buffer[:n_keep] = matrix[:n_keep]
+            buffer = new_buffer
+        else:
+            buffer[n_keep:n_rows] = 0
+        self._unique_buffers[name] = buffer
+        setattr(self, name, buffer[:n_rows])
+
+    def compact_features(self):
+        """Store unique feature matrices in the narrowest safe dtypes.
+
+        Sparse indices become uint16 or int32 depending on the total number
+        of sparse features, and dense values become float32. It is called
+        again after the sparse features grow in revolution, so the dtype
+        is widened before any index could overflow.
+        """
+        self.compact = True
+        if self.sparse_oov is not None:
+            for name in ("user_sparse_unique", "item_sparse_unique"):
+                matrix = getattr(self, name)
+                if matrix is not None:
+                    setattr(self, name,
+                            compact_sparse_indices(matrix, self.sparse_oov))
+        for name in ("user_dense_unique", "item_dense_unique"):
+            matrix = getattr(self, name)
+            if matrix is not None:
+                setattr(self, name, compact_dense_values(matrix))
 
     # sparse_indices and offset will increase if sparse feature encounter new categories
     def modify_sparse_indices(self):
@@ -356,11 +523,13 @@ class DataInfo(object):
         if self.user_sparse_unique is not None:
             user_idx = self.user_sparse_col.index
             diff = self.sparse_offset[user_idx] - old_offset[user_idx]
-            self.user_sparse_unique += diff
+            self.user_sparse_unique += diff.astype(
+                self.user_sparse_unique.dtype)
         if self.item_sparse_unique is not None:
             item_idx = self.item_sparse_col.index
             diff = self.sparse_offset[item_idx] - old_offset[item_idx]
-            self.item_sparse_unique += diff
+            self.item_sparse_unique += diff.astype(
+                self.item_sparse_unique.dtype)
 
     # todo: ignore feature oov value
     def assign_sparse_features(self, data, mode):
@@ -392,24 +561,30 @@ class DataInfo(object):
 
     def assign_dense_features(self, data, mode):
         data = _check_oov(self, data, mode)
+        # raw values are transformed the same way as training data
+        dense_data = (
+            data
+            if self.dense_scaler is None
+            else self.dense_scaler.transform_columns(data)
+        )
         if mode == "user":
             row_idx = data["user"].to_numpy()
             col_info = self.user_dense_col
             if self.user_dense_unique is not None and col_info.name:
                 for feat_idx, col in enumerate(col_info.name):
-                    if col not in data.columns:
+                    if col not in dense_data:
                         continue
                     self.user_dense_unique[row_idx, feat_idx] = (
-                        data[col].to_numpy())
+                        np.asarray(dense_data[col]))
         elif mode == "item":
             row_idx = data["item"].to_numpy()
             col_info = self.item_dense_col
             if self.item_dense_unique is not None and col_info.name:
                 for feat_idx, col in enumerate(col_info.name):
-                    if col not in data.columns:
+                    if col not in dense_data:
                         continue
                     self.item_dense_unique[row_idx, feat_idx] = (
-                        data[col].to_numpy())
+                        np.asarray(dense_data[col]))
 
     def assign_user_features(self, user_data):
         self.assign_sparse_features(user_data, "user")
@@ -423,41 +598,46 @@ class DataInfo(object):
         if (self.user_sparse_unique is not None and
                 len(self.user_sparse_unique) == self.n_users):
             user_sparse_oov = self.sparse_oov[self.user_sparse_col.index]
-            self.user_sparse_unique = np.vstack(
-                [self.user_sparse_unique, user_sparse_oov]
-            )
+            self._append_unique_row("user_sparse_unique", user_sparse_oov)
         if (self.item_sparse_unique is not None and
                 len(self.item_sparse_unique) == self.n_items):
             item_sparse_oov = self.sparse_oov[self.item_sparse_col.index]
-            self.item_sparse_unique = np.vstack(
-                [self.item_sparse_unique, item_sparse_oov]
-            )
+            self._append_unique_row("item_sparse_unique", item_sparse_oov)
         if (self.user_dense_unique is not None and
                 len(self.user_dense_unique) == self.n_users):
             user_dense_oov = np.mean(self.user_dense_unique, axis=0)
-            self.user_dense_unique = np.vstack(
-                [self.user_dense_unique, user_dense_oov]
-            )
+            self._append_unique_row("user_dense_unique", user_dense_oov)
         if (self.item_dense_unique is not None and
                 len(self.item_dense_unique) == self.n_items):
             item_dense_oov = np.mean(self.item_dense_unique, axis=0)
-            self.item_dense_unique = np.vstack(
-                [self.item_dense_unique, item_dense_oov]
-            )
+            self._append_unique_row("item_dense_unique", item_dense_oov)
+
+    def _append_unique_row(self, name, row):
+        n_rows = len(getattr(self, name))
+        self._resize_unique(name, n_rows, n_rows + 1)
+        getattr(self, name)[-1] = row
 
     def set_popular_items(self, num):
-        count_items = self.interaction_data.drop_duplicates(
-            subset=["user", "item"]
-        ).groupby("item")["user"].count()
-        selected_items = count_items.sort_values(
-            ascending=False).index.tolist()[:num]
+        """Select items consumed by the most users in the latest training
+        data, old popular items fill up the rest."""
+        item_user_counts = self.item_user_counts
+        num_selected = min(num, np.count_nonzero(item_user_counts))
+        if num_selected > 0:
+            top_items = np.argpartition(
+                -item_user_counts, num_selected - 1)[:num_selected]
+            # sort by count, then by item index in case of ties
+            top_items = top_items[
+                np.lexsort((top_items, -item_user_counts[top_items]))]
+            selected_items = self.item_unique_vals[top_items].tolist()
+        else:
+            selected_items = []
         # if not enough items, add old populars
         if len(selected_items) < num and self.popular_items is not None:
             diff = num - len(selected_items)
             selected_items.extend(self.popular_items[:diff])
         self.popular_items = selected_items
 
-    def store_args(self, user_indices, item_indices):
+    def store_args(self):
         self.all_args = dict()
         inside_args = [
             "col_name_mapping",
@@ -473,16 +653,29 @@ class DataInfo(object):
             "sparse_oov",
             "multi_sparse_unique_vals",
             "multi_sparse_combine_info",
-            "multi_sparse_map"
+            "multi_sparse_map",
+            "compact",
+            "dense_scaler"
         ]
         all_variables = vars(self)
         for arg in inside_args:
             if arg in all_variables and all_variables[arg] is not None:
                 self.all_args[arg] = all_variables[arg]
-        self.all_args["user_indices"] = user_indices
-        self.all_args["item_indices"] = item_indices
 
-    def save(self, path):
+    def save(self, path, mmap=False):
+        """Save DataInfo to a folder.
+
+        Parameters
+        ----------
+        path : str
+            Folder path.
+        mmap : bool, optional
+            Whether to save as a versioned directory of uncompressed `.npy`
+            files, which can be memory-mapped by :meth:`load`. The consumed
+            csr and the unique values are persisted as they are, so nothing
+            has to be rebuilt when loading. Otherwise a compressed `.npz`
+            file is saved.
+        """
         if not os.path.isdir(path):
             print(f"file folder {path} doesn't exists, creating a new one...")
             os.makedirs(path)
@@ -493,32 +686,133 @@ class DataInfo(object):
             with open(name_mapping_path, 'w') as f:
                 json.dump(self.all_args["col_name_mapping"],
                           f, separators=(',', ':'), indent=4)
+        if self.dense_scaler is not None:
+            dense_scaler_path = os.path.join(path, "dense_scaler.json")
+            with open(dense_scaler_path, 'w') as f:
+                json.dump(self.dense_scaler.get_params(), f, indent=4)
+        if mmap:
+            self._save_arrays(os.path.join(path, "data_info"))
+            return
 
         other_path = os.path.join(path, "data_info")
         hparams = dict()
         arg_names = inspect.signature(self.__init__).parameters.keys()
         for arg in arg_names:
-            if (arg == "col_name_mapping" or
+            if arg in ("user_indices", "item_indices"):
+                continue
+            if (arg in ("col_name_mapping", "dense_scaler") or
                     arg not in self.all_args or
                     self.all_args[arg] is None):
                 continue
             if arg == "interaction_data":
-                hparams[arg] = self.all_args[arg].to_numpy()
+                continue
+            elif arg in ("user_unique_vals", "item_unique_vals"):
+                hparams[arg] = _portable_array(self.all_args[arg])
             elif arg == "sparse_unique_vals":
                 sparse_unique_vals = self.all_args[arg]
                 for col, val in sparse_unique_vals.items():
-                    hparams["unique_"+str(col)] = np.asarray(val)
+                    if isinstance(val, HashBuckets):
+                        hparams["hash_"+str(col)] = np.array(len(val))
+                    else:
+                        hparams["unique_"+str(col)] = _portable_array(val)
             elif arg == "multi_sparse_unique_vals":
                 multi_sparse_unique_vals = self.all_args[arg]
                 for col, val in multi_sparse_unique_vals.items():
-                    hparams["munique_"+str(col)] = np.asarray(val)
+                    hparams["munique_"+str(col)] = _portable_array(val)
+            elif arg == "multi_sparse_combine_info":
+                # ragged fields would otherwise become an object array
+                for field, val in self.all_args[arg]._asdict().items():
+                    hparams["multi_sparse_"+field] = np.asarray(val)
             else:
                 hparams[arg] = self.all_args[arg]
 
+        if self.interactions is not None:
+            for field, val in self.interactions._asdict().items():
+                hparams["interaction_"+field] = val
+
+        # consumed items are restored from user-item pairs, which are only
+        # stored if they differ from interactions due to merged behavior
+        if (self.interactions is None
+                or len(self.user_consumed.indices) != self.data_size):
+            hparams["user_indices"] = np.repeat(
+                np.arange(self.user_consumed.n_rows, dtype=np.int32),
+                self.user_consumed.row_lengths
+            )
+            hparams["item_indices"] = self.user_consumed.indices
         np.savez_compressed(other_path, **hparams)
 
+    def _save_arrays(self, array_path):
+        os.makedirs(array_path, exist_ok=True)
+        arrays = {
+            "user_sparse_unique": self.user_sparse_unique,
+            "user_dense_unique": self.user_dense_unique,
+            "item_sparse_unique": self.item_sparse_unique,
+            "item_dense_unique": self.item_dense_unique,
+            "user_unique_vals": self.user_unique_vals,
+            "item_unique_vals": self.item_unique_vals,
+            "sparse_offset": self.sparse_offset,
+            "sparse_oov": self.sparse_oov,
+            "popular_items": self.popular_items,
+            "user_consumed_indptr": self.user_consumed.indptr,
+            "user_consumed_indices": self.user_consumed.indices,
+            "item_consumed_indptr": self.item_consumed.indptr,
+            "item_consumed_indices": self.item_consumed.indices,
+        }
+        if self.interactions is not None:
+            for field, val in self.interactions._asdict().items():
+                arrays["interaction_" + field] = val
+        if self.multi_sparse_combine_info is not None:
+            for field, val in self.multi_sparse_combine_info._asdict().items():
+                arrays["multi_sparse_" + field] = val
+        # column names may not be valid file names, so use positions
+        sparse_cols, hash_buckets = _split_hashed_cols(self.sparse_unique_vals)
+        for i, col in enumerate(sparse_cols or []):
+            arrays[f"unique_{i}"] = self.sparse_unique_vals[col]
+        multi_sparse_cols = _unique_vals_cols(self.multi_sparse_unique_vals)
+        for i, col in enumerate(multi_sparse_cols or []):
+            arrays[f"munique_{i}"] = self.multi_sparse_unique_vals[col]
+
+        saved, pickled = [], []
+        for name, val in arrays.items():
+            if val is None:
+                continue
+            val = _portable_array(val)
+            # only object arrays need pickle, which can't be memory-mapped
+            allow_pickle = val.dtype == object
+            np.save(os.path.join(array_path, name + ".npy"), val,
+                    allow_pickle=allow_pickle)
+            saved.append(name)
+            if allow_pickle:
+                pickled.append(name)
+
+        meta = {
+            "version": DATA_INFO_VERSION,
+            "arrays": saved,
+            "pickled": pickled,
+            "sparse_cols": sparse_cols,
+            "multi_sparse_cols": multi_sparse_cols,
+            "hash_buckets": hash_buckets,
+            "compact": self.compact,
+        }
+        with open(os.path.join(array_path, "meta.json"), "w") as f:
+            json.dump(meta, f, separators=(',', ':'), indent=4)
+
     @classmethod
-    def load(cls, path):
+    def load(cls, path, mmap_mode=None, lazy=False):
+        """Load DataInfo from a folder.
+
+        Parameters
+        ----------
+        path : str
+            Folder path.
+        mmap_mode : {None, 'r', 'c'}, optional
+            Memory-map mode of the arrays, only used for the directory
+            format saved with `mmap=True`. Use 'c' (copy-on-write) if the
+            loaded DataInfo will be updated with new data.
+        lazy : bool, optional
+            Whether to defer building the id and feature mappings until
+            their first use, only used for the directory format.
+        """
         if not os.path.exists(path):
             raise OSError(f"file folder {path} doesn't exists...")
 
@@ -527,20 +821,46 @@ class DataInfo(object):
         if os.path.exists(name_mapping_path):
             with open(name_mapping_path, 'r') as f:
                 hparams["col_name_mapping"] = json.load(f)
+        dense_scaler_path = os.path.join(path, "dense_scaler.json")
+        if os.path.exists(dense_scaler_path):
+            with open(dense_scaler_path, 'r') as f:
+                hparams["dense_scaler"] = DenseScaler.from_params(json.load(f))
+
+        array_path = os.path.join(path, "data_info")
+        if os.path.exists(os.path.join(array_path, "meta.json")):
+            return cls._load_arrays(
+                array_path, hparams.get("col_name_mapping"),
+                hparams.get("dense_scaler"), mmap_mode, lazy)
 
         other_path = os.path.join(path, "data_info.npz")
-        info = np.load(other_path, allow_pickle=True)
-        info = dict(info.items())
+        try:
+            with np.load(other_path) as f:
+                info = dict(f.items())
+        except ValueError:
+            # old files, or ids of mixed types that are stored as objects
+            with np.load(other_path, allow_pickle=True) as f:
+                info = dict(f.items())
+
+        interactions = dict()
+        multi_sparse_info = dict()
         for arg in info:
             if arg == "interaction_data":
                 hparams[arg] = pd.DataFrame(
                     info[arg], columns=["user", "item", "label"])
+            elif arg.startswith("interaction_"):
+                interactions[arg[12:]] = info[arg]
             elif arg == "multi_sparse_combine_info":
                 hparams[arg] = MultiSparseInfo(*info[arg])
+            elif arg.startswith("multi_sparse_"):
+                multi_sparse_info[arg[13:]] = info[arg].tolist()
             elif arg.startswith("unique_"):
                 if "sparse_unique_vals" not in hparams:
                     hparams["sparse_unique_vals"] = dict()
                 hparams["sparse_unique_vals"][arg[7:]] = info[arg]
+            elif arg.startswith("hash_"):
+                if "sparse_unique_vals" not in hparams:
+                    hparams["sparse_unique_vals"] = dict()
+                hparams["sparse_unique_vals"][arg[5:]] = HashBuckets(info[arg])
             elif arg.startswith("munique_"):
                 if "multi_sparse_unique_vals" not in hparams:
                     hparams["multi_sparse_unique_vals"] = dict()
@@ -548,4 +868,143 @@ class DataInfo(object):
             else:
                 hparams[arg] = info[arg]
 
+        if interactions:
+            hparams["interaction_data"] = Interactions(**interactions)
+            if "user_indices" not in hparams:
+                hparams["user_indices"] = interactions["user_indices"]
+                hparams["item_indices"] = interactions["item_indices"]
+        if multi_sparse_info:
+            hparams["multi_sparse_combine_info"] = MultiSparseInfo(
+                **multi_sparse_info)
         return cls(**hparams)
+
+    @classmethod
+    def _load_arrays(cls, array_path, col_name_mapping, dense_scaler,
+                     mmap_mode, lazy):
+        with open(os.path.join(array_path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        if meta["version"] > DATA_INFO_VERSION:
+            raise ValueError(
+                f"data_info version {meta['version']} is not supported, "
+                f"the latest supported version is {DATA_INFO_VERSION}"
+            )
+
+        arrays = dict()
+        for name in meta["arrays"]:
+            pickled = name in meta["pickled"]
+            arrays[name] = np.load(
+                os.path.join(array_path, name + ".npy"),
+                mmap_mode=None if pickled else mmap_mode,
+                allow_pickle=pickled
+            )
+
+        # bypass __init__, which would rebuild consumed from pairs
+        data_info = cls.__new__(cls)
+        data_info._init_cache()
+        data_info.col_name_mapping = col_name_mapping
+        for name in ("user_sparse_unique", "user_dense_unique",
+                     "item_sparse_unique", "item_dense_unique",
+                     "user_unique_vals", "item_unique_vals",
+                     "sparse_offset", "sparse_oov"):
+            setattr(data_info, name, arrays.get(name))
+        data_info.user_consumed = ConsumedCSR(
+            arrays["user_consumed_indptr"],
+            arrays["user_consumed_indices"],
+            len(data_info.item_unique_vals)
+        )
+        data_info.item_consumed = ConsumedCSR(
+            arrays["item_consumed_indptr"],
+            arrays["item_consumed_indices"],
+            len(data_info.user_unique_vals)
+        )
+        data_info.interactions = (
+            Interactions(*(arrays["interaction_" + field]
+                           for field in Interactions._fields))
+            if "interaction_labels" in arrays
+            else None
+        )
+        data_info.sparse_unique_vals = _load_unique_vals(
+            arrays, "unique_", meta["sparse_cols"])
+        for col, n_buckets in meta.get("hash_buckets", dict()).items():
+            data_info.sparse_unique_vals[col] = HashBuckets(n_buckets)
+        data_info.multi_sparse_unique_vals = _load_unique_vals(
+            arrays, "munique_", meta["multi_sparse_cols"])
+        data_info.multi_sparse_combine_info = (
+            MultiSparseInfo(*(arrays["multi_sparse_" + field].tolist()
+                              for field in MultiSparseInfo._fields))
+            if "multi_sparse_feat_oov" in arrays
+            else None
+        )
+        data_info.compact = meta["compact"]
+        data_info.dense_scaler = dense_scaler
+        if "popular_items" in arrays:
+            data_info.popular_items = arrays["popular_items"].tolist()
+        else:
+            data_info.set_popular_items(100)
+        data_info.store_args()
+
+        if not lazy:
+            # build the mappings used in predicting and recommending
+            for name in ("user2id", "item2id", "sparse_unique_idxs",
+                         "multi_sparse_unique_idxs"):
+                getattr(data_info, name)
+        return data_info
+
+
+def _portable_array(values):
+    """Convert an object array of ids to a native dtype if it can be done
+    losslessly, so the array can be loaded without pickle.
+
+    Strings are kept as objects and pickled, since fixed-width unicode pads
+    every value to the longest one and changes the dtype of loaded ids."""
+    values = np.asarray(values)
+    if values.dtype != object or values.ndim != 1 or len(values) == 0:
+        return values
+    # infer_dtype scans the array in C, mixed types are kept as object
+    dtype = _PORTABLE_DTYPES.get(pd.api.types.infer_dtype(values,
+                                                          skipna=False))
+    if dtype is None:
+        return values
+    try:
+        return values.astype(dtype)
+    except OverflowError:
+        return values
+
+
+_PORTABLE_DTYPES = {
+    "integer": np.int64,
+    "floating": np.float64,
+    "boolean": np.bool_,
+}
+
+
+def _unique_vals_cols(unique_vals):
+    return None if unique_vals is None else list(unique_vals)
+
+
+def _split_hashed_cols(unique_vals):
+    # hashed columns only store the number of buckets
+    if unique_vals is None:
+        return None, dict()
+    cols = [col for col, val in unique_vals.items()
+            if not isinstance(val, HashBuckets)]
+    hash_buckets = {col: len(val) for col, val in unique_vals.items()
+                    if isinstance(val, HashBuckets)}
+    return cols, hash_buckets
+
+
+def _load_unique_vals(arrays, prefix, cols):
+    if cols is None:
+        return None
+    return {col: arrays[f"{prefix}{i}"] for i, col in enumerate(cols)}
+
+
+def _extend_mapping(mapping, new_vals, start, inverse=False):
+    if mapping is None:
+        return None
+    new_ids = range(start, start + len(new_vals))
+    if inverse:
+        mapping.update(zip(new_ids, new_vals))
+    else:
+        mapping.update(zip(new_vals, new_ids))
+    return mapping
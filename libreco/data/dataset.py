@@ -2,20 +2,28 @@ import itertools
 import numpy as np
 import pandas as pd
 
-from .data_info import DataInfo
+from .data_info import DataInfo, Interactions
+from .processing import DenseScaler
 from .transformed import TransformedSet
+from .streaming import collect_chunk_vocab, iter_data_chunks
 from ..feature import (
     col_name2index,
+    compact_dense_values,
+    compact_sparse_indices,
     construct_unique_feat,
     get_user_item_sparse_indices,
     merge_sparse_indices,
+    merge_ragged_sparse_indices,
     merge_sparse_col,
     merge_offset,
     get_oov_pos,
+    HashBuckets,
     multi_sparse_combine_info,
     multi_sparse_col_map,
+    RaggedSparseIndices,
     recover_sparse_cols
 )
+from ..utils.misc import shuffle_order
 
 
 class Dataset(object):
@@ -31,6 +39,7 @@ class Dataset(object):
     dense_col = None
     sparse_col = None
     multi_sparse_col = None
+    dense_scaler = None
     train_called = False
 
     @classmethod
@@ -60,6 +69,7 @@ class Dataset(object):
     def _set_feature_col(cls, sparse_col, dense_col, multi_sparse_col):
         cls.sparse_col = None if not sparse_col else sparse_col
         cls.dense_col = None if not dense_col else dense_col
+        cls.dense_scaler = None
         if multi_sparse_col:
             if not all(isinstance(field, list) for field in multi_sparse_col):
                 cls.multi_sparse_col = [multi_sparse_col]
@@ -67,9 +77,25 @@ class Dataset(object):
                 cls.multi_sparse_col = multi_sparse_col
 
     @classmethod
-    def _set_sparse_unique_vals(cls, train_data, pad_val):
+    def _set_hash_buckets(cls, hash_buckets):
+        if not hash_buckets:
+            return []
+        unknown_cols = [col for col in hash_buckets
+                        if not cls.sparse_col or col not in cls.sparse_col]
+        if unknown_cols:
+            raise ValueError(
+                f"hash_buckets columns must be in sparse_col: {unknown_cols}")
+        for col, n_buckets in hash_buckets.items():
+            cls.sparse_unique_vals[col] = HashBuckets(n_buckets)
+        return list(hash_buckets)
+
+    @classmethod
+    def _set_sparse_unique_vals(cls, train_data, pad_val, hash_buckets=None):
+        hashed_cols = cls._set_hash_buckets(hash_buckets)
         if cls.sparse_col:
             for col in cls.sparse_col:
+                if col in hashed_cols:
+                    continue
                 cls.sparse_unique_vals[col] = np.sort(train_data[col].unique())
 
         if cls.multi_sparse_col:
@@ -89,6 +115,113 @@ class Dataset(object):
         cls.user_unique_vals = np.sort(train_data["user"].unique())
         cls.item_unique_vals = np.sort(train_data["item"].unique())
 
+    @classmethod
+    def _set_unique_vals_from_chunks(cls, source, chunk_size, pad_val,
+                                     read_kwargs, dense_scaler=None,
+                                     hash_buckets=None):
+        hashed_cols = cls._set_hash_buckets(hash_buckets)
+        vocab_col = (
+            [col for col in cls.sparse_col if col not in hashed_cols]
+            if cls.sparse_col
+            else None
+        )
+        (
+            n_rows,
+            cls.user_unique_vals,
+            cls.item_unique_vals,
+            sparse_unique_vals,
+            multi_sparse_unique_vals
+        ) = collect_chunk_vocab(
+            iter_data_chunks(source, chunk_size, **read_kwargs),
+            vocab_col,
+            cls.multi_sparse_col,
+            pad_val,
+            dense_scaler
+        )
+        cls.sparse_unique_vals.update(sparse_unique_vals)
+        cls.multi_sparse_unique_vals.update(multi_sparse_unique_vals)
+        return n_rows
+
+    @classmethod
+    def _encode_chunks(cls, source, chunk_size, n_rows, read_kwargs,
+                       use_features=True, order=None, ragged=False):
+        # second pass, write encoded chunks into preallocated arrays.
+        # If `order` is given, rows of a chunk are scattered into their
+        # shuffled positions, so the data is never copied for shuffling.
+        # Ragged chunks can't be preallocated, so they are concatenated
+        # and shuffled afterwards.
+        user_indices = np.empty(n_rows, dtype=np.int32)
+        item_indices = np.empty(n_rows, dtype=np.int32)
+        labels = np.empty(n_rows, dtype=np.float32)
+        use_sparse = use_features and (cls.sparse_col or cls.multi_sparse_col)
+        use_dense = use_features and cls.dense_col
+        ragged = bool(ragged and use_sparse and cls.multi_sparse_col)
+        ragged_parts = []
+        if ragged:
+            sparse_indices = None
+        elif use_sparse:
+            n_sparse = len(merge_sparse_col(cls.sparse_col or [],
+                                            cls.multi_sparse_col or []))
+            sparse_indices = np.empty((n_rows, n_sparse), dtype=np.int32)
+        else:
+            sparse_indices = None
+        dense_values = (
+            np.empty((n_rows, len(cls.dense_col)), dtype=np.float32)
+            if use_dense
+            else None
+        )
+
+        start = 0
+        for chunk in iter_data_chunks(source, chunk_size, **read_kwargs):
+            cls._check_col_names(chunk, mode="train")
+            end = start + len(chunk)
+            if end > n_rows:
+                raise ValueError("data source changed between two passes")
+            rows = (
+                slice(start, end) if order is None else order[start:end]
+            )
+            (
+                user_indices[rows],
+                item_indices[rows]
+            ) = get_user_item_sparse_indices(
+                chunk, cls.user_unique_vals, cls.item_unique_vals,
+                mode="train", ordered=True
+            )
+            labels[rows] = chunk["label"].to_numpy(dtype=np.float32)
+            if ragged:
+                ragged_parts.append(merge_ragged_sparse_indices(
+                    cls, chunk, cls.sparse_col, cls.multi_sparse_col,
+                    mode="train", ordered=True
+                ))
+            elif use_sparse:
+                sparse_indices[rows] = merge_sparse_indices(
+                    cls, chunk, cls.sparse_col, cls.multi_sparse_col,
+                    mode="train", ordered=True
+                )
+            if use_dense and cls.dense_scaler is not None:
+                # derived columns are filled by the scaler
+                dense_values[rows] = cls.dense_scaler.transform_data(chunk)
+            elif use_dense:
+                dense_values[rows] = chunk[cls.dense_col].to_numpy()
+            start = end
+
+        if start != n_rows:
+            raise ValueError("data source changed between two passes")
+        if ragged:
+            sparse_indices = RaggedSparseIndices.concatenate(ragged_parts)
+            if order is not None:
+                # row `i` of the source goes to position `order[i]`
+                source_rows = np.empty_like(order)
+                source_rows[order] = np.arange(n_rows, dtype=order.dtype)
+                sparse_indices = sparse_indices.take_rows(source_rows)
+        return user_indices, item_indices, labels, sparse_indices, dense_values
+
+    @staticmethod
+    def _shuffle_order(n_rows, shuffle, seed):
+        if not shuffle:
+            return None
+        return shuffle_order(n_rows, rng=np.random.RandomState(seed))
+
     @classmethod
     def reset_feature_state(cls):
         cls.sparse_unique_vals.clear()
@@ -98,6 +231,7 @@ class Dataset(object):
         cls.dense_col = None
         cls.sparse_col = None
         cls.multi_sparse_col = None
+        cls.dense_scaler = None
         cls.train_called = False
 
 
@@ -172,12 +306,13 @@ class DatasetPure(Dataset):
                 user_indices, item_indices, labels, train=True
             )
 
-            user_indices, item_indices = data_info.update_consumed(
+            data_info.update_consumed(
                 user_indices, item_indices, merge=merge_behavior
             )
-            data_info.interaction_data = train_data[["user", "item", "label"]]
+            data_info.set_interactions(
+                Interactions(user_indices, item_indices, labels))
             data_info.set_popular_items(popular_nums)
-            data_info.store_args(user_indices, item_indices)
+            data_info.store_args()
 
         else:
             cls._set_sparse_unique_vals(train_data, "missing")
@@ -195,7 +330,7 @@ class DatasetPure(Dataset):
             )
             labels = train_data["label"].to_numpy(dtype=np.float32)
 
-            interaction_data = train_data[["user", "item", "label"]]
+            interaction_data = Interactions(user_indices, item_indices, labels)
             train_transformed = TransformedSet(
                 user_indices, item_indices, labels, train=True
             )
@@ -208,6 +343,75 @@ class DatasetPure(Dataset):
         cls.train_called = True
         return train_transformed, data_info
 
+    @classmethod
+    def build_trainset_from_chunks(
+            cls,
+            source,
+            chunk_size=1_000_000,
+            shuffle=False,
+            reset_state=False,
+            seed=42,
+            compact=False,
+            **read_kwargs):
+        """Build transformed pure train_data from chunks of original data.
+
+        Data are traversed twice, first to collect unique values, then to
+        encode each chunk into preallocated arrays, so the whole original
+        data never needs to be loaded into memory.
+
+        Parameters
+        ----------
+        source : str or callable or list of `pandas.DataFrame`
+            A csv or parquet file path, a callable that returns a fresh
+            iterable of DataFrame chunks, or a list of DataFrame chunks.
+            Every chunk must at least contains three columns,
+            i.e. `user`, `item`, `label`.
+        chunk_size : int, optional
+            Number of rows in each chunk when reading from a file.
+        shuffle : bool, optional
+            Whether to fully shuffle data.
+        reset_state : bool, optional
+            Whether to reset previous state before building new data.
+        seed: int, optional
+            random seed.
+        compact : bool, optional
+            Whether `data_info` stores feature matrices in the narrowest
+            safe dtypes, which is kept when retraining with new data.
+        read_kwargs : dict, optional
+            Extra arguments passed to `pandas.read_csv`.
+
+        Returns
+        -------
+        trainset : `TransformedSet` object
+            Data object used for training.
+        data_info : `DataInfo` object
+            Object that contains some useful information
+            for training and predicting
+        """
+
+        cls._check_subclass()
+        if reset_state:
+            cls.reset_feature_state()
+
+        n_rows = cls._set_unique_vals_from_chunks(
+            source, chunk_size, "missing", read_kwargs)
+        user_indices, item_indices, labels, _, _ = cls._encode_chunks(
+            source, chunk_size, n_rows, read_kwargs, use_features=False,
+            order=cls._shuffle_order(n_rows, shuffle, seed))
+
+        train_transformed = TransformedSet(
+            user_indices, item_indices, labels, train=True
+        )
+        interaction_data = Interactions(user_indices, item_indices, labels)
+        data_info = DataInfo(interaction_data=interaction_data,
+                             user_indices=user_indices,
+                             item_indices=item_indices,
+                             user_unique_vals=cls.user_unique_vals,
+                             item_unique_vals=cls.item_unique_vals,
+                             compact=compact)
+        cls.train_called = True
+        return train_transformed, data_info
+
     @classmethod
     def build_evalset(cls, eval_data, revolution=False, data_info=None,
                       shuffle=False, seed=42):
@@ -346,9 +550,12 @@ class DatasetFeat(Dataset):
             unique_feat=False,
             popular_nums=100,
             pad_val="missing",
+            hash_buckets=None,
             shuffle=False,
             reset_state=False,
-            seed=42
+            seed=42,
+            compact=False,
+            ragged=False
     ):
         """Build transformed feat train_data from original data.
 
@@ -384,12 +591,23 @@ class DatasetFeat(Dataset):
         pad_val : str or list, optional
             Padding value in multi_sparse columns.
             To ensure same length of all samples.
+        hash_buckets : dict of {str: int}, optional
+            Number of hash buckets of high-cardinality sparse columns. These
+            columns are encoded with feature hashing instead of a full
+            vocabulary, and distinct values may share a bucket.
         shuffle : bool, optional
             Whether to fully shuffle data.
         reset_state : bool, optional
             Whether to reset previous feature state before building new data.
         seed: int, optional
             random seed.
+        compact : bool, optional
+            Whether to store feature matrices in the narrowest safe dtypes,
+            i.e. uint16 or int32 sparse indices and float32 dense values.
+            In revolution, the setting of `data_info` is used instead.
+        ragged : bool, optional
+            Whether to store multi_sparse columns as values plus offsets
+            without padding. Batches are padded again when they are indexed.
 
         Returns
         -------
@@ -419,8 +637,11 @@ class DatasetFeat(Dataset):
 
             sparse_cols, multi_sparse_cols = recover_sparse_cols(data_info)
 
+            encode_sparse = (
+                merge_ragged_sparse_indices if ragged else merge_sparse_indices
+            )
             train_sparse_indices = (
-                merge_sparse_indices(
+                encode_sparse(
                     data_info, train_data, sparse_cols,
                     multi_sparse_cols, mode="train",
                     ordered=False
@@ -430,20 +651,15 @@ class DatasetFeat(Dataset):
             )
 
             dense_cols = data_info.dense_col.name
-            train_dense_values = (
-                train_data[dense_cols].to_numpy()
-                if dense_cols
-                else None
-            )
+            if dense_cols and data_info.dense_scaler is not None:
+                train_dense_values = data_info.dense_scaler.transform_data(
+                    train_data)
+            elif dense_cols:
+                train_dense_values = train_data[dense_cols].to_numpy()
+            else:
+                train_dense_values = None
             labels = train_data["label"].to_numpy(dtype=np.float32)
 
-            train_transformed = TransformedSet(user_indices,
-                                               item_indices,
-                                               labels,
-                                               train_sparse_indices,
-                                               train_dense_values,
-                                               train=True)
-
             data_info.sparse_offset = (
                 merge_offset(data_info, sparse_cols, multi_sparse_cols)
                 if sparse_cols or multi_sparse_cols
@@ -466,6 +682,19 @@ class DatasetFeat(Dataset):
             #    if multi_sparse_cols
             #    else None
             # )
+            if data_info.compact:
+                # widen the dtype first in case new categories overflow it
+                data_info.compact_features()
+                train_sparse_indices = compact_sparse_indices(
+                    train_sparse_indices, data_info.sparse_oov)
+                train_dense_values = compact_dense_values(train_dense_values)
+
+            train_transformed = TransformedSet(user_indices,
+                                               item_indices,
+                                               labels,
+                                               train_sparse_indices,
+                                               train_dense_values,
+                                               train=True)
             data_info.modify_sparse_indices()
 
             # if a user or item has duplicate features, will only update the last one.
@@ -474,16 +703,17 @@ class DatasetFeat(Dataset):
             data_info.assign_user_features(user_data)
             data_info.assign_item_features(item_data)
             data_info.add_oov()
-            user_indices, item_indices = data_info.update_consumed(
+            data_info.update_consumed(
                 user_indices, item_indices, merge=merge_behavior
             )
-            data_info.interaction_data = train_data[["user", "item", "label"]]
+            data_info.set_interactions(
+                Interactions(user_indices, item_indices, labels))
             data_info.set_popular_items(popular_nums)
-            data_info.store_args(user_indices, item_indices)
+            data_info.store_args()
 
         else:
             cls._set_feature_col(sparse_col, dense_col, multi_sparse_col)
-            cls._set_sparse_unique_vals(train_data, pad_val)
+            cls._set_sparse_unique_vals(train_data, pad_val, hash_buckets)
             if shuffle:
                 train_data = train_data.sample(
                     frac=1, random_state=seed
@@ -493,8 +723,11 @@ class DatasetFeat(Dataset):
                 train_data, cls.user_unique_vals, cls.item_unique_vals,
                 mode="train", ordered=True
             )
+            encode_sparse = (
+                merge_ragged_sparse_indices if ragged else merge_sparse_indices
+            )
             train_sparse_indices = (
-                merge_sparse_indices(
+                encode_sparse(
                     cls, train_data, cls.sparse_col,
                     cls.multi_sparse_col, mode="train",
                     ordered=True
@@ -508,6 +741,12 @@ class DatasetFeat(Dataset):
                 else None
             )
             labels = train_data["label"].to_numpy(dtype=np.float32)
+            if compact:
+                train_sparse_indices = compact_sparse_indices(
+                    train_sparse_indices,
+                    get_oov_pos(cls, cls.sparse_col, cls.multi_sparse_col)
+                )
+                train_dense_values = compact_dense_values(train_dense_values)
 
             train_transformed = TransformedSet(user_indices,
                                                item_indices,
@@ -516,100 +755,257 @@ class DatasetFeat(Dataset):
                                                train_dense_values,
                                                train=True)
 
-            all_sparse_col = (
-                merge_sparse_col(cls.sparse_col, cls.multi_sparse_col)
-                if cls.multi_sparse_col
-                else sparse_col
+            interaction_data = Interactions(user_indices, item_indices, labels)
+            data_info = cls._construct_data_info(
+                user_col, item_col, sparse_col, dense_col, multi_sparse_col,
+                user_indices, item_indices, train_sparse_indices,
+                train_dense_values, interaction_data, unique_feat, compact
             )
 
-            col_name_mapping = col_name2index(
-                user_col, item_col, all_sparse_col, cls.dense_col
-            )
-            user_sparse_col_indices = list(
-                col_name_mapping["user_sparse_col"].values()
-            )
-            user_dense_col_indices = list(
-                col_name_mapping["user_dense_col"].values()
-            )
-            item_sparse_col_indices = list(
-                col_name_mapping["item_sparse_col"].values()
-            )
-            item_dense_col_indices = list(
-                col_name_mapping["item_dense_col"].values()
-            )
+        cls.train_called = True
+        return train_transformed, data_info
 
-            (
-                user_sparse_unique,
-                user_dense_unique,
-                item_sparse_unique,
-                item_dense_unique
-            ) = construct_unique_feat(user_indices,
-                                      item_indices,
-                                      train_sparse_indices,
-                                      train_dense_values,
-                                      user_sparse_col_indices,
-                                      user_dense_col_indices,
-                                      item_sparse_col_indices,
-                                      item_dense_col_indices,
-                                      unique_feat)
-
-            sparse_offset = (
-                merge_offset(cls, cls.sparse_col, cls.multi_sparse_col)
-                if cls.sparse_col or cls.multi_sparse_col
-                else None
-            )
-            # sparse_unique_vals = (
-            #    dict(**cls.sparse_unique_vals, **cls.multi_sparse_unique_vals)
-            #    if cls.sparse_col or cls.multi_sparse_col
-            #    else None
-            # )
-            sparse_oov = (
-                get_oov_pos(cls, sparse_col, multi_sparse_col)
-                if cls.sparse_col or cls.multi_sparse_col
-                else None
-            )
+    @classmethod
+    def build_trainset_from_chunks(
+            cls,
+            source,
+            user_col=None,
+            item_col=None,
+            sparse_col=None,
+            dense_col=None,
+            multi_sparse_col=None,
+            unique_feat=False,
+            pad_val="missing",
+            hash_buckets=None,
+            normalizer=None,
+            transformer=("log", "sqrt", "square"),
+            chunk_size=1_000_000,
+            shuffle=False,
+            reset_state=False,
+            seed=42,
+            compact=False,
+            ragged=False,
+            **read_kwargs
+    ):
+        """Build transformed feat train_data from chunks of original data.
 
-            multi_sparse_info = (
-                multi_sparse_combine_info(
-                    cls, all_sparse_col, sparse_col, multi_sparse_col)
-                if cls.multi_sparse_col
-                else None
-            )
-            # multi_sparse_size = (
-            #    multi_sparse_true_size(train_data, multi_sparse_col, pad_val)
-            #    if cls.multi_sparse_col
-            #    else None
-            # )
+        Data are traversed twice, first to collect unique values, then to
+        encode each chunk into preallocated arrays, so the whole original
+        data never needs to be loaded into memory. Dense values are stored
+        as float32.
 
-            if cls.multi_sparse_col:
-                multi_sparse_map = multi_sparse_col_map(multi_sparse_col)
-                col_name_mapping.update({"multi_sparse": multi_sparse_map})
-
-            interaction_data = train_data[["user", "item", "label"]]
-            data_info = DataInfo(col_name_mapping,
-                                 interaction_data,
-                                 user_sparse_unique,
-                                 user_dense_unique,
-                                 item_sparse_unique,
-                                 item_dense_unique,
-                                 user_indices,
-                                 item_indices,
-                                 cls.user_unique_vals,
-                                 cls.item_unique_vals,
-                                 cls.sparse_unique_vals,
-                                 sparse_offset,
-                                 sparse_oov,
-                                 cls.multi_sparse_unique_vals,
-                                 multi_sparse_info)
+        Parameters
+        ----------
+        source : str or callable or list of `pandas.DataFrame`
+            A csv or parquet file path, a callable that returns a fresh
+            iterable of DataFrame chunks, or a list of DataFrame chunks.
+            Every chunk must at least contains three columns,
+            i.e. `user`, `item`, `label`.
+        user_col : list of str
+            List of user feature column names.
+        item_col : list of str
+            List of item feature column names.
+        sparse_col : list of str
+            List of sparse feature columns names.
+        dense_col : list of str, optional
+            List of dense feature column names.
+        multi_sparse_col : list of list of str
+            List of list of multi_sparse feature columns names.
+            For example, [["a", "b", "c"], ["d", "e"]]
+        unique_feat : bool, optional
+            Whether the features of users and items are unique in train data.
+        pad_val : str or list, optional
+            Padding value in multi_sparse columns.
+            To ensure same length of all samples.
+        hash_buckets : dict of {str: int}, optional
+            Number of hash buckets of high-cardinality sparse columns. These
+            columns are encoded with feature hashing instead of a full
+            vocabulary, and distinct values may share a bucket.
+        normalizer : {"min_max", "standard"}, optional
+            If provided, dense features are scaled with a
+            :class:`~libreco.data.DenseScaler` fitted in the first pass,
+            which is stored in `data_info` and also applied to test data
+            and to features passed in prediction.
+        transformer : list of str, optional
+            Extra dense columns derived from every scaled column, only used
+            if `normalizer` is provided. They are appended to the dense
+            columns of the same user or item side, see `data_info.dense_col`.
+        chunk_size : int, optional
+            Number of rows in each chunk when reading from a file.
+        shuffle : bool, optional
+            Whether to fully shuffle data.
+        reset_state : bool, optional
+            Whether to reset previous feature state before building new data.
+        seed: int, optional
+            random seed.
+        compact : bool, optional
+            Whether to store feature matrices in the narrowest safe dtypes,
+            i.e. uint16 or int32 sparse indices and float32 dense values.
+        ragged : bool, optional
+            Whether to store multi_sparse columns as values plus offsets
+            without padding. Batches are padded again when they are indexed.
+        read_kwargs : dict, optional
+            Extra arguments passed to `pandas.read_csv`.
 
+        Returns
+        -------
+        trainset : `TransformedSet` object
+            Data object used for training.
+        data_info : `DataInfo` object
+            Object that contains some useful information
+            for training and predicting
+        """
+
+        cls._check_subclass()
+        if reset_state:
+            cls.reset_feature_state()
+
+        cls._set_feature_col(sparse_col, dense_col, multi_sparse_col)
+        dense_scaler = (
+            DenseScaler(dense_col, normalizer, transformer)
+            if dense_col and normalizer
+            else None
+        )
+        n_rows = cls._set_unique_vals_from_chunks(
+            source, chunk_size, pad_val, read_kwargs, dense_scaler,
+            hash_buckets)
+        if dense_scaler is not None:
+            cls.dense_scaler = dense_scaler
+            cls.dense_col = dense_scaler.transformed_col
+            dense_col = cls.dense_col
+            user_col = _with_derived_col(user_col, dense_scaler)
+            item_col = _with_derived_col(item_col, dense_scaler)
+        (
+            user_indices,
+            item_indices,
+            labels,
+            train_sparse_indices,
+            train_dense_values
+        ) = cls._encode_chunks(
+            source, chunk_size, n_rows, read_kwargs,
+            order=cls._shuffle_order(n_rows, shuffle, seed), ragged=ragged
+        )
+        if compact:
+            train_sparse_indices = compact_sparse_indices(
+                train_sparse_indices,
+                get_oov_pos(cls, cls.sparse_col, cls.multi_sparse_col)
+            )
+            train_dense_values = compact_dense_values(train_dense_values)
+
+        train_transformed = TransformedSet(user_indices,
+                                           item_indices,
+                                           labels,
+                                           train_sparse_indices,
+                                           train_dense_values,
+                                           train=True)
+
+        interaction_data = Interactions(user_indices, item_indices, labels)
+        data_info = cls._construct_data_info(
+            user_col, item_col, sparse_col, dense_col, multi_sparse_col,
+            user_indices, item_indices, train_sparse_indices,
+            train_dense_values, interaction_data, unique_feat, compact
+        )
         cls.train_called = True
         return train_transformed, data_info
 
+    @classmethod
+    def _construct_data_info(cls, user_col, item_col, sparse_col, dense_col,
+                             multi_sparse_col, user_indices, item_indices,
+                             train_sparse_indices, train_dense_values,
+                             interaction_data, unique_feat, compact=False):
+        all_sparse_col = (
+            merge_sparse_col(cls.sparse_col, cls.multi_sparse_col)
+            if cls.multi_sparse_col
+            else sparse_col
+        )
+
+        col_name_mapping = col_name2index(
+            user_col, item_col, all_sparse_col, cls.dense_col
+        )
+        user_sparse_col_indices = list(
+            col_name_mapping["user_sparse_col"].values()
+        )
+        user_dense_col_indices = list(
+            col_name_mapping["user_dense_col"].values()
+        )
+        item_sparse_col_indices = list(
+            col_name_mapping["item_sparse_col"].values()
+        )
+        item_dense_col_indices = list(
+            col_name_mapping["item_dense_col"].values()
+        )
+
+        (
+            user_sparse_unique,
+            user_dense_unique,
+            item_sparse_unique,
+            item_dense_unique
+        ) = construct_unique_feat(user_indices,
+                                  item_indices,
+                                  train_sparse_indices,
+                                  train_dense_values,
+                                  user_sparse_col_indices,
+                                  user_dense_col_indices,
+                                  item_sparse_col_indices,
+                                  item_dense_col_indices,
+                                  unique_feat)
+
+        sparse_offset = (
+            merge_offset(cls, cls.sparse_col, cls.multi_sparse_col)
+            if cls.sparse_col or cls.multi_sparse_col
+            else None
+        )
+        # sparse_unique_vals = (
+        #    dict(**cls.sparse_unique_vals, **cls.multi_sparse_unique_vals)
+        #    if cls.sparse_col or cls.multi_sparse_col
+        #    else None
+        # )
+        sparse_oov = (
+            get_oov_pos(cls, sparse_col, multi_sparse_col)
+            if cls.sparse_col or cls.multi_sparse_col
+            else None
+        )
+
+        multi_sparse_info = (
+            multi_sparse_combine_info(
+                cls, all_sparse_col, sparse_col, multi_sparse_col)
+            if cls.multi_sparse_col
+            else None
+        )
+        # multi_sparse_size = (
+        #    multi_sparse_true_size(train_data, multi_sparse_col, pad_val)
+        #    if cls.multi_sparse_col
+        #    else None
+        # )
+
+        if cls.multi_sparse_col:
+            multi_sparse_map = multi_sparse_col_map(multi_sparse_col)
+            col_name_mapping.update({"multi_sparse": multi_sparse_map})
+
+        data_info = DataInfo(col_name_mapping,
+                             interaction_data,
+                             user_sparse_unique,
+                             user_dense_unique,
+                             item_sparse_unique,
+                             item_dense_unique,
+                             user_indices,
+                             item_indices,
+                             cls.user_unique_vals,
+                             cls.item_unique_vals,
+                             cls.sparse_unique_vals,
+                             sparse_offset,
+                             sparse_oov,
+                             cls.multi_sparse_unique_vals,
+                             multi_sparse_info,
+                             compact,
+                             cls.dense_scaler)
+        return data_info
+
     @classmethod
     def build_evalset(cls, eval_data, revolution=False, data_info=None,
-                      shuffle=False, seed=42):
+                      shuffle=False, seed=42, compact=False, ragged=False):
         return cls.build_testset(eval_data, revolution, data_info,
-                                 shuffle, seed)
+                                 shuffle, seed, compact, ragged)
 
     @classmethod
     def build_testset(
@@ -618,7 +1014,9 @@ class DatasetFeat(Dataset):
             revolution=False,
             data_info=None,
             shuffle=False,
-            seed=42
+            seed=42,
+            compact=False,
+            ragged=False
     ):
         """Build transformed feat eval_data or test_data from original data.
 
@@ -637,6 +1035,12 @@ class DatasetFeat(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        compact : bool, optional
+            Whether to store feature matrices in the narrowest safe dtypes,
+            i.e. uint16 or int32 sparse indices and float32 dense values.
+        ragged : bool, optional
+            Whether to store multi_sparse columns as values plus offsets
+            without padding. Batches are padded again when they are indexed.
 
         Returns
         -------
@@ -664,8 +1068,11 @@ class DatasetFeat(Dataset):
 
             sparse_cols, multi_sparse_cols = recover_sparse_cols(data_info)
 
+            encode_sparse = (
+                merge_ragged_sparse_indices if ragged else merge_sparse_indices
+            )
             train_sparse_indices = (
-                merge_sparse_indices(
+                encode_sparse(
                     data_info, test_data, sparse_cols,
                     multi_sparse_cols, mode="test",
                     ordered=False
@@ -675,11 +1082,13 @@ class DatasetFeat(Dataset):
             )
 
             dense_cols = data_info.dense_col.name
-            train_dense_values = (
-                test_data[dense_cols].to_numpy()
-                if dense_cols
-                else None
-            )
+            if dense_cols and data_info.dense_scaler is not None:
+                train_dense_values = data_info.dense_scaler.transform_data(
+                    test_data)
+            elif dense_cols:
+                train_dense_values = test_data[dense_cols].to_numpy()
+            else:
+                train_dense_values = None
 
             if "label" in test_data.columns:
                 labels = test_data["label"].to_numpy(dtype=np.float32)
@@ -688,6 +1097,11 @@ class DatasetFeat(Dataset):
                 # create dummy labels for consistency
                 labels = np.zeros(len(test_data), dtype=np.float32)
 
+            if compact:
+                train_sparse_indices = compact_sparse_indices(
+                    train_sparse_indices, data_info.sparse_oov)
+                train_dense_values = compact_dense_values(train_dense_values)
+
             test_transformed = TransformedSet(user_indices,
                                               item_indices,
                                               labels,
@@ -705,8 +1119,11 @@ class DatasetFeat(Dataset):
                 test_data, cls.user_unique_vals, cls.item_unique_vals,
                 mode="test", ordered=False
             )
+            encode_sparse = (
+                merge_ragged_sparse_indices if ragged else merge_sparse_indices
+            )
             test_sparse_indices = (
-                merge_sparse_indices(
+                encode_sparse(
                     cls, test_data, cls.sparse_col,
                     cls.multi_sparse_col, mode="test",
                     ordered=False
@@ -714,9 +1131,12 @@ class DatasetFeat(Dataset):
                 if cls.sparse_col or cls.multi_sparse_col
                 else None
             )
-            test_dense_values = (
-                test_data[cls.dense_col].to_numpy() if cls.dense_col else None
-            )
+            if cls.dense_col and cls.dense_scaler is not None:
+                test_dense_values = cls.dense_scaler.transform_data(test_data)
+            elif cls.dense_col:
+                test_dense_values = test_data[cls.dense_col].to_numpy()
+            else:
+                test_dense_values = None
 
             if "label" in test_data.columns:
                 labels = test_data["label"].to_numpy(dtype=np.float32)
@@ -725,6 +1145,13 @@ class DatasetFeat(Dataset):
                 # create dummy labels for consistency
                 labels = np.zeros(len(test_data), dtype=np.float32)
 
+            if compact:
+                test_sparse_indices = compact_sparse_indices(
+                    test_sparse_indices,
+                    get_oov_pos(cls, cls.sparse_col, cls.multi_sparse_col)
+                )
+                test_dense_values = compact_dense_values(test_dense_values)
+
             test_transformed = TransformedSet(test_user_indices,
                                               test_item_indices,
                                               labels,
@@ -738,7 +1165,7 @@ class DatasetFeat(Dataset):
     def build_train_test(cls, train_data, test_data, user_col=None,
                          item_col=None, sparse_col=None, dense_col=None,
                          multi_sparse_col=None, shuffle=(False, False),
-                         seed=42):
+                         seed=42, compact=False, ragged=False):
         """Build transformed feat train_data and test_data from original data.
 
         Normally, `user` and `item` column will be transformed into
@@ -768,6 +1195,10 @@ class DatasetFeat(Dataset):
             Whether to fully shuffle data.
         seed: int, optional
             random seed.
+        compact : bool, optional
+            Whether to store feature matrices in the narrowest safe dtypes.
+        ragged : bool, optional
+            Whether to store multi_sparse columns without padding.
 
         Returns
         -------
@@ -780,8 +1211,22 @@ class DatasetFeat(Dataset):
             for training and predicting
         """
         trainset, data_info = cls.build_trainset(
-            train_data, user_col, item_col, sparse_col,
-            dense_col, multi_sparse_col, shuffle[0], seed=seed
+            train_data, user_col, item_col, sparse_col, dense_col,
+            multi_sparse_col, shuffle=shuffle[0], seed=seed, compact=compact,
+            ragged=ragged
         )
-        testset = cls.build_testset(test_data, shuffle[1], seed=seed)
+        testset = cls.build_testset(
+            test_data, shuffle=shuffle[1], seed=seed, compact=compact,
+            ragged=ragged)
         return trainset, testset, data_info
+
+
+def _with_derived_col(side_col, dense_scaler):
+    # derived dense columns belong to the same side as their source columns
+    if not side_col:
+        return side_col
+    derived_col = [
+        name for name, i, _ in dense_scaler.derived
+        if dense_scaler.dense_col[i] in side_col
+    ]
+    return list(side_col) + derived_col
@@ -82,6 +82,155 @@ def process_data(data, dense_col=None, normalizer="min_max",
     return data, dense_col_transformed
 
 
+class DenseScaler(object):
+    """Scale dense features with parameters fitted incrementally.
+
+    It is the streaming counterpart of :func:`process_data`. The scaler is
+    fitted with `partial_fit` over data chunks, then the fitted parameters
+    are plain arrays that can be persisted in `DataInfo` and applied to new
+    data in float32 without the training data.
+
+    Parameters
+    ----------
+    dense_col : list of str
+        List of dense feature column names.
+    normalizer : {"min_max", "standard"}, optional
+        Normalize method, only the ones supporting partial fitting.
+    transformer : list of str, optional
+        Extra columns derived from every scaled column, i.e. "log", "sqrt"
+        and "square". Columns with negative scaled values are skipped.
+        New values below the fitted minimum are clipped to it before
+        deriving, so the derived values are never NaN or -inf.
+    """
+
+    functions = {
+        "log": np.log1p,
+        "sqrt": np.sqrt,
+        "square": np.square
+    }
+
+    def __init__(self, dense_col, normalizer="min_max",
+                 transformer=("log", "sqrt", "square")):
+        if not isinstance(dense_col, list):
+            raise ValueError("dense_col must be a list...")
+        if normalizer.lower() == "min_max":
+            self.scaler = MinMaxScaler()
+        elif normalizer.lower() == "standard":
+            self.scaler = StandardScaler()
+        else:
+            raise ValueError(
+                "only min_max and standard normalizer support partial fitting")
+        self.dense_col = dense_col
+        self.normalizer = normalizer.lower()
+        self.transformer = list(transformer) if transformer else []
+        self.data_min = None
+        self.shift = None
+        self.scale = None
+        self.scaled_min = None
+        self.derived = None
+
+    def partial_fit(self, data):
+        values = data[self.dense_col].to_numpy(dtype=np.float64)
+        self.scaler.partial_fit(values)
+        chunk_min = values.min(axis=0)
+        self.data_min = (
+            chunk_min
+            if self.data_min is None
+            else np.minimum(self.data_min, chunk_min)
+        )
+        self.shift = self.scale = self.derived = None
+        return self
+
+    def _finalize(self):
+        # express both scalers as `(x - shift) * scale`, so the minimum
+        # of min_max scaling stays exactly zero in float32
+        if self.shift is None and self.normalizer == "min_max":
+            self.shift = self.scaler.data_min_
+            self.scale = self.scaler.scale_
+        elif self.shift is None:
+            self.shift = self.scaler.mean_
+            self.scale = 1.0 / self.scaler.scale_
+        self.scaled_min = (self.data_min - self.shift) * self.scale
+        self.derived = [
+            (col + "_" + name, i, name)
+            for i, col in enumerate(self.dense_col)
+            if self.scaled_min[i] >= 0.0
+            for name in self.transformer
+        ]
+
+    @property
+    def transformed_col(self):
+        """Scaled columns followed by the derived ones."""
+        if self.derived is None:
+            self._finalize()
+        return self.dense_col + [name for name, _, _ in self.derived]
+
+    def _scale(self, i, raw):
+        # scale in float64 and round to float32 only once
+        return (np.asarray(raw, dtype=np.float64) - self.shift[i]) * (
+            self.scale[i])
+
+    def transform(self, values):
+        """Transform a float32 matrix in place, whose first columns are the
+        raw dense values and the rest are filled with derived values."""
+        if self.derived is None:
+            self._finalize()
+        for i in range(len(self.dense_col)):
+            values[:, i] = self._scale(i, values[:, i])
+        return self._derive(values)
+
+    def _derive(self, values):
+        for j, (_, i, name) in enumerate(self.derived,
+                                         start=len(self.dense_col)):
+            np.maximum(values[:, i], self.scaled_min[i].astype(values.dtype),
+                       out=values[:, j])
+            self.functions[name](values[:, j], out=values[:, j])
+        return values
+
+    def transform_data(self, data):
+        """Transformed dense matrix of a DataFrame with all raw columns."""
+        values = np.empty((len(data), len(self.transformed_col)),
+                          dtype=np.float32)
+        for i, col in enumerate(self.dense_col):
+            values[:, i] = self._scale(i, data[col].to_numpy())
+        return self._derive(values)
+
+    def transform_columns(self, data):
+        """Transformed values of the columns that can be computed from the
+        raw columns in `data`, which can be a DataFrame or a dict."""
+        if self.derived is None:
+            self._finalize()
+        result = dict()
+        for i, col in enumerate(self.dense_col):
+            if col in data:
+                result[col] = self._scale(i, data[col]).astype(np.float32)
+        for col, i, name in self.derived:
+            if self.dense_col[i] in result:
+                result[col] = self.functions[name](np.maximum(
+                    result[self.dense_col[i]], np.float32(self.scaled_min[i])))
+        return result
+
+    def get_params(self):
+        if self.derived is None:
+            self._finalize()
+        return {
+            "dense_col": self.dense_col,
+            "normalizer": self.normalizer,
+            "transformer": self.transformer,
+            "data_min": self.data_min.tolist(),
+            "shift": self.shift.tolist(),
+            "scale": self.scale.tolist(),
+        }
+
+    @classmethod
+    def from_params(cls, params):
+        dense_scaler = cls(params["dense_col"], params["normalizer"],
+                           params["transformer"])
+        for name in ("data_min", "shift", "scale"):
+            setattr(dense_scaler, name, np.asarray(params[name]))
+        return dense_scaler
+
+
 def split_multi_value(data, multi_value_col, sep, max_len=None,
                       pad_val="missing", user_col=None, item_col=None):
     if max_len is not None:
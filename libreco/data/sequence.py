@@ -1,15 +1,18 @@
-from math import floor
-from random import random
 import numpy as np
 
 
+def _first_position(consumed_items, item):
+    # consumed items are numpy arrays, which don't have `list.index`
+    return int(np.flatnonzero(consumed_items == item)[0])
+
+
 def sparse_user_interacted(user_indices, item_indices, user_consumed,
                            mode=None, num=None):
     for j, (u, i) in enumerate(zip(user_indices, item_indices)):
         consumed_items = user_consumed[u]
         interacted_indices = []
         interacted_items = []
-        position = consumed_items.index(i)
+        position = _first_position(consumed_items, i)
         if position == 0:  # first item, no history interaction
             continue
         elif position < num:
@@ -57,63 +60,75 @@ def sparse_user_last_interacted(user_indices, user_consumed, recent_num=10):
     return indices, interacted_items
 
 
-def sample_item_with_tolerance(num, consumed_items, consumed_len, tolerance=5):
-    assert num > tolerance
-    sampled = []
-    first_len = num - tolerance
-    while len(sampled) < first_len:
-        i = floor(random() * consumed_len)
-        if consumed_items[i] not in sampled:
-            sampled.append(consumed_items[i])
-    for _ in range(tolerance):
-        i = floor(random() * consumed_len)
-        sampled.append(consumed_items[i])
-    return sampled
+def sample_without_replacement(population_sizes, num, rng=np.random):
+    """Sample `num` distinct positions in `[0, n)` for every `n` in
+    `population_sizes`, using Floyd's algorithm vectorized over rows."""
+    population_sizes = np.asarray(population_sizes, dtype=np.int64)
+    size = len(population_sizes)
+    chosen = np.empty((size, num), dtype=np.int64)
+    for k in range(num):
+        upper = population_sizes - num + k
+        candidate = (rng.random_sample(size) * (upper + 1)).astype(np.int64)
+        duplicate = (chosen[:, :k] == candidate[:, None]).any(axis=1)
+        chosen[:, k] = np.where(duplicate, upper, candidate)
+    # Floyd's algorithm gives a uniform subset but not a uniform order
+    order = np.argsort(rng.random_sample((size, num)), axis=1)
+    return np.take_along_axis(chosen, order, axis=1)
 
 
 def user_interacted_seq(user_indices, item_indices, user_consumed, pad_index,
-                        mode=None, num=None, user_consumed_set=None):
-    batch_size = len(user_indices)
-    batch_interacted = np.full((batch_size, num), pad_index, dtype=np.int32)
-    batch_interacted_len = []
-    for j, (u, i) in enumerate(zip(user_indices, item_indices)):
-        consumed_items = user_consumed[u]
-        consumed_len = len(consumed_items)
-        consumed_set = user_consumed_set[u]
-        # If i is a negative item, then random sample some items
-        # from user's past interacted items.
-        # TODO: sample sequence from user past interactions
-        if i not in consumed_set:
-            if consumed_len >= num:
-                # `np.random.choice` is too slow,
-                # so here we use a custom sample function with
-                # some tolerance of duplicate items
-                chosen_items = sample_item_with_tolerance(
-                    num, consumed_items, consumed_len, 5)
-                batch_interacted[j] = chosen_items
-                batch_interacted_len.append(float(num))
-            else:
-                batch_interacted[j, :consumed_len] = consumed_items
-                batch_interacted_len.append(float(consumed_len))
-        else:
-            position = consumed_items.index(i)
-            if position == 0:
-                # first item, no historical interaction,
-                # assign to pad_index by default, and length is 1.
-                batch_interacted_len.append(1.0)
-            elif position < num:
-                batch_interacted[j, :position] = consumed_items[:position]
-                batch_interacted_len.append(float(position))
-            elif position >= num and mode == "recent":
-                start_index = position - num
-                batch_interacted[j] = consumed_items[start_index: position]
-                batch_interacted_len.append(float(num))
-            elif position >= num and mode == "random":
-                chosen_items = np.random.choice(consumed_items, num,
-                                                replace=False)
-                batch_interacted[j] = chosen_items
-                batch_interacted_len.append(float(num))
-
+                        mode=None, num=None, positions=None):
+    """Historical interacted items of every user before the given item.
+
+    Parameters
+    ----------
+    user_indices : numpy.ndarray
+    item_indices : numpy.ndarray
+    user_consumed : `ConsumedCSR`
+    pad_index : int
+        Index used to pad sequences shorter than `num`.
+    mode : str, optional
+        Either "recent" or "random".
+    num : int, optional
+        Maximum sequence length.
+    positions : numpy.ndarray, optional
+        First position of every item in the user's consumed sequence, -1 for
+        items not consumed, see `TransformedSet.interaction_positions`.
+        Computed on the fly if not provided.
+    """
+    user_indices = np.asarray(user_indices, dtype=np.int64)
+    if positions is None:
+        positions = user_consumed.first_positions(user_indices, item_indices)
+    starts = user_consumed.indptr[user_indices]
+    consumed_len = user_consumed.indptr[user_indices + 1] - starts
+
+    # If item is a negative item, then random sample some items
+    # from user's past interacted items.
+    # TODO: sample sequence from user past interactions
+    negative = positions < 0
+    history_len = np.where(negative, consumed_len, positions)
+    seq_len = np.minimum(history_len, num)
+    if mode == "random":
+        use_sampling = history_len >= num
+    else:
+        use_sampling = negative & (consumed_len >= num)
+
+    # contiguous window that ends right before the item
+    offsets = (history_len - seq_len)[:, None] + np.arange(num)
+    sampled_rows = np.flatnonzero(use_sampling)
+    if len(sampled_rows) > 0:
+        offsets[sampled_rows] = sample_without_replacement(
+            consumed_len[sampled_rows], num)
+
+    valid = np.arange(num) < seq_len[:, None]
+    gather_indices = np.where(valid, starts[:, None] + offsets, 0)
+    batch_interacted = np.where(
+        valid, user_consumed.indices[gather_indices], pad_index
+    ).astype(np.int32)
+    # first item has no historical interaction,
+    # assign to pad_index by default, and length is 1.
+    batch_interacted_len = np.where(
+        ~negative & (positions == 0), 1, seq_len).astype(np.float32)
     return batch_interacted, batch_interacted_len
 
 
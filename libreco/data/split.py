@@ -1,27 +1,42 @@
 import math
 import numpy as np
-from sklearn.model_selection import train_test_split
 
 
 def random_split(data, test_size=None, multi_ratios=None, shuffle=True,
                  filter_unknown=True, pad_unknown=False, seed=42):
     ratios, n_splits = _check_and_convert_ratio(test_size, multi_ratios)
-    if not isinstance(ratios, list):
-        ratios = list(ratios)
+    # copy to avoid modifying the `multi_ratios` passed in
+    ratios = list(ratios)
 
-    # if we want to split data in multiple folds,
-    # then iteratively split data based on modified ratios
-    train_data = data.copy()
-    split_data_all = []
+    # fold sizes are the same as splitting the remaining data iteratively,
+    # but rows are only permuted once and every fold is taken only once
+    fold_sizes = []
+    n_remain = len(data)
     for i in range(n_splits - 1):
         size = ratios.pop(-1)
         ratios = [r / math.fsum(ratios) for r in ratios]
-        train_data, split_data = train_test_split(train_data,
-                                                  test_size=size,
-                                                  shuffle=shuffle,
-                                                  random_state=seed)
-        split_data_all.insert(0, split_data)
-    split_data_all.insert(0, train_data)  # insert final fold of data
+        n_test = math.ceil(size * n_remain)
+        fold_sizes.insert(0, n_test)
+        n_remain -= n_test
+    fold_sizes.insert(0, n_remain)
+    if n_remain <= 0:
+        raise ValueError(
+            f"ratios are too small for data of size {len(data)}, "
+            f"got fold sizes {fold_sizes}"
+        )
+
+    bounds = np.cumsum([0] + fold_sizes)
+    if shuffle:
+        indices = np.random.RandomState(seed).permutation(len(data))
+        split_data_all = [
+            data.iloc[indices[start:end]]
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+    else:
+        split_data_all = [
+            data.iloc[start:end]
+            for start, end in zip(bounds[:-1], bounds[1:])
+        ]
 
     if filter_unknown:
         split_data_all = _filter_unknown_user_item(split_data_all)
@@ -32,24 +47,15 @@ def random_split(data, test_size=None, multi_ratios=None, shuffle=True,
 
 def _filter_unknown_user_item(data_list):
     train_data = data_list[0]
-    unique_values = dict(user=set(train_data.user.tolist()),
-                         item=set(train_data.item.tolist()))
+    unique_users = train_data.user.unique()
+    unique_items = train_data.item.unique()
 
     split_data_all = [train_data]
     for i, test_data in enumerate(data_list[1:], start=1):
-        # print(f"Non_train_data {i} size before filtering: {len(test_data)}")
-        out_of_bounds_row_indices = set()
-        for col in ["user", "item"]:
-            for j, val in enumerate(test_data[col]):
-                if val not in unique_values[col]:
-                    out_of_bounds_row_indices.add(j)
-
-        mask = np.arange(len(test_data))
-        test_data_clean = test_data[~np.isin(
-            mask, list(out_of_bounds_row_indices))]
-        split_data_all.append(test_data_clean)
-        # print(f"Non_train_data {i} size after filtering: "
-        #      f"{len(test_data_clean)}")
+        # hash based membership test of all rows at once
+        known_mask = (test_data.user.isin(unique_users).to_numpy()
+                      & test_data.item.isin(unique_items).to_numpy())
+        split_data_all.append(test_data[known_mask])
     return split_data_all
 
 
@@ -75,27 +81,23 @@ def split_by_ratio(data, order=True, shuffle=False, test_size=None,
     assert ("user" in data.columns), "data must contains user column"
     ratios, n_splits = _check_and_convert_ratio(test_size, multi_ratios)
 
-    n_users = data.user.nunique()
     user_indices = data.user.to_numpy()
-    user_split_indices = _groupby_user(user_indices, order)
-
-    cum_ratios = np.cumsum(ratios).tolist()[:-1]
-    split_indices_all = [[] for _ in range(n_splits)]
-    for u in range(n_users):
-        u_data = user_split_indices[u]
-        u_data_len = len(u_data)
-        if u_data_len <= 3:   # keep items of rare users in trainset
-            split_indices_all[0].extend(u_data)
-        else:
-            u_split_data = np.split(u_data, [
-                round(cum * u_data_len) for cum in cum_ratios
-            ])
-            for i in range(n_splits):
-                split_indices_all[i].extend(list(u_split_data[i]))
+    sorted_indices, ranks, counts = _rank_within_user(user_indices, order)
+
+    # a row goes to the fold whose cumulative boundary it has passed,
+    # boundaries are rounded the same way as python `round`
+    cum_ratios = np.cumsum(ratios)[:-1]
+    folds = np.zeros(len(ranks), dtype=np.int64)
+    for cum in cum_ratios:
+        folds += ranks >= np.round(cum * counts)
+    folds[counts <= 3] = 0   # keep items of rare users in trainset
+    split_indices_all = [sorted_indices[folds == i] for i in range(n_splits)]
 
     if shuffle:
-        split_data_all = tuple(
-            np.random.permutation(data[idx]) for idx in split_indices_all)
+        split_data_all = list(
+            data.iloc[np.random.permutation(idx)]
+            for idx in split_indices_all
+        )
     else:
         split_data_all = list(data.iloc[idx] for idx in split_indices_all)
 
@@ -113,24 +115,14 @@ def split_by_num(data, order=True, shuffle=False, test_size=1,
     assert isinstance(test_size, int), "test_size must be int value"
     assert 0 < test_size < len(data), "test_size must be in (0, len(data))"
 
-    n_users = data.user.nunique()
     user_indices = data.user.to_numpy()
-    user_split_indices = _groupby_user(user_indices, order)
-
-    train_indices = []
-    test_indices = []
-    for u in range(n_users):
-        u_data = user_split_indices[u]
-        u_data_len = len(u_data)
-        if u_data_len <= 3:   # keep items of rare users in trainset
-            train_indices.extend(u_data)
-        elif u_data_len <= test_size:
-            train_indices.extend(u_data[:-1])
-            test_indices.extend(u_data[-1:])
-        else:
-            k = test_size
-            train_indices.extend(u_data[:(u_data_len-k)])
-            test_indices.extend(u_data[-k:])
+    sorted_indices, ranks, counts = _rank_within_user(user_indices, order)
+
+    # users with no more than `test_size` items only leave the last one
+    n_test = np.where(counts <= test_size, 1, test_size)
+    test_mask = (counts > 3) & (ranks >= counts - n_test)
+    train_indices = sorted_indices[~test_mask]
+    test_indices = sorted_indices[test_mask]
 
     if shuffle:
         train_indices = np.random.permutation(train_indices)
@@ -167,14 +159,23 @@ def split_by_num_chrono(data, order=True, shuffle=False, test_size=1, seed=42):
     return split_by_num(**locals())
 
 
-def _groupby_user(user_indices, order):
+def _rank_within_user(user_indices, order):
+    """Group rows by user with one sort.
+
+    Returns the row indices grouped by user, the rank of every row within
+    its user and the number of rows of that user, both aligned with the
+    grouped indices.
+    """
     sort_kind = "mergesort" if order else "quicksort"
     users, user_position, user_counts = np.unique(user_indices,
                                                   return_inverse=True,
                                                   return_counts=True)
-    user_split_indices = np.split(np.argsort(user_position, kind=sort_kind),
-                                  np.cumsum(user_counts)[:-1])
-    return user_split_indices
+    sorted_indices = np.argsort(user_position, kind=sort_kind)
+    user_starts = np.cumsum(user_counts) - user_counts
+    counts = np.repeat(user_counts, user_counts)
+    ranks = np.arange(len(sorted_indices)) - np.repeat(user_starts,
+                                                       user_counts)
+    return sorted_indices, ranks, counts
 
 
 def _check_and_convert_ratio(test_size, multi_ratios):
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def iter_data_chunks(source, chunk_size=1_000_000, **read_kwargs):
+    """Yield `pandas.DataFrame` chunks from a data source.
+
+    Parameters
+    ----------
+    source : str or callable or list of `pandas.DataFrame`
+        A csv or parquet file path, a callable that returns a fresh iterable
+        of DataFrame chunks, or a list of DataFrame chunks. Since the data
+        will be traversed twice, a one-shot iterator is not allowed.
+    chunk_size : int, optional
+        Number of rows in each chunk when reading from a file.
+    read_kwargs : dict, optional
+        Extra arguments passed to `pandas.read_csv`.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if path.endswith((".parquet", ".pq")):
+            try:
+                import pyarrow.parquet as pq
+            except (ImportError, ModuleNotFoundError):
+                raise ImportError(
+                    "reading parquet file in chunks requires `pyarrow`")
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(path, chunksize=chunk_size, **read_kwargs)
+    elif callable(source):
+        yield from source()
+    elif isinstance(source, (list, tuple)):
+        yield from source
+    else:
+        raise TypeError(
+            "source must be a file path, a callable that returns "
+            "an iterable of DataFrame chunks, or a list of DataFrames"
+        )
+
+
+def collect_chunk_vocab(chunks, sparse_col=None, multi_sparse_col=None,
+                        pad_val="missing", dense_scaler=None):
+    """First pass, collect the sorted unique values of every column,
+    and fit the dense scaler if provided."""
+    n_rows = 0
+    user_unique_vals = None
+    item_unique_vals = None
+    sparse_unique_vals = dict()
+    multi_sparse_unique_vals = dict()
+    if multi_sparse_col and not isinstance(pad_val, (list, tuple)):
+        pad_val = [pad_val] * len(multi_sparse_col)
+
+    for chunk in chunks:
+        n_rows += len(chunk)
+        user_unique_vals = _merge_unique(user_unique_vals, chunk["user"])
+        item_unique_vals = _merge_unique(item_unique_vals, chunk["item"])
+        if sparse_col:
+            for col in sparse_col:
+                sparse_unique_vals[col] = _merge_unique(
+                    sparse_unique_vals.get(col), chunk[col])
+        if multi_sparse_col:
+            for field in multi_sparse_col:
+                multi_sparse_unique_vals[field[0]] = _merge_unique(
+                    multi_sparse_unique_vals.get(field[0]),
+                    chunk[field].to_numpy().ravel()
+                )
+        if dense_scaler is not None:
+            dense_scaler.partial_fit(chunk)
+
+    if multi_sparse_col:
+        assert len(multi_sparse_col) == len(pad_val), (
+            "length of multi_sparse_col and pad_val doesn't match")
+        for i, field in enumerate(multi_sparse_col):
+            unique_vals = multi_sparse_unique_vals[field[0]]
+            multi_sparse_unique_vals[field[0]] = (
+                unique_vals[unique_vals != pad_val[i]].tolist()
+            )
+
+    return (
+        n_rows,
+        user_unique_vals,
+        item_unique_vals,
+        sparse_unique_vals,
+        multi_sparse_unique_vals
+    )
+
+
+def _merge_unique(unique_vals, column):
+    chunk_unique = np.sort(pd.unique(column))
+    if unique_vals is None:
+        return chunk_unique
+    return np.union1d(unique_vals, chunk_unique)
+
+
+def interaction_frame(user_indices, item_indices, labels,
+                      user_unique_vals, item_unique_vals):
+    """Interaction data stored as categorical codes instead of raw ids,
+    so it costs about the same memory as the encoded indices."""
+    return pd.DataFrame({
+        "user": pd.Categorical.from_codes(user_indices, user_unique_vals),
+        "item": pd.Categorical.from_codes(item_indices, item_unique_vals),
+        "label": labels
+    })
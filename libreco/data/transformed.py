@@ -1,11 +1,93 @@
+import json
+import os
 import numpy as np
 from scipy.sparse import csr_matrix
 from .data_info import DataInfo
-from ..feature import interaction_consumed
-from ..utils.sampling import NegativeSampling
+from ..feature import interaction_consumed, ConsumedCSR, RaggedSparseIndices
+from ..utils.sampling import NegativeSampling, merge_user_item_features
+
+
+class LazyColumn(object):
+    """Read-only column whose rows are computed when indexed.
+
+    Indexing with a slice, an integer or an index array returns a numpy
+    array, so it can be used in place of an array by the data generators,
+    which gather every batch with an array of row numbers. Only the
+    requested rows are computed. `take` returns another `LazyColumn` that
+    stores the selected row numbers.
+
+    Parameters
+    ----------
+    gather : callable
+        Function that maps an array of row numbers to the row values.
+    length : int
+        Number of rows.
+    rows : numpy.ndarray, optional
+        Row numbers of the underlying column, identity if not provided.
+    """
+
+    def __init__(self, gather, length, rows=None):
+        self._gather = gather
+        self._length = length
+        self._rows = rows
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def shape(self):
+        return (self._length,) + self[:1].shape[1:]
+
+    @property
+    def dtype(self):
+        return self[:1].dtype
+
+    def _row_numbers(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return np.arange(*index.indices(self._length))
+        rows = np.asarray(index)
+        if rows.dtype == np.bool_:
+            if rows.shape != (self._length,):
+                raise IndexError("boolean index does not match column length")
+            return np.flatnonzero(rows)
+        if rows.size and (rows.min() < -self._length
+                          or rows.max() >= self._length):
+            raise IndexError(
+                f"index out of bounds for column of length {self._length}")
+        return rows % self._length if rows.size else rows.astype(np.intp)
+
+    def __getitem__(self, index):
+        rows = self._row_numbers(index)
+        if np.ndim(rows) == 0:
+            return self._gather(np.asarray([rows]))[0]
+        return self._gather(rows)
+
+    def take(self, indices, axis=0):
+        assert axis == 0, "LazyColumn only supports taking rows"
+        return LazyColumn(self._gather, len(indices),
+                          self._row_numbers(np.asarray(indices)))
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
 
 
 class TransformedSet(object):
+    _array_names = (
+        "_user_indices",
+        "_item_indices",
+        "_labels",
+        "_sparse_indices",
+        "_dense_values",
+        "user_indices_orig",
+        "item_indices_orig",
+        "labels_orig",
+        "sparse_indices_orig",
+        "dense_values_orig",
+    )
+
     def __init__(
             self,
             user_indices=None,
@@ -34,20 +116,38 @@ class TransformedSet(object):
         self.labels_orig = None
         self.sparse_indices_orig = None
         self.dense_values_orig = None
+        self._positions = None
+        self._lazy_sampling = None
 
     def build_negative_samples(self, data_info, num_neg=1,
-                               item_gen_mode="random", seed=42):
+                               item_gen_mode="random", seed=42,
+                               popular_power=1.0, lazy=False):
+        """Add sampled negative items after every positive item.
+
+        If `lazy` is True, only the sampled item indices are stored, and the
+        repeated user indices, labels and feature matrices become `LazyColumn`
+        objects, which gather rows from the original data and
+        `data_info.item_*_unique` when they are indexed.
+        """
         self.has_sampled = True
+        self._positions = None
+        self._lazy_sampling = None
         self.user_indices_orig = self._user_indices
         self.item_indices_orig = self._item_indices
         self.labels_orig = self._labels
         self.sparse_indices_orig = self._sparse_indices
         self.dense_values_orig = self._dense_values
 
-        self._build_negative_samples(data_info, num_neg, item_gen_mode, seed)
+        if lazy:
+            self._build_lazy_negative_samples(
+                data_info, num_neg, item_gen_mode, seed, popular_power)
+        else:
+            self._build_negative_samples(
+                data_info, num_neg, item_gen_mode, seed, popular_power)
 
     def _build_negative_samples(self, data_info, num_neg=1,
-                                item_gen_mode="random", seed=42):
+                                item_gen_mode="random", seed=42,
+                                popular_power=1.0):
         sparse_part = False if self.sparse_indices is None else True
         dense_part = False if self.dense_values is None else True
         neg = NegativeSampling(self, data_info, num_neg,
@@ -59,7 +159,92 @@ class TransformedSet(object):
             self._labels,
             self._sparse_indices,
             self._dense_values
-        ) = neg.generate_all(seed=seed, item_gen_mode=item_gen_mode)
+        ) = neg.generate_all(seed=seed, item_gen_mode=item_gen_mode,
+                             popular_power=popular_power)
+
+    def _build_lazy_negative_samples(self, data_info, num_neg=1,
+                                     item_gen_mode="random", seed=42,
+                                     popular_power=1.0):
+        neg = NegativeSampling(self, data_info, num_neg)
+        sampled_items = neg.sample_items(seed, item_gen_mode, popular_power)
+        self._set_lazy_columns(data_info, sampled_items, num_neg)
+
+    def _set_lazy_columns(self, data_info, sampled_items, num_neg):
+        # kept for saving, the columns can be rebuilt from them
+        self._lazy_sampling = (sampled_items, num_neg)
+        factor = num_neg + 1
+        length = len(sampled_items)
+        user_indices = self.user_indices_orig
+        sparse_indices = self.sparse_indices_orig
+        dense_values = self.dense_values_orig
+
+        self._user_indices = LazyColumn(
+            lambda rows: user_indices[rows // factor], length)
+        self._item_indices = LazyColumn(
+            lambda rows: sampled_items[rows], length)
+        self._labels = LazyColumn(
+            lambda rows: (rows % factor == 0).astype(np.float32), length)
+
+        def gather_sparse(rows):
+            return merge_user_item_features(
+                sparse_indices[rows // factor],
+                data_info.item_sparse_unique,
+                sampled_items[rows],
+                data_info.user_sparse_col.index,
+                data_info.item_sparse_col.index
+            )
+
+        def gather_dense(rows):
+            return merge_user_item_features(
+                dense_values[rows // factor],
+                data_info.item_dense_unique,
+                sampled_items[rows],
+                data_info.user_dense_col.index,
+                data_info.item_dense_col.index
+            )
+
+        self._sparse_indices = (
+            LazyColumn(gather_sparse, length)
+            if sparse_indices is not None
+            else None
+        )
+        self._dense_values = (
+            LazyColumn(gather_dense, length)
+            if dense_values is not None
+            else None
+        )
+
+    def interaction_positions(self, user_consumed, orig=False):
+        """First position of every item in its user's consumed sequence.
+
+        Computed once and cached, so the sequence data generators can gather
+        historical items without searching every sequence. Items not consumed
+        by the user, e.g. sampled negative items, get -1.
+
+        Parameters
+        ----------
+        user_consumed : `ConsumedCSR`
+            Consumed items of every user, normally `data_info.user_consumed`.
+        orig : bool, optional
+            Whether to use the original data before negative sampling.
+        """
+        cached = getattr(self, "_positions", None)
+        if (
+            cached is not None
+            and cached[0] is user_consumed
+            and cached[1] == orig
+        ):
+            return cached[2]
+
+        if orig and self.has_sampled:
+            user_indices = self.user_indices_orig
+            item_indices = self.item_indices_orig
+        else:
+            user_indices = self.user_indices
+            item_indices = self.item_indices
+        positions = user_consumed.first_positions(user_indices, item_indices)
+        self._positions = (user_consumed, orig, positions)
+        return positions
 
     def __len__(self):
         return len(self.labels)
@@ -109,3 +294,138 @@ class TransformedSet(object):
     @property
     def sparse_interaction(self):
         return self._sparse_interaction
+
+    def save(self, path):
+        """Save all arrays as raw `.npy` files, which can be memory-mapped
+        when loading.
+
+        Names of the saved arrays are recorded in `transformed_meta.json`,
+        so stale files in the folder are ignored when loading. Lazy negative
+        samples are saved as the sampled items, and the lazy columns are
+        rebuilt when loading.
+        """
+        if not os.path.isdir(path):
+            print(f"file folder {path} doesn't exists, creating a new one...")
+            os.makedirs(path)
+
+        lazy_sampling = getattr(self, "_lazy_sampling", None)
+        arrays = dict()
+        for name in self._array_names:
+            if lazy_sampling is not None and not name.endswith("_orig"):
+                continue
+            arrays[name.lstrip("_")] = getattr(self, name)
+        if lazy_sampling is not None:
+            arrays["sampled_items"] = lazy_sampling[0]
+
+        sparse_interaction = getattr(self, "_sparse_interaction", None)
+        if sparse_interaction is not None:
+            for attr in ("data", "indices", "indptr"):
+                arrays[f"sparse_interaction_{attr}"] = getattr(
+                    sparse_interaction, attr)
+        user_consumed = getattr(self, "user_consumed", None)
+        if user_consumed is not None:
+            arrays["user_consumed_indptr"] = user_consumed.indptr
+            arrays["user_consumed_indices"] = user_consumed.indices
+
+        # ragged sparse indices are saved as their component arrays
+        ragged = dict()
+        for name, array in list(arrays.items()):
+            if isinstance(array, RaggedSparseIndices):
+                parts, ragged[name] = array.to_arrays()
+                del arrays[name]
+                for part, part_array in parts.items():
+                    arrays[f"{name}_ragged_{part}"] = part_array
+
+        saved = []
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(os.path.join(path, f"{name}.npy"), array)
+                saved.append(name)
+
+        meta = {
+            "arrays": saved,
+            "ragged": ragged,
+            "has_sampled": self.has_sampled,
+            "lazy_num_neg": (
+                lazy_sampling[1] if lazy_sampling is not None else None
+            ),
+            "sparse_interaction_shape": (
+                list(sparse_interaction.shape)
+                if sparse_interaction is not None
+                else None
+            ),
+            "user_consumed_n_cols": (
+                user_consumed.n_cols if user_consumed is not None else None
+            ),
+        }
+        with open(os.path.join(path, "transformed_meta.json"), "w") as f:
+            json.dump(meta, f, separators=(",", ":"), indent=4)
+
+    @classmethod
+    def load(cls, path, mmap=True, data_info=None):
+        """Load arrays saved by `save`. If `mmap` is True, arrays are opened
+        with `np.load(mmap_mode="r")`, so they are read-only and can be
+        shared among processes through the page cache.
+
+        `data_info` is needed to rebuild lazy negative samples with sparse or
+        dense features.
+        """
+        if not os.path.exists(path):
+            raise OSError(f"file folder {path} doesn't exists...")
+
+        with open(os.path.join(path, "transformed_meta.json"), "r") as f:
+            meta = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        saved = set(meta["arrays"])
+
+        def load_array(name):
+            if name not in saved:
+                return None
+            return np.load(os.path.join(path, f"{name}.npy"),
+                           mmap_mode=mmap_mode)
+
+        def load_ragged(name):
+            ragged_meta = meta.get("ragged", {}).get(name)
+            if ragged_meta is None:
+                return load_array(name)
+            prefix = f"{name}_ragged_"
+            parts = {
+                part[len(prefix):]: load_array(part)
+                for part in saved if part.startswith(prefix)
+            }
+            return RaggedSparseIndices.from_arrays(parts, ragged_meta)
+
+        transformed = cls.__new__(cls)
+        for name in cls._array_names:
+            setattr(transformed, name, load_ragged(name.lstrip("_")))
+        transformed.has_sampled = meta["has_sampled"]
+        transformed._positions = None
+        transformed._lazy_sampling = None
+
+        if meta["lazy_num_neg"] is not None:
+            if data_info is None and (
+                transformed.sparse_indices_orig is not None
+                or transformed.dense_values_orig is not None
+            ):
+                raise ValueError(
+                    "data_info is needed to load lazy negative samples "
+                    "with features")
+            transformed._set_lazy_columns(
+                data_info, load_array("sampled_items"), meta["lazy_num_neg"])
+
+        if meta["sparse_interaction_shape"] is not None:
+            transformed._sparse_interaction = csr_matrix(
+                (load_array("sparse_interaction_data"),
+                 load_array("sparse_interaction_indices"),
+                 load_array("sparse_interaction_indptr")),
+                shape=tuple(meta["sparse_interaction_shape"]),
+                copy=False
+            )
+        if meta["user_consumed_n_cols"] is not None:
+            transformed.user_consumed = ConsumedCSR(
+                load_array("user_consumed_indptr"),
+                load_array("user_consumed_indices"),
+                meta["user_consumed_n_cols"]
+            )
+        return transformed
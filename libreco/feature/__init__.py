@@ -1,6 +1,9 @@
 from .column import (
     get_user_item_sparse_indices,
+    compact_sparse_indices,
+    compact_dense_values,
     merge_sparse_indices,
+    merge_ragged_sparse_indices,
     merge_sparse_col,
     merge_offset,
     get_oov_pos,
@@ -9,8 +12,12 @@ from .column import (
     multi_sparse_true_size,
     multi_sparse_col_map,
     recover_sparse_cols,
+    unordered_sparse_indices,
 )
 from .column_mapping import col_name2index
+from .consumed import ConsumedCSR
+from .hashing import HashBuckets
+from .ragged import RaggedSparseIndices
 from .unique_features import (
     construct_unique_feat,
     get_predict_indices_and_values,
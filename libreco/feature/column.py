@@ -1,7 +1,8 @@
-from array import array
-from collections import defaultdict
 import itertools
 import numpy as np
+from .consumed import ConsumedCSR
+from .hashing import HashBuckets
+from .ragged import RaggedSparseIndices
 
 
 def get_user_item_sparse_indices(data, user_unique_vals, item_unique_vals,
@@ -56,6 +57,43 @@ def merge_sparse_indices(data_class, data, sparse_col, multi_sparse_col, mode,
         return multi_sparse_indices + multi_sparse_offset
 
 
+def merge_ragged_sparse_indices(data_class, data, sparse_col,
+                                multi_sparse_col, mode, ordered):
+    """Same indices as `merge_sparse_indices`, but multi_sparse fields are
+    stored as a `RaggedSparseIndices` without padding. Fields are encoded
+    one at a time, so only one padded field exists at a time."""
+    if not multi_sparse_col:
+        return merge_sparse_indices(data_class, data, sparse_col,
+                                    multi_sparse_col, mode, ordered)
+
+    if sparse_col:
+        sparse_indices = get_sparse_indices_matrix(
+            data_class, data, sparse_col, mode, ordered
+        )
+        sparse_offset = get_sparse_offset(data_class, sparse_col)
+        sparse_indices = sparse_indices + sparse_offset[:-1]
+        last_offset = sparse_offset[-1]
+    else:
+        sparse_indices = None
+        last_offset = 0
+
+    multi_sparse_offset = get_multi_sparse_offset(
+        data_class, multi_sparse_col
+    ) + last_offset
+    field_oov = multi_sparse_oov(
+        data_class, multi_sparse_col, extend=False
+    ) + last_offset
+    field_start = np.cumsum([0] + [len(field) for field in multi_sparse_col])
+    field_indices = (
+        get_multi_sparse_indices_matrix(
+            data_class, data, [field], mode, ordered
+        ) + multi_sparse_offset[field_start[i]]
+        for i, field in enumerate(multi_sparse_col)
+    )
+    return RaggedSparseIndices.from_fields(
+        sparse_indices, field_indices, field_oov)
+
+
 def get_sparse_indices_matrix(data_class, data, sparse_col, mode, ordered):
     n_samples, n_features = len(data), len(sparse_col)
     sparse_indices = np.zeros((n_samples, n_features), dtype=np.int32)
@@ -210,6 +248,8 @@ def column_sparse_indices(values, unique, mode="train",
                           ordered=True, multi_sparse=False):
     if mode not in ("train", "test"):
         raise ValueError("mode must either be \"train\" or \"test\" ")
+    if isinstance(unique, HashBuckets):
+        return unique.encode(values)
     if ordered:
         if mode == "test" or multi_sparse:
             not_in_mask = check_unknown(values, unique)
@@ -218,22 +258,83 @@ def column_sparse_indices(values, unique, mode="train",
         else:
             col_indices = np.searchsorted(unique, values)
     else:
-        map_vals = dict(zip(unique, range(len(unique))))
-        oov_val = len(unique)
+        # unique values are no longer sorted after revolution expanding,
+        # so search in the sorted view and map back through the permutation
+        try:
+            col_indices, not_in_mask = unordered_sparse_indices(values, unique)
+        except TypeError:
+            # values not comparable with each other, e.g. None in a str
+            # column, fall back to the hash lookup
+            map_vals = dict(zip(unique, range(len(unique))))
+            col_indices = np.array(
+                [map_vals.get(v, -1) for v in np.asarray(values).tolist()],
+                dtype=np.int64
+            )
+            not_in_mask = col_indices == -1
         if mode == "test" or multi_sparse:
-            col_indices = np.array([map_vals[v] if v in map_vals else oov_val
-                                    for v in values])
-        else:
-            col_indices = np.array([map_vals[v] for v in values])
+            col_indices[not_in_mask] = len(unique)
+        elif np.any(not_in_mask):
+            raise KeyError(
+                f"unknown values in train data: {values[not_in_mask][:5]}"
+            )
     return col_indices
 
 
-def interaction_consumed(user_indices, item_indices):
-    user_consumed = defaultdict(lambda: array("I"))
-    item_consumed = defaultdict(lambda: array("I"))
-    for u, i in zip(user_indices, item_indices):
-        user_consumed[u].append(i)
-        item_consumed[i].append(u)
+def unordered_sparse_indices(values, unique, sort_perm=None):
+    """Vectorized lookup of `values` in an unsorted `unique` array.
+
+    Returns the positions of values in `unique` and a mask of the values
+    that don't exist. `sort_perm` is the stable argsort of `unique`, which
+    can be passed in to avoid recomputing it for the same unique values.
+    """
+    values = np.asarray(values)
+    unique = np.asarray(unique)
+    if len(unique) == 0:
+        return (np.zeros(len(values), dtype=np.int64),
+                np.ones(len(values), dtype=bool))
+    if sort_perm is None:
+        sort_perm = np.argsort(unique, kind="mergesort")
+    sorted_unique = unique[sort_perm]
+    pos = np.searchsorted(sorted_unique, values)
+    pos[pos == len(unique)] = 0
+    not_in_mask = sorted_unique[pos] != values
+    col_indices = sort_perm[pos]
+    return col_indices, not_in_mask
+
+
+def compact_int_dtype(size):
+    """Narrowest integer type that can hold indices in `[0, size)`.
+
+    The upper bound is kept exclusive so that `max + 1` never overflows.
+    """
+    if size < np.iinfo(np.uint16).max:
+        return np.uint16
+    elif size < np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def compact_sparse_indices(sparse_indices, sparse_oov):
+    """Cast sparse indices to the narrowest type given all the oov positions,
+    which are the largest possible indices of every field."""
+    if sparse_indices is None:
+        return None
+    size = int(np.max(sparse_oov)) + 1
+    return sparse_indices.astype(compact_int_dtype(size), copy=False)
+
+
+def compact_dense_values(dense_values):
+    if dense_values is None:
+        return None
+    return dense_values.astype(np.float32, copy=False)
+
+
+def interaction_consumed(user_indices, item_indices, n_users=None,
+                         n_items=None):
+    user_consumed = ConsumedCSR.from_pairs(
+        user_indices, item_indices, n_users, n_items)
+    item_consumed = ConsumedCSR.from_pairs(
+        item_indices, user_indices, n_items, n_users)
     return user_consumed, item_consumed
 
 
@@ -0,0 +1,217 @@
+import numpy as np
+
+
+class ConsumedCSR(object):
+    """Consumed items of every user (or users of every item) in csr format.
+
+    Each row keeps the original interaction order, so it can be used as a
+    time-ordered sequence. The object behaves like a read-only dict of
+    arrays, i.e. `consumed[u]`, `u in consumed`, `consumed.items()`, and
+    unknown rows return an empty array.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        Row pointers, with length `n_rows + 1`.
+    indices : numpy.ndarray
+        Consumed column indices of all rows.
+    n_cols : int, optional
+        Number of columns, inferred from `indices` if not provided.
+    """
+
+    def __init__(self, indptr, indices, n_cols=None):
+        self.indptr = indptr
+        self.indices = indices
+        if n_cols is None:
+            n_cols = int(indices.max()) + 1 if len(indices) > 0 else 0
+        self.n_cols = n_cols
+        self._sort_order = None
+        self._sorted_indices = None
+        self._sorted_keys = None
+        self._unique_row_counts = None
+
+    @classmethod
+    def from_pairs(cls, row_indices, col_indices, n_rows=None, n_cols=None):
+        row_indices = np.asarray(row_indices, dtype=np.int64)
+        col_indices = np.asarray(col_indices)
+        if n_rows is None:
+            n_rows = int(row_indices.max()) + 1 if len(row_indices) > 0 else 0
+        # stable sort to preserve the original interaction order in every row
+        order = np.argsort(row_indices, kind="stable")
+        indices = col_indices[order].astype(np.int32)
+        counts = np.bincount(row_indices, minlength=n_rows)
+        indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(indptr, indices, n_cols)
+
+    def append(self, row_indices, col_indices, n_rows=None, n_cols=None):
+        """Return a new object with the pairs appended to the end of rows.
+
+        Only the new pairs are sorted, existing rows are moved with a single
+        vectorized copy, so the original interaction order is preserved.
+        If the sorted order of existing rows has been computed, it is carried
+        over by merging in the sorted new pairs.
+        """
+        col_indices = np.asarray(col_indices)
+        # new columns beyond `n_cols` would otherwise collide in sorted keys
+        max_col = int(col_indices.max()) + 1 if len(col_indices) > 0 else 0
+        delta = ConsumedCSR.from_pairs(
+            row_indices, col_indices,
+            max(self.n_rows, n_rows or 0),
+            max(self.n_cols, n_cols or 0, max_col)
+        )
+        n_rows = max(self.n_rows, delta.n_rows)
+        old_lengths = np.zeros(n_rows, dtype=np.int64)
+        old_lengths[:self.n_rows] = self.row_lengths
+        new_lengths = np.zeros(n_rows, dtype=np.int64)
+        new_lengths[:delta.n_rows] = delta.row_lengths
+
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(old_lengths + new_lengths, out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        # every old element shifts by the number of new elements before it
+        old_shift = np.repeat(indptr[:-1] - np.append(
+            self.indptr[:-1], np.full(n_rows - self.n_rows, self.indptr[-1],
+                                      dtype=np.int64)), old_lengths)
+        indices[np.arange(len(self.indices)) + old_shift] = self.indices
+        new_shift = np.repeat(
+            indptr[:-1] + old_lengths - delta.indptr[:-1], new_lengths)
+        indices[np.arange(len(delta.indices)) + new_shift] = delta.indices
+        appended = ConsumedCSR(indptr, indices, delta.n_cols)
+        if self._sort_order is not None:
+            appended._merge_sorted(self, delta, old_shift, new_shift)
+        return appended
+
+    def _merge_sorted(self, old, delta, old_shift, new_shift):
+        # Rows of `old` are already sorted, so only the new pairs are sorted
+        # and merged into them, instead of sorting the whole history again.
+        # Equal keys keep old elements first, same as the stable lexsort.
+        old_keys = old.sorted_keys
+        if old.n_cols != self.n_cols:
+            old_keys = (old_keys // old.n_cols) * self.n_cols + (
+                old.sorted_indices)
+        new_keys = delta.sorted_keys
+        new_pos = np.searchsorted(old_keys, new_keys, side="right")
+        new_pos += np.arange(len(new_keys))
+        old_mask = np.ones(len(old_keys) + len(new_keys), dtype=bool)
+        old_mask[new_pos] = False
+
+        def merge(old_vals, new_vals):
+            merged = np.empty(len(old_mask), dtype=old_vals.dtype)
+            merged[old_mask] = old_vals
+            merged[new_pos] = new_vals
+            return merged
+
+        # the sort is within rows, so the sorted elements keep row shifts
+        self._sort_order = merge(old.sort_order + old_shift,
+                                 delta.sort_order + new_shift)
+        self._sorted_indices = merge(old.sorted_indices, delta.sorted_indices)
+        self._sorted_keys = merge(old_keys, new_keys)
+
+    def unique_row_counts(self):
+        """Number of distinct columns in every row, computed once."""
+        if self._unique_row_counts is None:
+            sorted_indices = self.sorted_indices
+            rows = np.repeat(np.arange(self.n_rows), self.row_lengths)
+            duplicate = (
+                (sorted_indices[1:] == sorted_indices[:-1])
+                & (rows[1:] == rows[:-1])
+            )
+            self._unique_row_counts = self.row_lengths - np.bincount(
+                rows[1:][duplicate], minlength=self.n_rows)
+        return self._unique_row_counts
+
+    @property
+    def n_rows(self):
+        return len(self.indptr) - 1
+
+    @property
+    def row_lengths(self):
+        return np.diff(self.indptr)
+
+    def __getitem__(self, row):
+        if 0 <= row < self.n_rows:
+            return self.indices[self.indptr[row]: self.indptr[row + 1]]
+        return self.indices[:0]
+
+    def get(self, row, default=None):
+        return self[row] if row in self else default
+
+    def __contains__(self, row):
+        return (0 <= row < self.n_rows
+                and self.indptr[row + 1] > self.indptr[row])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.row_lengths))
+
+    def keys(self):
+        return np.flatnonzero(self.row_lengths).tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def values(self):
+        return (self[row] for row in self.keys())
+
+    def items(self):
+        return ((row, self[row]) for row in self.keys())
+
+    @property
+    def sort_order(self):
+        """Stable order that sorts indices within every row."""
+        if self._sort_order is None:
+            rows = np.repeat(np.arange(self.n_rows), self.row_lengths)
+            self._sort_order = np.lexsort((self.indices, rows))
+        return self._sort_order
+
+    @property
+    def sorted_indices(self):
+        """Indices sorted within every row, used for membership tests."""
+        if self._sorted_indices is None:
+            self._sorted_indices = self.indices[self.sort_order]
+        return self._sorted_indices
+
+    @property
+    def sorted_keys(self):
+        """Sorted `row * n_cols + col` keys of all elements."""
+        if self._sorted_keys is None:
+            rows_all = np.repeat(
+                np.arange(self.n_rows, dtype=np.int64), self.row_lengths)
+            self._sorted_keys = rows_all * self.n_cols + self.sorted_indices
+        return self._sorted_keys
+
+    def sorted_row(self, row):
+        if 0 <= row < self.n_rows:
+            return self.sorted_indices[self.indptr[row]: self.indptr[row + 1]]
+        return self.indices[:0]
+
+    def contains(self, row, col):
+        sorted_row = self.sorted_row(row)
+        pos = np.searchsorted(sorted_row, col)
+        return pos < len(sorted_row) and sorted_row[pos] == col
+
+    def _search(self, rows, cols):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        sorted_keys = self.sorted_keys
+        if len(sorted_keys) == 0:
+            return np.zeros(len(cols), dtype=np.int64), np.zeros(
+                len(cols), dtype=bool)
+        keys = rows * self.n_cols + cols
+        pos = np.searchsorted(sorted_keys, keys, side="left")
+        pos[pos == len(sorted_keys)] = 0
+        valid = (cols >= 0) & (cols < self.n_cols)
+        return pos, valid & (sorted_keys[pos] == keys)
+
+    def isin(self, rows, cols):
+        """Vectorized membership test of `cols[k]` in row `rows[k]`."""
+        return self._search(rows, cols)[1]
+
+    def first_positions(self, rows, cols):
+        """Position of the first occurrence of `cols[k]` in row `rows[k]`,
+        -1 if it doesn't exist."""
+        pos, found = self._search(rows, cols)
+        rows = np.asarray(rows, dtype=np.int64)
+        # the sort is stable, so the leftmost match is the first occurrence
+        positions = self.sort_order[pos] - self.indptr[np.where(found, rows, 0)]
+        return np.where(found, positions, -1)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+
+class HashBuckets(object):
+    """Vocabulary of a feature-hashed sparse column.
+
+    It takes the place of the sorted unique values of a column, but values
+    are encoded with a vectorized hash into `[0, n_buckets)`, so neither
+    the unique values nor a value-to-index dict are stored. Distinct values
+    may collide in the same bucket. The length is the number of buckets,
+    so offsets and oov positions are computed the same way as for normal
+    columns, and the oov position is never produced by encoding. Values
+    are hashed along with their type, e.g. 1 and 1.0 fall in different
+    buckets, so keep the same dtype in training and prediction.
+
+    Parameters
+    ----------
+    n_buckets : int
+        Number of hash buckets.
+    """
+
+    # fixed key so that encoding is stable across processes
+    hash_key = "libreco_hash_key"
+
+    def __init__(self, n_buckets):
+        n_buckets = int(n_buckets)
+        if n_buckets <= 0:
+            raise ValueError(
+                f"hash_buckets must be positive, got {n_buckets}")
+        self.n_buckets = n_buckets
+
+    def __len__(self):
+        return self.n_buckets
+
+    def __repr__(self):
+        return f"HashBuckets({self.n_buckets})"
+
+    def encode(self, values):
+        values = np.asarray(values)
+        if values.ndim == 0:
+            values = values.reshape(1)
+        if values.dtype.kind in ("U", "S"):
+            values = values.astype(object)
+        # hashed columns are high-cardinality, so skip factorizing first
+        hashed = pd.util.hash_array(values, hash_key=self.hash_key,
+                                    categorize=False)
+        indices = hashed % np.uint64(self.n_buckets)
+        dtype = np.int32 if self.n_buckets < np.iinfo(np.int32).max else np.int64
+        return indices.astype(dtype)
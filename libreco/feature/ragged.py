@@ -0,0 +1,200 @@
+import numpy as np
+
+
+class RaggedSparseIndices(object):
+    """Sparse indices whose multi_sparse fields are stored as values plus
+    offsets, so padding is not stored.
+
+    Every row of a multi_sparse field is cut after its last token that is
+    not oov. Trailing padding is dropped, while oov tokens in the middle of
+    a row are kept, so the padded matrix can be rebuilt exactly. Indexing
+    rows with a slice, an integer or an index array returns the usual
+    padded matrix, so the object can be used in place of an array by the
+    data generators. Padding is only materialized for the requested rows.
+
+    Parameters
+    ----------
+    sparse_indices : numpy.ndarray or None
+        Indices of the normal sparse columns, which come first.
+    values : list of numpy.ndarray
+        Concatenated tokens of every multi_sparse field.
+    offsets : list of numpy.ndarray
+        Row pointers of every multi_sparse field, with length `n_rows + 1`.
+    widths : list of int
+        Number of padded columns of every multi_sparse field.
+    oov : list of int
+        Oov index of every multi_sparse field, which fills the padding.
+    """
+
+    def __init__(self, sparse_indices, values, offsets, widths, oov):
+        self.sparse_indices = sparse_indices
+        self.values = list(values)
+        self.offsets = list(offsets)
+        self.widths = [int(w) for w in widths]
+        self.oov = [int(o) for o in oov]
+        self._length = len(self.offsets[0]) - 1
+
+    @classmethod
+    def from_fields(cls, sparse_indices, field_indices, oov):
+        """Build from the padded matrix of every multi_sparse field.
+
+        `field_indices` can be a generator, so that only one padded field
+        exists at a time.
+        """
+        values, offsets, widths = [], [], []
+        for padded, field_oov in zip(field_indices, oov):
+            # row length is the position after the last real token
+            real = padded != field_oov
+            width = padded.shape[1]
+            last = width - np.argmax(real[:, ::-1], axis=1)
+            lengths = np.where(real.any(axis=1), last, 0)
+            offset = np.zeros(len(padded) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offset[1:])
+            mask = np.arange(width) < lengths[:, None]
+            values.append(padded[mask])
+            offsets.append(offset)
+            widths.append(width)
+        return cls(sparse_indices, values, offsets, widths, oov)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Stack the rows of several objects with the same fields."""
+        first = parts[0]
+        sparse_indices = (
+            np.concatenate([p.sparse_indices for p in parts])
+            if first.sparse_indices is not None
+            else None
+        )
+        values, offsets = [], []
+        for f in range(len(first.values)):
+            values.append(np.concatenate([p.values[f] for p in parts]))
+            lengths = np.concatenate([np.diff(p.offsets[f]) for p in parts])
+            offset = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offset[1:])
+            offsets.append(offset)
+        return cls(sparse_indices, values, offsets, first.widths, first.oov)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def n_sparse(self):
+        return (
+            0 if self.sparse_indices is None
+            else self.sparse_indices.shape[1]
+        )
+
+    @property
+    def shape(self):
+        return self._length, self.n_sparse + sum(self.widths)
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self.values[0].dtype
+
+    @property
+    def nbytes(self):
+        size = sum(v.nbytes for v in self.values)
+        size += sum(o.nbytes for o in self.offsets)
+        if self.sparse_indices is not None:
+            size += self.sparse_indices.nbytes
+        return size
+
+    def _row_numbers(self, index):
+        if isinstance(index, slice):
+            return np.arange(*index.indices(self._length))
+        rows = np.asarray(index)
+        if rows.dtype == np.bool_:
+            return np.flatnonzero(rows)
+        if rows.size and (rows.min() < -self._length
+                          or rows.max() >= self._length):
+            raise IndexError(
+                f"index out of bounds for {self._length} rows")
+        return rows % self._length if rows.size else rows.astype(np.intp)
+
+    def __getitem__(self, index):
+        rows = self._row_numbers(index)
+        if np.ndim(rows) == 0:
+            return self._gather(rows.reshape(1))[0]
+        return self._gather(rows)
+
+    def _gather(self, rows):
+        out = np.empty((len(rows), self.shape[1]), dtype=self.dtype)
+        if self.sparse_indices is not None:
+            out[:, :self.n_sparse] = self.sparse_indices[rows]
+        col = self.n_sparse
+        for values, offset, width, oov in zip(
+                self.values, self.offsets, self.widths, self.oov):
+            starts = offset[rows]
+            lengths = offset[rows + 1] - starts
+            positions = np.arange(width)
+            mask = positions < lengths[:, None]
+            block = out[:, col: col + width]
+            block[...] = oov
+            block[mask] = values[(starts[:, None] + positions)[mask]]
+            col += width
+        return out
+
+    def take_rows(self, rows):
+        """Return the selected rows as another `RaggedSparseIndices`."""
+        rows = self._row_numbers(rows)
+        sparse_indices = (
+            self.sparse_indices[rows]
+            if self.sparse_indices is not None
+            else None
+        )
+        values, offsets = [], []
+        for value, offset in zip(self.values, self.offsets):
+            starts = offset[rows]
+            lengths = offset[rows + 1] - starts
+            new_offset = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offset[1:])
+            # position of every token in the original values
+            token_pos = (
+                np.arange(new_offset[-1])
+                - np.repeat(new_offset[:-1] - starts, lengths)
+            )
+            values.append(value[token_pos])
+            offsets.append(new_offset)
+        return RaggedSparseIndices(sparse_indices, values, offsets,
+                                   self.widths, self.oov)
+
+    def astype(self, dtype, copy=True):
+        sparse_indices = (
+            self.sparse_indices.astype(dtype, copy=copy)
+            if self.sparse_indices is not None
+            else None
+        )
+        values = [v.astype(dtype, copy=copy) for v in self.values]
+        return RaggedSparseIndices(sparse_indices, values, self.offsets,
+                                   self.widths, self.oov)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+    def to_arrays(self):
+        """Component arrays and metadata, used for saving."""
+        arrays = dict()
+        if self.sparse_indices is not None:
+            arrays["sparse"] = self.sparse_indices
+        for f, (value, offset) in enumerate(zip(self.values, self.offsets)):
+            arrays[f"values_{f}"] = value
+            arrays[f"offsets_{f}"] = offset
+        meta = {"widths": self.widths, "oov": self.oov}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        n_fields = len(meta["widths"])
+        return cls(
+            arrays.get("sparse"),
+            [arrays[f"values_{f}"] for f in range(n_fields)],
+            [arrays[f"offsets_{f}"] for f in range(n_fields)],
+            meta["widths"],
+            meta["oov"]
+        )
@@ -1,5 +1,7 @@
 import numbers
 import numpy as np
+from .column import unordered_sparse_indices
+from .hashing import HashBuckets
 
 
 def construct_unique_feat(
@@ -48,15 +50,19 @@ def construct_unique_feat(
 
 
 def _compress_unique_values(orig_val, col, indices, pos):
-    values = np.take(orig_val, col, axis=1)
-    values = values.reshape(-1, 1) if orig_val.ndim == 1 else values
     indices = indices[pos]
     # https://stackoverflow.com/questions/46390376/drop-duplicates-from-structured-numpy-array-python3-x
-    mask = np.empty(len(indices), dtype=np.bool)
+    mask = np.empty(len(indices), dtype=bool)
     mask[:-1] = (indices[:-1] != indices[1:])
     mask[-1] = True
     mask = pos[mask]
-    unique_values = values[mask]
+    # gather the unique rows first, so ragged indices are only padded there
+    unique_values = orig_val[mask]
+    unique_values = (
+        unique_values.reshape(-1, 1)
+        if unique_values.ndim == 1
+        else np.take(unique_values, col, axis=1)
+    )
     assert len(np.unique(indices)) == len(unique_values)
     return unique_values
 
@@ -213,8 +219,19 @@ def features_from_dict(data_info, sparse_indices, dense_values, feats, mode):
                            else sparse_indices.copy())
     dense_values_copy = (None if dense_values is None
                          else dense_values.copy())
+    if dense_values is not None:
+        feats = {**feats, **_scaled_dense_data(data_info, feats)}
     for col, val in feats.items():
         if (sparse_indices is not None
+                and col in sparse_mapping
+                and data_info.sparse_unique_vals
+                and isinstance(data_info.sparse_unique_vals.get(col),
+                               HashBuckets)):
+            field_idx = sparse_mapping[col]
+            feat_idx = data_info.sparse_unique_vals[col].encode(val)[0]
+            offset = data_info.sparse_offset[field_idx]
+            sparse_indices_copy[:, field_idx] = feat_idx + offset
+        elif (sparse_indices is not None
                 and col in sparse_mapping
                 and col in data_info.sparse_unique_idxs):
 
@@ -237,26 +254,29 @@ def features_from_dict(data_info, sparse_indices, dense_values, feats, mode):
 
 
 def features_from_batch_data(data_info, sparse, dense, data):
+    # missing sparse columns are treated as oov, missing dense ones as zero
     if sparse:
-        sparse_col_num = len(data_info.col_name_mapping["sparse_col"])
-        sparse_indices = [_ for _ in range(sparse_col_num)]
-        for col, field_idx in data_info.col_name_mapping["sparse_col"].items():
+        sparse_mapping = data_info.col_name_mapping["sparse_col"]
+        sparse_indices = np.empty((len(data), len(sparse_mapping)),
+                                  dtype=np.int32)
+        for col, field_idx in sparse_mapping.items():
             if col not in data.columns:
+                sparse_indices[:, field_idx] = data_info.sparse_oov[field_idx]
                 continue
-            sparse_indices[field_idx] = compute_sparse_feat_indices(
+            sparse_indices[:, field_idx] = compute_sparse_feat_indices(
                 data_info, data, field_idx, col)
-        sparse_indices = np.array(sparse_indices).astype(np.int64).T
     else:
         sparse_indices = None
 
     if dense:
-        dense_col_num = len(data_info.col_name_mapping["dense_col"])
-        dense_values = [_ for _ in range(dense_col_num)]
-        for col, field_idx in data_info.col_name_mapping["dense_col"].items():
-            if col not in data.columns:
+        dense_mapping = data_info.col_name_mapping["dense_col"]
+        dense_data = _scaled_dense_data(data_info, data)
+        dense_values = np.zeros((len(data), len(dense_mapping)),
+                                dtype=np.float32)
+        for col, field_idx in dense_mapping.items():
+            if col not in dense_data:
                 continue
-            dense_values[field_idx] = data[col].to_numpy()
-        dense_values = np.array(dense_values).T
+            dense_values[:, field_idx] = np.asarray(dense_data[col])
     else:
         dense_values = None
 
@@ -290,51 +310,70 @@ def add_item_features(data_info, sparse_indices, dense_values, data):
     col_info = data_info.item_dense_col
     if dense_values is not None and col_info.name:
         dense_values_copy = dense_values.copy()
+        dense_data = _scaled_dense_data(data_info, data)
         for feat_idx, col in enumerate(col_info.name):
-            if col not in data.columns:
+            if col not in dense_data:
                 continue
-            dense_values_copy[row_idx, feat_idx] = data[col].to_numpy()
+            dense_values_copy[row_idx, feat_idx] = np.asarray(dense_data[col])
     return sparse_indices_copy, dense_values_copy
 
 
+def _scaled_dense_data(data_info, data):
+    # dense values fed in raw are scaled with the parameters fitted in training
+    dense_scaler = getattr(data_info, "dense_scaler", None)
+    if dense_scaler is None:
+        return data
+    return dense_scaler.transform_columns(data)
+
+
 def compute_sparse_feat_indices(data_info, data, field_idx, column):
     offset = data_info.sparse_offset[field_idx]
     oov_val = data_info.sparse_oov[field_idx]
 
-    if (data_info.sparse_unique_idxs
-            and column in data_info.sparse_unique_idxs):
-        map_vals = data_info.sparse_unique_idxs[column]
-    elif (data_info.multi_sparse_unique_idxs
-          and column in data_info.multi_sparse_unique_idxs):
-        map_vals = data_info.multi_sparse_unique_idxs[column]
+    if (data_info.sparse_unique_vals
+            and column in data_info.sparse_unique_vals):
+        key = ("sparse", column)
+    elif (data_info.multi_sparse_unique_vals
+          and column in data_info.multi_sparse_unique_vals):
+        key = ("multi_sparse", column)
     elif ("multi_sparse" in data_info.col_name_mapping
           and column in data_info.col_name_mapping["multi_sparse"]):
         main_col = data_info.col_name_mapping["multi_sparse"][column]
-        map_vals = data_info.multi_sparse_unique_idxs[main_col]
+        key = ("multi_sparse", main_col)
     else:
         raise ValueError(f"Unknown sparse column: {column}")
-    # map_vals = data_info.sparse_unique_idxs[column]
-    values = data[column].tolist()
-    feat_indices = np.array(
-        [map_vals[v] + offset if v in map_vals else oov_val
-         for v in values]
-    )
-    return feat_indices
+
+    values = data[column].to_numpy()
+    unique_vals = getattr(data_info, f"{key[0]}_unique_vals")[key[1]]
+    if isinstance(unique_vals, HashBuckets):
+        return unique_vals.encode(values) + offset
+    try:
+        col_indices, not_in_mask = unordered_sparse_indices(
+            values, unique_vals, data_info.sort_perm(key, unique_vals))
+    except TypeError:
+        # values not comparable with the vocabulary, e.g. None in a str
+        # column, fall back to the hash lookup
+        map_vals = getattr(data_info, f"{key[0]}_unique_idxs")[key[1]]
+        return np.array(
+            [map_vals[v] + offset if v in map_vals else oov_val
+             for v in values.tolist()]
+        )
+    return np.where(not_in_mask, oov_val, col_indices + offset)
 
 
 # This function will try not to modify the original data
 def _check_oov(data_info, orig_data, mode):
     data = orig_data.copy()
-    if mode == "user":
-        users = data.user.tolist()
-        user_mapping = data_info.user2id
-        user_ids = [user_mapping[u] if u in user_mapping else -1 for u in users]
-        data["user"] = user_ids
-        data = data[data.user != -1]
-    elif mode == "item":
-        items = data.item.tolist()
-        item_mapping = data_info.item2id
-        item_ids = [item_mapping[i] if i in item_mapping else -1 for i in items]
-        data["item"] = item_ids
-        data = data[data.item != -1]
+    if mode in ("user", "item"):
+        unique_vals = getattr(data_info, f"{mode}_unique_vals")
+        values = data[mode].to_numpy()
+        try:
+            ids, not_in_mask = unordered_sparse_indices(
+                values, unique_vals, data_info.sort_perm(mode, unique_vals))
+        except TypeError:
+            mapping = getattr(data_info, f"{mode}2id")
+            ids = np.array([mapping.get(v, -1) for v in values.tolist()])
+            not_in_mask = ids == -1
+        data[mode] = ids
+        data = data[~not_in_mask]
     return data
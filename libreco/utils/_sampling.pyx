@@ -0,0 +1,185 @@
+import numpy as np
+cimport numpy as np
+cimport cython
+from cython.parallel import prange
+from libcpp cimport bool
+from libcpp.algorithm cimport binary_search
+
+
+cdef extern from "<random>" namespace "std" nogil:
+    cdef cppclass mt19937:
+        mt19937(unsigned int)
+
+    cdef cppclass uniform_int_distribution[T]:
+        uniform_int_distribution(T, T)
+        T operator()(mt19937)
+
+    cdef cppclass uniform_real_distribution[T]:
+        uniform_real_distribution(T, T)
+        T operator()(mt19937)
+
+
+# rows are split into fixed chunks, each with its own random engine, so the
+# result only depends on the seed, not on the number of threads
+cdef int CHUNK_SIZE = 1024
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bool check_consumed(const int[:] sorted_indices,
+                                const np.int64_t[:] indptr,
+                                int user, int item) nogil:
+    return binary_search(&sorted_indices[indptr[user]],
+                         &sorted_indices[indptr[user + 1]],
+                         item)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline int draw_item(mt19937 &rng,
+                          uniform_int_distribution[int] &dist,
+                          uniform_real_distribution[double] &real_dist,
+                          const double[:] alias_prob,
+                          const int[:] alias_idx,
+                          bool use_alias) nogil:
+    cdef int item = dist(rng)
+    if use_alias and real_dist(rng) >= alias_prob[item]:
+        item = alias_idx[item]
+    return item
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def sample_negatives_parallel(const int[:] users,
+                              const int[:] sorted_indices,
+                              const np.int64_t[:] indptr,
+                              const np.int64_t[:] unique_counts,
+                              int n_items,
+                              int n_support,
+                              const double[:] alias_prob,
+                              const int[:] alias_idx,
+                              unsigned int seed,
+                              int num_threads=1):
+    """Draw one negative item for every user, rejecting consumed items
+    with a binary search in the user's sorted csr row. `unique_counts` are
+    the numbers of distinct items of every row."""
+    cdef Py_ssize_t size = users.shape[0]
+    cdef Py_ssize_t n_chunks = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+    cdef Py_ssize_t c, i, end
+    cdef int user, item
+    cdef bool use_alias = alias_prob.shape[0] > 0
+    cdef mt19937 *rng
+    cdef uniform_int_distribution[int] *dist
+    cdef uniform_real_distribution[double] *real_dist
+    items = np.empty(size, dtype=np.int32)
+    cdef int[:] items_view = items
+
+    for c in prange(n_chunks, nogil=True, schedule="static",
+                    num_threads=num_threads):
+        rng = new mt19937(seed + <unsigned int> c * 7919)
+        dist = new uniform_int_distribution[int](0, n_items - 1)
+        real_dist = new uniform_real_distribution[double](0.0, 1.0)
+        end = min((c + 1) * CHUNK_SIZE, size)
+        for i in range(c * CHUNK_SIZE, end):
+            user = users[i]
+            item = draw_item(rng[0], dist[0], real_dist[0],
+                             alias_prob, alias_idx, use_alias)
+            # users who have consumed all items can't get a true negative
+            if unique_counts[user] < n_support:
+                while check_consumed(sorted_indices, indptr, user, item):
+                    item = draw_item(rng[0], dist[0], real_dist[0],
+                                     alias_prob, alias_idx, use_alias)
+            items_view[i] = item
+        del rng
+        del dist
+        del real_dist
+    return items
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def interacted_seq_parallel(const int[:] users,
+                            const np.int64_t[:] positions,
+                            const int[:] indices,
+                            const np.int64_t[:] indptr,
+                            int pad_index,
+                            int num,
+                            bool random_mode,
+                            unsigned int seed,
+                            int num_threads=1):
+    """Historical items of every user before the given position in the
+    consumed sequence, same as `libreco.data.sequence.user_interacted_seq`.
+
+    `positions` are -1 for items not consumed, whose history is the whole
+    consumed sequence. Sampled histories use Floyd's algorithm followed by
+    a shuffle, so both the subset and the order are uniform.
+    """
+    cdef Py_ssize_t size = users.shape[0]
+    cdef Py_ssize_t n_chunks = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+    cdef Py_ssize_t c, i, k, m, end, start, upper, candidate
+    cdef Py_ssize_t consumed_len, history_len, seq_len
+    cdef int tmp
+    cdef bool negative, duplicate, use_sampling
+    cdef mt19937 *rng
+    cdef uniform_real_distribution[double] *real_dist
+    interacted = np.full((size, num), pad_index, dtype=np.int32)
+    interacted_len = np.empty(size, dtype=np.float32)
+    cdef int[:, ::1] interacted_view = interacted
+    cdef float[:] interacted_len_view = interacted_len
+
+    for c in prange(n_chunks, nogil=True, schedule="static",
+                    num_threads=num_threads):
+        rng = new mt19937(seed + <unsigned int> c * 7919)
+        real_dist = new uniform_real_distribution[double](0.0, 1.0)
+        end = min((c + 1) * CHUNK_SIZE, size)
+        for i in range(c * CHUNK_SIZE, end):
+            start = indptr[users[i]]
+            consumed_len = indptr[users[i] + 1] - start
+            negative = positions[i] < 0
+            history_len = consumed_len if negative else positions[i]
+            seq_len = min(history_len, num)
+            if random_mode:
+                use_sampling = history_len >= num
+            else:
+                use_sampling = negative and consumed_len >= num
+
+            if use_sampling:
+                # offsets are kept in the output row, then mapped to items
+                for k in range(num):
+                    upper = consumed_len - num + k
+                    candidate = <Py_ssize_t> (
+                        real_dist[0](rng[0]) * (upper + 1))
+                    if candidate > upper:
+                        candidate = upper
+                    duplicate = False
+                    for m in range(k):
+                        if interacted_view[i, m] == candidate:
+                            duplicate = True
+                            break
+                    interacted_view[i, k] = upper if duplicate else candidate
+                for k in range(num - 1, 0, -1):
+                    m = <Py_ssize_t> (real_dist[0](rng[0]) * (k + 1))
+                    if m > k:
+                        m = k
+                    tmp = interacted_view[i, k]
+                    interacted_view[i, k] = interacted_view[i, m]
+                    interacted_view[i, m] = tmp
+                for k in range(num):
+                    interacted_view[i, k] = indices[
+                        start + interacted_view[i, k]]
+            else:
+                # contiguous window that ends right before the item
+                for k in range(seq_len):
+                    interacted_view[i, k] = indices[
+                        start + history_len - seq_len + k]
+
+            # first item has no historical interaction, length is 1
+            if not negative and positions[i] == 0:
+                interacted_len_view[i] = 1
+            else:
+                interacted_len_view[i] = seq_len
+        del rng
+        del real_dist
+    return interacted, interacted_len
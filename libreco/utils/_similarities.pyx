@@ -512,3 +512,208 @@ cpdef forward_jaccard(const int[:] indices, const int[:] indptr,
 
     return res_indices, res_indptr, res_data
 
+
+
+cdef enum SimType:
+    COSINE = 0
+    PEARSON = 1
+    JACCARD = 2
+
+
+cdef inline bint better_neighbor(float sim_a, int id_a,
+                                 float sim_b, int id_b) nogil:
+    # same order as sorting by similarity in descending order,
+    # where ties keep the smaller index first
+    return sim_a > sim_b or (sim_a == sim_b and id_a < id_b)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void push_neighbor(float *sims, int *ids, int *size, int k,
+                        float sim, int neighbor) noexcept nogil:
+    # bounded min-heap, the root is the worst of the k best neighbors
+    cdef int pos, parent, child
+    if size[0] < k:
+        pos = size[0]
+        size[0] += 1
+        while pos > 0:
+            parent = (pos - 1) // 2
+            if better_neighbor(sims[parent], ids[parent], sim, neighbor):
+                sims[pos] = sims[parent]
+                ids[pos] = ids[parent]
+                pos = parent
+            else:
+                break
+    elif better_neighbor(sim, neighbor, sims[0], ids[0]):
+        pos = 0
+        while True:
+            child = 2 * pos + 1
+            if child >= k:
+                break
+            if child + 1 < k and better_neighbor(
+                    sims[child], ids[child], sims[child + 1], ids[child + 1]):
+                child += 1
+            if better_neighbor(sim, neighbor, sims[child], ids[child]):
+                sims[pos] = sims[child]
+                ids[pos] = ids[child]
+                pos = child
+            else:
+                break
+    else:
+        return
+    sims[pos] = sim
+    ids[pos] = neighbor
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void compute_topk(
+    const int[:] indices,
+    const int[:] indptr,
+    const float[:] data,
+    const float[:] x_mean,
+    const float[:] x_norm,
+    SimType sim_type,
+    int min_common,
+    int n_x,
+    int n_y,
+    int block_size,
+    int block_num,
+    int k,
+    int n_threads,
+    float[:, ::1] heap_sims,
+    int[:, ::1] heap_ids,
+    int[:] heap_sizes
+) noexcept nogil:
+    # With one thread only the upper triangle is accumulated as in
+    # `compute_cosine`, and every pair is pushed into the heaps of both rows.
+    # With more threads every block accumulates its full rows and only
+    # pushes into its own heaps, so blocks can run in parallel without
+    # sharing any heap. No full similarity matrix is ever stored.
+
+    cdef:
+        Py_ssize_t x_start, x_end, p, x1, x2, i, j, index
+        Py_ssize_t block_index, block_start, block_end, scount
+        Py_ssize_t j_start, x2_start
+    cdef float sprods, smeani, smeanj, sqi, sqj, sim, union
+    cdef bint need_prods = sim_type != JACCARD
+    cdef bint full_rows = n_threads > 1
+
+    cdef float *prods = NULL
+    cdef uint *freq
+
+    for block_index in prange(block_num, num_threads=n_threads,
+                              schedule="dynamic"):
+        prods = NULL
+        if need_prods:
+            prods = <float *> malloc(sizeof(float) * n_x * block_size)
+            memset(prods, 0, sizeof(float) * n_x * block_size)
+        freq = <uint *> malloc(sizeof(uint) * n_x * block_size)
+        memset(freq, 0, sizeof(uint) * n_x * block_size)
+
+        block_start = block_index * block_size
+        block_end = (
+            n_x if n_x < block_start + block_size
+                else block_start + block_size
+        )
+
+        for p in range(n_y):
+            x_start = indptr[p]
+            x_end = indptr[p + 1]
+            for i in range(x_start, x_end):
+                x1 = indices[i]
+                if x1 >= block_start and x1 < block_end:
+                    j_start = x_start if full_rows else i + 1
+                    for j in range(j_start, x_end):
+                        x2 = indices[j]
+                        if x2 == x1:
+                            continue
+                        index = (x1 - block_start) * n_x + x2
+                        if need_prods:
+                            smeani = data[i] - x_mean[x1]
+                            smeanj = data[j] - x_mean[x2]
+                            prods[index] += (smeani * smeanj)
+                        freq[index] += 1
+
+        for x1 in range(block_start, block_end):
+            x2_start = 0 if full_rows else x1 + 1
+            for x2 in range(x2_start, n_x):
+                if x2 == x1:
+                    continue
+                index = (x1 - block_start) * n_x + x2
+                scount = freq[index]
+                if scount >= min_common:
+                    if sim_type == JACCARD:
+                        union = x_norm[x1] + x_norm[x2] - scount
+                        sim = scount / union
+                    else:
+                        sprods = prods[index]
+                        sqi = x_norm[x1]
+                        sqj = x_norm[x2]
+                        if sprods == 0.0 or sqi == 0.0 or sqj == 0.0:
+                            sim = 0.0
+                        else:
+                            sim = sprods / (sqi * sqj)
+                    # zero similarities are not stored in the full matrix
+                    if sim == 0.0:
+                        continue
+                    push_neighbor(&heap_sims[x1, 0], &heap_ids[x1, 0],
+                                  &heap_sizes[x1], k, sim, x2)
+                    if not full_rows:
+                        push_neighbor(&heap_sims[x2, 0], &heap_ids[x2, 0],
+                                      &heap_sizes[x2], k, sim, x1)
+
+        if need_prods:
+            free(prods)
+        free(freq)
+
+
+cdef tuple _invert_topk(const int[:] indices, const int[:] indptr,
+                        const float[:] data, const float[:] x_mean,
+                        const float[:] x_norm, SimType sim_type,
+                        int min_common, int n_x, int n_y, int block_size,
+                        int block_num, int k, int num_threads):
+    heap_sims = np.zeros((n_x, k), dtype=np.single)
+    heap_ids = np.zeros((n_x, k), dtype=np.intc)
+    heap_sizes = np.zeros(n_x, dtype=np.intc)
+    cdef float[:, ::1] heap_sims_view = heap_sims
+    cdef int[:, ::1] heap_ids_view = heap_ids
+    cdef int[:] heap_sizes_view = heap_sizes
+
+    compute_topk(indices, indptr, data, x_mean, x_norm, sim_type, min_common,
+                 n_x, n_y, block_size, block_num, k, num_threads,
+                 heap_sims_view, heap_ids_view, heap_sizes_view)
+    return heap_ids, heap_sims, heap_sizes
+
+
+cpdef invert_cosine_topk(const int[:] indices, const int[:] indptr,
+                         const float[:] data, const float[:] x_norm,
+                         int min_common, int n_x, int n_y, int block_size,
+                         int block_num, int k, int num_threads=1):
+    x_mean = np.zeros(n_x, dtype=np.single)
+    return _invert_topk(indices, indptr, data, x_mean, x_norm, COSINE,
+                        min_common, n_x, n_y, block_size, block_num, k,
+                        num_threads)
+
+
+cpdef invert_pearson_topk(const int[:] indices, const int[:] indptr,
+                          const float[:] data, const float[:] x_mean,
+                          const float[:] x_mean_centered_norm,
+                          int min_common, int n_x, int n_y, int block_size,
+                          int block_num, int k, int num_threads=1):
+    return _invert_topk(indices, indptr, data, x_mean, x_mean_centered_norm,
+                        PEARSON, min_common, n_x, n_y, block_size, block_num,
+                        k, num_threads)
+
+
+cpdef invert_jaccard_topk(const int[:] indices, const int[:] indptr,
+                          const float[:] data, const int[:] x_count,
+                          int min_common, int n_x, int n_y, int block_size,
+                          int block_num, int k, int num_threads=1):
+    x_mean = np.zeros(n_x, dtype=np.single)
+    x_count_float = np.asarray(x_count, dtype=np.single)
+    return _invert_topk(indices, indptr, data, x_mean, x_count_float,
+                        JACCARD, min_common, n_x, n_y, block_size, block_num,
+                        k, num_threads)
@@ -13,6 +13,42 @@ def shuffle_data(length, *args):
     return tuple(map(lambda x: x[mask], [*args]))
 
 
+def shuffle_order(data_size, block_size=None, rng=np.random):
+    """Random order of rows for one epoch, so data arrays are gathered per
+    batch instead of being permuted as a whole.
+
+    With `block_size`, contiguous blocks of rows are shuffled and rows are
+    shuffled within every block, so a batch only reads a few nearby blocks.
+    """
+    dtype = np.int32 if data_size <= np.iinfo(np.int32).max else np.int64
+    if not block_size or block_size >= data_size:
+        # shuffle in place to avoid an intermediate int64 permutation
+        order = np.arange(data_size, dtype=dtype)
+        rng.shuffle(order)
+        return order
+
+    n_blocks = -(-data_size // block_size)
+    block_order = rng.permutation(n_blocks)
+    block_lengths = np.minimum(block_size,
+                               data_size - block_order * block_size)
+    block_ids = np.repeat(np.arange(n_blocks), block_lengths)
+    block_starts = np.cumsum(block_lengths) - block_lengths
+    order = (
+        np.repeat(block_order * block_size - block_starts, block_lengths)
+        + np.arange(data_size)
+    )
+    within_block = np.lexsort((rng.random_sample(data_size), block_ids))
+    return order[within_block].astype(dtype, copy=False)
+
+
+def batch_rows(order, batch_slice):
+    """Rows of a batch, sorted for better locality of the gather. A plain
+    slice is returned if data is not shuffled."""
+    if order is None:
+        return batch_slice
+    return np.sort(order[batch_slice])
+
+
 def count_params():
     total_params = np.sum(
         [
@@ -1,8 +1,274 @@
-from math import floor
-from random import random, seed as set_random_seed
+import logging
 import numpy as np
 from tqdm import tqdm
-from ..utils.misc import time_block
+from ..utils.misc import batch_rows, shuffle_order, time_block
+try:
+    from ._sampling import interacted_seq_parallel, sample_negatives_parallel
+except (ImportError, ModuleNotFoundError):
+    LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.warning("Sampling cython version is not available")
+    interacted_seq_parallel = sample_negatives_parallel = None
+
+
+class AliasTable(object):
+    """Walker's alias method for sampling from a fixed discrete distribution.
+
+    Building the table costs O(n), after that every draw costs O(1)
+    regardless of the number of items.
+
+    Parameters
+    ----------
+    weights : array_like
+        Non-negative weights of all items, e.g. item counts.
+    power : float, optional
+        Weights are raised to this power before normalization, e.g. 0.75
+        flattens the popularity distribution as in word2vec.
+    """
+
+    def __init__(self, weights, power=1.0):
+        weights = np.asarray(weights, dtype=np.float64)
+        if power != 1.0:
+            weights = np.power(weights, power)
+        total = weights.sum()
+        if len(weights) == 0 or total <= 0:
+            raise ValueError("weights must contain at least one positive value")
+
+        self.prob, self.alias = self._build(weights * len(weights) / total)
+        self.n_support = int(np.count_nonzero(weights))
+
+    @staticmethod
+    def _build(scaled):
+        """Vectorized pairing of small and large buckets.
+
+        The deficits of small buckets and the excesses of large ones are laid
+        on two cumulative lines. A small bucket is aliased to the large one
+        whose excess covers the start of its deficit. A large bucket that
+        gets overdrawn by the last small one becomes small itself and is
+        aliased to the next large bucket, which pays back the overdraft.
+        """
+        n = len(scaled)
+        prob = np.ones(n, dtype=np.float64)
+        alias = np.arange(n, dtype=np.int32)
+        small = np.flatnonzero(scaled < 1.0)
+        large = np.flatnonzero(scaled >= 1.0)
+        if len(small) == 0 or len(large) == 0:
+            # all are 1.0 up to floating point error
+            return prob, alias
+
+        deficit_end = np.cumsum(1.0 - scaled[small])
+        deficit_start = deficit_end - (1.0 - scaled[small])
+        excess_end = np.cumsum(scaled[large] - 1.0)
+        owner = np.searchsorted(excess_end, deficit_start, side="right")
+        prob[small] = scaled[small]
+        alias[small] = large[np.minimum(owner, len(large) - 1)]
+
+        # the last large bucket absorbs floating point error
+        boundary = excess_end[:-1]
+        crossing = np.searchsorted(deficit_end, boundary, side="right")
+        valid = crossing < len(small)
+        crossing = np.minimum(crossing, len(small) - 1)
+        overdrawn = valid & (deficit_start[crossing] < boundary)
+        prob[large[:-1][overdrawn]] = (
+            1.0 - (deficit_end[crossing] - boundary)[overdrawn]
+        )
+        alias[large[:-1][overdrawn]] = large[1:][overdrawn]
+        np.clip(prob, 0.0, 1.0, out=prob)
+        return prob, alias
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, size, rng=np.random):
+        indices = rng.randint(0, len(self.prob), size=size)
+        accept = rng.random_sample(size) < self.prob[indices]
+        return np.where(accept, indices, self.alias[indices]).astype(np.int32)
+
+
+def sample_negatives(users, user_consumed, n_items, rng, sampler=None):
+    """Vectorized rejection sampling of one negative item for every user.
+
+    All candidates are drawn at once, then the ones consumed by the
+    corresponding user are found with a sorted membership test against the
+    csr rows of `user_consumed`, and only these positions are resampled.
+    If `sampler` is an `AliasTable`, candidates follow its distribution
+    instead of the uniform one.
+    """
+    users = np.asarray(users)
+    if sampler is None:
+        def draw(size):
+            return rng.randint(0, n_items, size=size).astype(np.int32)
+        n_support = n_items
+    else:
+        def draw(size):
+            return sampler.sample(size, rng)
+        n_support = sampler.n_support
+
+    items = draw(len(users))
+    collided = np.flatnonzero(user_consumed.isin(users, items))
+    # users who have consumed all items can't get a true negative,
+    # repeated interactions of the same item only count once
+    full = user_consumed.unique_row_counts()[users[collided]] >= n_support
+    collided = collided[~full]
+    while len(collided) > 0:
+        items[collided] = draw(len(collided))
+        still = user_consumed.isin(users[collided], items[collided])
+        collided = collided[still]
+    return items
+
+
+def batch_negatives(users, user_consumed, n_items, sampler=None,
+                    num_threads=1):
+    """Negative items of a training batch.
+
+    Uses the multi-threaded Cython sampler if available, which checks
+    consumed items with a binary search in the sorted csr rows and releases
+    the GIL, otherwise falls back to :func:`sample_negatives`. Both are
+    seeded from the global numpy random state.
+    """
+    if sample_negatives_parallel is None:
+        return sample_negatives(users, user_consumed, n_items, np.random,
+                                sampler)
+    if sampler is None:
+        alias_prob = np.empty(0, dtype=np.float64)
+        alias_idx = np.empty(0, dtype=np.int32)
+        n_support = n_items
+    else:
+        alias_prob = sampler.prob
+        alias_idx = sampler.alias.astype(np.int32, copy=False)
+        n_support = sampler.n_support
+    return sample_negatives_parallel(
+        np.asarray(users, dtype=np.int32),
+        user_consumed.sorted_indices.astype(np.int32, copy=False),
+        user_consumed.indptr.astype(np.int64, copy=False),
+        user_consumed.unique_row_counts().astype(np.int64, copy=False),
+        n_items,
+        n_support,
+        alias_prob,
+        alias_idx,
+        np.random.randint(np.iinfo(np.int32).max),
+        num_threads
+    )
+
+
+class HardNegativeSampler(object):
+    """Replace some random negatives with items the model scores high.
+
+    The model periodically passes a snapshot of its user and item vectors
+    to `update`, which builds an index of the `n_candidates` highest-scoring
+    items every user hasn't consumed. Users are scored against all items
+    with blocked brute-force matrix products, i.e. `O(n_users * n_items)`
+    work per update, and memory of about `block_size` scores. For a
+    `hard_ratio` fraction of rows, the negative is drawn uniformly from the
+    user's indexed items, which is a lot more informative than a uniform
+    one. The other rows keep their random negatives, so that easy items
+    still get pushed down.
+
+    Draws only depend on `seed`, the number of updates and the batch
+    position, so results don't depend on which thread builds a batch.
+
+    Parameters
+    ----------
+    hard_ratio : float, optional
+        Fraction of hard negatives in every batch.
+    n_candidates : int, optional
+        Number of highest-scoring items kept for every user, the smaller
+        the harder.
+    block_size : int, optional
+        Number of user-item scores computed at once.
+    seed : int, optional
+        Random seed.
+    """
+
+    def __init__(self, hard_ratio=0.5, n_candidates=8, block_size=2**24,
+                 seed=42):
+        if not 0.0 <= hard_ratio <= 1.0:
+            raise ValueError(
+                f"hard_ratio must be in [0, 1], got {hard_ratio}")
+        if n_candidates <= 0:
+            raise ValueError(
+                f"n_candidates must be positive, got {n_candidates}")
+        self.hard_ratio = hard_ratio
+        self.n_candidates = n_candidates
+        self.block_size = block_size
+        self.seed = seed
+        # (hard items of every user, number of updates), swapped as a whole
+        # so a batch never mixes two snapshots
+        self.index = None
+
+    @property
+    def hard_items(self):
+        """Indexed items of every user, -1 if the user has fewer
+        non-consumed items."""
+        return self.index[0] if self.index is not None else None
+
+    def update(self, user_vectors, item_vectors, user_consumed, n_items):
+        user_vectors = np.asarray(user_vectors, dtype=np.float32)
+        # exclude the oov item
+        item_vectors = np.asarray(item_vectors[:n_items], dtype=np.float32)
+        n_users = len(user_vectors)
+        k = min(self.n_candidates, n_items)
+        hard_items = np.empty((n_users, k), dtype=np.int32)
+        indptr = user_consumed.indptr
+        n_block_users = max(1, self.block_size // max(n_items, 1))
+        for start in range(0, n_users, n_block_users):
+            end = min(start + n_block_users, n_users)
+            scores = user_vectors[start:end] @ item_vectors.T
+            consumed_end = min(end, user_consumed.n_rows)
+            if consumed_end > start:
+                consumed_rows = np.repeat(
+                    np.arange(consumed_end - start),
+                    np.diff(indptr[start: consumed_end + 1]))
+                consumed_items = user_consumed.indices[
+                    indptr[start]: indptr[consumed_end]]
+                scores[consumed_rows, consumed_items] = -np.inf
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            valid = np.isfinite(np.take_along_axis(scores, top, axis=1))
+            hard_items[start:end] = np.where(valid, top, -1)
+        n_updates = self.index[1] + 1 if self.index is not None else 0
+        self.index = (hard_items, n_updates)
+
+    def sample(self, users, items, batch_key=0):
+        """Return `items` with hard negatives in some of the rows.
+
+        `batch_key` identifies the batch in an epoch, e.g. its start
+        position, and seeds the random draws with the seed.
+        """
+        index = self.index
+        if index is None or self.hard_ratio <= 0.0:
+            return items
+        hard_items, n_updates = index
+        rng = np.random.RandomState([self.seed, n_updates, batch_key])
+        users = np.asarray(users)
+        items = np.array(items, dtype=np.int32)
+        hard_rows = np.flatnonzero(
+            rng.random_sample(len(users)) < self.hard_ratio)
+        hard_rows = hard_rows[users[hard_rows] < len(hard_items)]
+        cols = rng.randint(0, hard_items.shape[1], size=len(hard_rows))
+        hard = hard_items[users[hard_rows], cols]
+        # keep the random negative if the user has consumed nearly all items
+        found = hard >= 0
+        items[hard_rows[found]] = hard[found]
+        return items
+
+
+def merge_user_item_features(user_values, item_unique, item_indices,
+                             user_col, item_col):
+    """Combine user feature columns of every row with item feature columns
+    looked up from `item_unique`, keeping the original column order."""
+    if user_col and item_col:
+        user_part = np.take(user_values, user_col, axis=1)
+        item_part = item_unique[item_indices]
+        assert len(user_part) == len(item_part), (
+            "num of user sampled must equal to num of item sampled")
+        # keep column names in original order
+        orig_cols = user_col + item_col
+        col_reindex = np.arange(len(orig_cols))[np.argsort(orig_cols)]
+        return np.concatenate([user_part, item_part], axis=-1)[:, col_reindex]
+    elif user_col:
+        return np.take(user_values, user_col, axis=1)
+    elif item_col:
+        return item_unique[item_indices]
 
 
 class SamplingBase(object):
@@ -10,58 +276,60 @@ class SamplingBase(object):
         self.dataset = dataset
         self.data_info = data_info
         self.num_neg = num_neg
+        self.num_threads = 1
+        self.block_size = None
+        self.order = None
+
+    def shuffle(self, shuffle=True):
+        # data arrays are never rewritten, since they may be memory-mapped
+        # or shared with other processes
+        self.order = (
+            shuffle_order(self.data_size, self.block_size)
+            if shuffle
+            else None
+        )
 
     def sample_items_random(self, seed=42):
-        set_random_seed(seed)
+        rng = np.random.RandomState(seed)
         n_items = self.data_info.n_items
-        item_indices_sampled = list()
-        # set is much faster for search contains
-        user_consumed = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
+        user_indices = self.dataset.user_indices
+        item_indices = self.dataset.item_indices
         # sample negative items for every user
         with time_block("random neg item sampling"):
-            for u, i in zip(self.dataset.user_indices,
-                            self.dataset.item_indices):
-                item_indices_sampled.append(i)
-                for _ in range(self.num_neg):
-                    item_neg = floor(n_items * random())
-                    if u in user_consumed:
-                        while item_neg in user_consumed[u]:
-                            item_neg = floor(n_items * random())
-                    item_indices_sampled.append(item_neg)
-        return np.asarray(item_indices_sampled)
-
-    def sample_items_popular(self, seed=42):
-        data = self.data_info.get_indexed_interaction()
-        item_counts = data.item.value_counts().sort_index().to_numpy()
-        user_consumed = self.data_info.user_consumed
-        items = np.arange(self.data_info.n_items)
+            item_neg = sample_negatives(
+                np.repeat(user_indices, self.num_neg),
+                self.data_info.user_consumed,
+                n_items,
+                rng
+            )
+        return self._interleave_items(item_indices, item_neg)
 
-        item_order = list()
-        item_indices_sampled = list()
+    def sample_items_popular(self, seed=42, power=1.0):
+        rng = np.random.RandomState(seed)
+        user_indices = self.dataset.user_indices
+        item_indices = self.dataset.item_indices
+        sampler = self.popular_sampler(power)
         with time_block("popularity-based neg item sampling"):
-            for user, u_data in data.groupby("user", sort=False):
-                item_indices = u_data.index.to_list()
-                item_indices = item_indices * (self.num_neg + 1)
-                item_order.extend(item_indices)
-
-                # add positive items
-                item_indices_sampled.extend(u_data.item.tolist())
-                u_consumed = user_consumed[user]
-                u_item_counts = item_counts.copy()
-                u_item_counts[u_consumed] = 0
-                item_prob = u_item_counts / np.sum(u_item_counts)
-                neg_size = len(u_consumed) * self.num_neg
-
-                neg_sampled = np.random.choice(
-                    items, size=neg_size, p=item_prob, replace=True)
-                item_indices_sampled.extend(neg_sampled)
-
-        item_indices_sampled = np.asarray(item_indices_sampled)
-        # must be stable sort to keep relative order
-        item_order = np.argsort(item_order, kind="mergesort")
-        return item_indices_sampled[item_order]
+            item_neg = sample_negatives(
+                np.repeat(user_indices, self.num_neg),
+                self.data_info.user_consumed,
+                self.data_info.n_items,
+                rng,
+                sampler
+            )
+        return self._interleave_items(item_indices, item_neg)
+
+    def popular_sampler(self, power=1.0):
+        item_counts = self.data_info.item_consumed.row_lengths
+        return AliasTable(item_counts, power)
+
+    def _interleave_items(self, item_indices, item_neg):
+        # layout: [pos, neg, neg, ..., pos, neg, neg, ...]
+        item_indices_sampled = np.empty(
+            (len(item_indices), self.num_neg + 1), dtype=np.int32)
+        item_indices_sampled[:, 0] = item_indices
+        item_indices_sampled[:, 1:] = item_neg.reshape(-1, self.num_neg)
+        return item_indices_sampled.ravel()
 
     def _label_negative_sampling(self, size):
         factor = self.num_neg + 1
@@ -92,20 +360,13 @@ class NegativeSampling(SamplingBase):
         self.sparse = sparse
         self.dense = dense
 
-    def generate_all(self, seed=42, item_gen_mode="random"):
+    def generate_all(self, seed=42, item_gen_mode="random", popular_power=1.0):
         user_indices_sampled = np.repeat(
             self.user_indices, self.num_neg + 1, axis=0
         )
 
-        if item_gen_mode not in ["random", "popular"]:
-            raise ValueError(
-                "sampling item_gen_mode must either be 'random' or 'popular'"
-            )
-        elif item_gen_mode == "random":
-            item_indices_sampled = self.sample_items_random(seed=seed)
-        elif item_gen_mode == "popular":
-            item_indices_sampled = self.sample_items_popular(seed=seed)
-
+        item_indices_sampled = self.sample_items(
+            seed, item_gen_mode, popular_power)
         sparse_indices_sampled = self._sparse_indices_sampling(
             self.sparse_indices, item_indices_sampled
         ) if self.sparse else None
@@ -122,95 +383,87 @@ class NegativeSampling(SamplingBase):
             dense_values_sampled
         )
 
-    def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.sparse_indices = (
-                self.sparse_indices[mask] if self.sparse else None)
-            self.dense_values = (
-                self.dense_values[mask] if self.dense else None)
+    def sample_items(self, seed=42, item_gen_mode="random", popular_power=1.0):
+        """Sampled items in `[pos, neg, neg, ...]` layout for all rows."""
+        if item_gen_mode not in ["random", "popular"]:
+            raise ValueError(
+                "sampling item_gen_mode must either be 'random' or 'popular'"
+            )
+        elif item_gen_mode == "random":
+            return self.sample_items_random(seed=seed)
+        else:
+            return self.sample_items_popular(seed=seed, power=popular_power)
 
-        user_consumed = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
+    def __call__(self, shuffle=True, batch_size=None):
+        self.shuffle(shuffle)
+        user_consumed = self.data_info.user_consumed
         n_items = self.data_info.n_items
         return self.sample_batch(user_consumed, n_items, batch_size)
 
     def sample_batch(self, user_consumed, n_items, batch_size):
         for k in tqdm(range(0, self.data_size, batch_size),
                       desc="batch_sampling train"):
-            batch_slice = slice(k, k + batch_size)
-            batch_user_indices = self.user_indices[batch_slice]
-            batch_item_indices = self.item_indices[batch_slice]
-            batch_sparse_indices = (
-                self.sparse_indices[batch_slice] if self.sparse else None)
-            batch_dense_values = (
-                self.dense_values[batch_slice] if self.dense else None)
-
-            user_indices_sampled = np.repeat(
-                batch_user_indices, self.num_neg + 1, axis=0
-            )
+            yield self.get_batch(
+                slice(k, k + batch_size), user_consumed, n_items)
+
+    def get_batch(self, batch_slice, user_consumed=None, n_items=None):
+        if user_consumed is None:
+            user_consumed = self.data_info.user_consumed
+        if n_items is None:
+            n_items = self.data_info.n_items
+        rows = batch_rows(self.order, batch_slice)
+        batch_user_indices = self.user_indices[rows]
+        batch_item_indices = self.item_indices[rows]
+        batch_sparse_indices = (
+            self.sparse_indices[rows] if self.sparse else None)
+        batch_dense_values = (
+            self.dense_values[rows] if self.dense else None)
 
-            item_indices_sampled = list()
-            for u, i in zip(batch_user_indices, batch_item_indices):
-                item_indices_sampled.append(i)
-                for _ in range(self.num_neg):
-                    item_neg = floor(random() * n_items)
-                    while item_neg in user_consumed[u]:
-                        item_neg = floor(random() * n_items)
-                    item_indices_sampled.append(item_neg)
-            item_indices_sampled = np.array(item_indices_sampled)
-
-            sparse_indices_sampled = self._sparse_indices_sampling(
-                batch_sparse_indices, item_indices_sampled
-            ) if self.sparse else None
-            dense_values_sampled = self._dense_values_sampling(
-                batch_dense_values, item_indices_sampled
-            ) if self.dense else None
-            label_sampled = self._label_negative_sampling(
-                len(batch_user_indices)
-            )
+        user_indices_sampled = np.repeat(
+            batch_user_indices, self.num_neg + 1, axis=0
+        )
 
-            yield (
-                user_indices_sampled,
-                item_indices_sampled,
-                label_sampled,
-                sparse_indices_sampled,
-                dense_values_sampled
-            )
+        item_neg = batch_negatives(
+            np.repeat(batch_user_indices, self.num_neg),
+            user_consumed,
+            n_items,
+            num_threads=self.num_threads
+        )
+        item_indices_sampled = self._interleave_items(
+            batch_item_indices, item_neg
+        )
+
+        sparse_indices_sampled = self._sparse_indices_sampling(
+            batch_sparse_indices, item_indices_sampled
+        ) if self.sparse else None
+        dense_values_sampled = self._dense_values_sampling(
+            batch_dense_values, item_indices_sampled
+        ) if self.dense else None
+        label_sampled = self._label_negative_sampling(
+            len(batch_user_indices)
+        )
+
+        return (
+            user_indices_sampled,
+            item_indices_sampled,
+            label_sampled,
+            sparse_indices_sampled,
+            dense_values_sampled
+        )
 
     def _sparse_indices_sampling(self, sparse_indices, item_indices_sampled):
-        user_sparse_col = self.data_info.user_sparse_col.index
-        item_sparse_col = self.data_info.item_sparse_col.index
-
-        if user_sparse_col and item_sparse_col:
-            user_sparse_indices = np.take(
-                sparse_indices, user_sparse_col, axis=1)
-            user_sparse_sampled = np.repeat(
-                user_sparse_indices, self.num_neg + 1, axis=0)
-            item_sparse_sampled = self.data_info.item_sparse_unique[
-                item_indices_sampled]
-
-            assert len(user_sparse_sampled) == len(item_sparse_sampled), (
-                "num of user sampled must equal to num of item sampled")
-            # keep column names in original order
-            orig_cols = user_sparse_col + item_sparse_col
-            col_reindex = np.arange(len(orig_cols))[np.argsort(orig_cols)]
-            return np.concatenate(
-                [user_sparse_sampled, item_sparse_sampled], axis=-1
-            )[:, col_reindex]
-
-        elif user_sparse_col:
-            user_sparse_indices = np.take(
-                sparse_indices, user_sparse_col, axis=1)
-            user_sparse_sampled = np.repeat(
-                user_sparse_indices, self.num_neg + 1, axis=0)
-            return user_sparse_sampled
-
-        elif item_sparse_col:
-            item_sparse_sampled = self.data_info.item_sparse_unique[
-                item_indices_sampled]
-            return item_sparse_sampled
+        user_sparse_indices = (
+            np.repeat(sparse_indices, self.num_neg + 1, axis=0)
+            if self.data_info.user_sparse_col.index
+            else None
+        )
+        return merge_user_item_features(
+            user_sparse_indices,
+            self.data_info.item_sparse_unique,
+            item_indices_sampled,
+            self.data_info.user_sparse_col.index,
+            self.data_info.item_sparse_col.index
+        )
 
     def _dense_indices_sampling(self, item_indices_sampled):
         n_samples = len(item_indices_sampled)
@@ -220,40 +473,187 @@ class NegativeSampling(SamplingBase):
         return np.tile(np.arange(total_dense_cols), [n_samples, 1])
 
     def _dense_values_sampling(self, dense_values, item_indices_sampled):
-        user_dense_col = self.data_info.user_dense_col.index
-        item_dense_col = self.data_info.item_dense_col.index
+        user_dense_values = (
+            np.repeat(dense_values, self.num_neg + 1, axis=0)
+            if self.data_info.user_dense_col.index
+            else None
+        )
+        return merge_user_item_features(
+            user_dense_values,
+            self.data_info.item_dense_unique,
+            item_indices_sampled,
+            self.data_info.user_dense_col.index,
+            self.data_info.item_dense_col.index
+        )
 
-        if user_dense_col and item_dense_col:
-            user_dense_values = np.take(dense_values, user_dense_col, axis=1)
-            user_dense_sampled = np.repeat(
-                user_dense_values, self.num_neg + 1, axis=0)
-            item_dense_sampled = self.data_info.item_dense_unique[
-                item_indices_sampled]
-
-            assert len(user_dense_sampled) == len(item_dense_sampled), (
-                "num of user sampled must equal to num of item sampled")
-            # keep column names in original order
-            orig_cols = user_dense_col + item_dense_col
-            col_reindex = np.arange(len(orig_cols))[np.argsort(orig_cols)]
-            return np.concatenate(
-                [user_dense_sampled, item_dense_sampled], axis=-1
-            )[:, col_reindex]
-
-        elif user_dense_col:
-            user_dense_values = np.take(dense_values, user_dense_col, axis=1)
-            user_dense_sampled = np.repeat(
-                user_dense_values, self.num_neg + 1, axis=0)
-            return user_dense_sampled
-
-        elif item_dense_col:
-            item_dense_sampled = self.data_info.item_dense_unique[
-                item_indices_sampled]
-            return item_dense_sampled
+
+class SharedNegativeSampling(NegativeSampling):
+    """Negative items shared within a training batch, for sampled softmax.
+
+    In "in_batch" mode the negatives of every row are the positive items of
+    `num_neg` other rows in the same batch, so they follow the item
+    popularity and no rejection sampling is needed. In "shared_pool" mode
+    a single pool of `num_neg` uniformly drawn items is shared by all rows.
+
+    Every batch contains the batch users, the distinct candidates (the batch
+    items, plus the pool in "shared_pool" mode), a `(batch_size, num_neg + 1)`
+    index of every row's candidates with the positive item first, and the
+    logQ correction of these candidates, i.e. the log probability of the
+    candidate being sampled, which is subtracted from the logits. Candidates
+    consumed by the user are accidental hits, whose correction is so large
+    that they drop out of the softmax.
+
+    Only models that compute the item side once per candidate and pair it
+    with users afterwards can use this layout, currently FM.
+
+    With `sparse` or `dense`, batches also contain the features of the batch
+    rows and of every candidate. Candidate rows hold the item features
+    looked up from `data_info`, and user columns are filled with oov
+    indices and zeros, which the model ignores.
+
+    Parameters
+    ----------
+    mode : str
+        Either "in_batch" or "shared_pool".
+    seed : int
+        Random seed of the negatives. Every batch draws from its own state
+        derived from the seed, the epoch and the batch position, so results
+        don't depend on the number of prefetching workers.
+    """
+
+    # same as `remove_accidental_hits` in `tf.nn.sampled_softmax_loss`
+    accidental_hit_value = np.finfo(np.float32).max / 2
+
+    def __init__(self, dataset, data_info, num_neg, mode="in_batch", seed=42,
+                 sparse=None, dense=None):
+        super(SharedNegativeSampling, self).__init__(
+            dataset, data_info, num_neg, sparse, dense, batch_sampling=True)
+        if mode not in ("in_batch", "shared_pool"):
+            raise ValueError(
+                "neg_sampling must either be 'in_batch' or 'shared_pool'"
+            )
+        self.mode = mode
+        self.seed = seed
+        self.epoch = 0
+        if mode == "in_batch":
+            item_counts = np.maximum(data_info.item_consumed.row_lengths, 1)
+            self.item_log_q = np.log(
+                item_counts / item_counts.sum()).astype(np.float32)
+        else:
+            self.item_log_q = None
+
+    def __call__(self, shuffle=True, batch_size=None):
+        self.epoch += 1
+        return super(SharedNegativeSampling, self).__call__(
+            shuffle, batch_size)
+
+    def sample_batch(self, user_consumed, n_items, batch_size):
+        for k in tqdm(range(0, self.data_size, batch_size),
+                      desc="shared_sampling train"):
+            yield self.get_batch(
+                slice(k, k + batch_size), user_consumed, n_items)
+
+    def get_batch(self, batch_slice, user_consumed=None, n_items=None):
+        if user_consumed is None:
+            user_consumed = self.data_info.user_consumed
+        if n_items is None:
+            n_items = self.data_info.n_items
+        rng = np.random.RandomState([self.seed, self.epoch, batch_slice.start])
+        rows = batch_rows(self.order, batch_slice)
+        batch_user_indices = self.user_indices[rows]
+        batch_item_indices = self.item_indices[rows]
+        batch_size = len(batch_user_indices)
+
+        if self.mode == "in_batch":
+            # every row takes the items of the rows at the same offsets
+            if batch_size > self.num_neg:
+                offsets = rng.choice(
+                    np.arange(1, batch_size), self.num_neg, replace=False)
+            else:
+                offsets = rng.randint(
+                    1, max(batch_size, 2), size=self.num_neg)
+            neg_rows = (
+                np.arange(batch_size)[:, None] + offsets
+            ) % batch_size
+            candidates = batch_item_indices
+        else:
+            pool = rng.randint(0, n_items, size=self.num_neg)
+            neg_rows = np.tile(
+                np.arange(batch_size, batch_size + self.num_neg),
+                (batch_size, 1)
+            )
+            candidates = np.append(batch_item_indices, pool)
+        candidates = candidates.astype(np.int32)
+        candidate_index = np.hstack(
+            [np.arange(batch_size)[:, None], neg_rows]).astype(np.int32)
+
+        batch = (
+            batch_user_indices,
+            candidates,
+            self._label_negative_sampling(batch_size),
+            self.sparse_indices[rows] if self.sparse else None,
+            self.dense_values[rows] if self.dense else None,
+            self._log_q(batch_user_indices, candidates[candidate_index],
+                        user_consumed),
+            candidate_index
+        )
+        if self.sparse or self.dense:
+            batch += self._candidate_features(candidates)
+        return batch
+
+    def _candidate_features(self, candidates):
+        data_info = self.data_info
+        n_candidates = len(candidates)
+        if self.sparse:
+            user_oov = np.broadcast_to(
+                data_info.sparse_oov,
+                (n_candidates, len(data_info.sparse_oov))
+            )
+            sparse_indices = merge_user_item_features(
+                user_oov,
+                data_info.item_sparse_unique,
+                candidates,
+                data_info.user_sparse_col.index,
+                data_info.item_sparse_col.index
+            )
+        else:
+            sparse_indices = None
+        if self.dense:
+            user_zeros = np.zeros(
+                (n_candidates, len(data_info.dense_col.name)),
+                dtype=np.float32
+            )
+            dense_values = merge_user_item_features(
+                user_zeros,
+                data_info.item_dense_unique,
+                candidates,
+                data_info.user_dense_col.index,
+                data_info.item_dense_col.index
+            )
+        else:
+            dense_values = None
+        return sparse_indices, dense_values
+
+    def _log_q(self, user_indices, row_items, user_consumed):
+        # uniform pool has a constant correction, which cancels in softmax
+        log_q = (
+            self.item_log_q[row_items]
+            if self.item_log_q is not None
+            else np.zeros(row_items.shape, dtype=np.float32)
+        )
+        accidental_hits = user_consumed.isin(
+            np.repeat(user_indices, self.num_neg), row_items[:, 1:].ravel()
+        ).reshape(len(user_indices), self.num_neg)
+        log_q[:, 1:][accidental_hits] = self.accidental_hit_value
+        return log_q
 
 
 class PairwiseSampling(SamplingBase):
-    def __init__(self, dataset, data_info, num_neg=1):
+    def __init__(self, dataset, data_info, num_neg=1, item_gen_mode="random",
+                 popular_power=1.0, num_threads=1, hard_sampler=None):
         super(PairwiseSampling, self).__init__(dataset, data_info, num_neg)
+        self.num_threads = num_threads
+        self.hard_sampler = hard_sampler
 
         if dataset.has_sampled:
             self.user_indices = dataset.user_indices_orig
@@ -263,84 +663,135 @@ class PairwiseSampling(SamplingBase):
             self.item_indices = dataset.item_indices
         self.data_size = len(self.user_indices)
 
+        if item_gen_mode not in ["random", "popular"]:
+            raise ValueError(
+                "sampling item_gen_mode must either be 'random' or 'popular'"
+            )
+        self.sampler = (
+            self.popular_sampler(popular_power)
+            if item_gen_mode == "popular"
+            else None
+        )
+
     def __call__(self, shuffle=True, batch_size=None):
-        if shuffle:
-            mask = np.random.permutation(range(self.data_size))
-            self.user_indices = self.user_indices[mask]
-            self.item_indices = self.item_indices[mask]
-
-        user_consumed_set = {
-            u: set(items) for u, items in self.data_info.user_consumed.items()
-        }
+        self.shuffle(shuffle)
+        user_consumed = self.data_info.user_consumed
         n_items = self.data_info.n_items
-        return self.sample_batch(user_consumed_set, n_items, batch_size)
+        return self.sample_batch(user_consumed, n_items, batch_size)
 
-    def sample_batch(self, user_consumed_set, n_items, batch_size):
+    def sample_batch(self, user_consumed, n_items, batch_size):
         for k in tqdm(range(0, self.data_size, batch_size),
                       desc="pair_sampling train"):
-            batch_slice = slice(k, k + batch_size)
-            batch_user_indices = self.user_indices[batch_slice]
-            batch_item_indices_pos = self.item_indices[batch_slice]
-
-            batch_item_indices_neg = list()
-            for u in batch_user_indices:
-                item_neg = floor(n_items * random())
-                while item_neg in user_consumed_set[u]:
-                    item_neg = floor(n_items * random())
-                batch_item_indices_neg.append(item_neg)
-
-            batch_item_indices_neg = np.asarray(batch_item_indices_neg)
-            yield (
-                batch_user_indices,
-                batch_item_indices_pos,
-                batch_item_indices_neg
-            )
+            yield self.get_batch(
+                slice(k, k + batch_size), user_consumed, n_items)
+
+    def get_batch(self, batch_slice, user_consumed=None, n_items=None):
+        if user_consumed is None:
+            user_consumed = self.data_info.user_consumed
+        if n_items is None:
+            n_items = self.data_info.n_items
+        rows = batch_rows(self.order, batch_slice)
+        batch_user_indices = self.user_indices[rows]
+        batch_item_indices_pos = self.item_indices[rows]
+        batch_item_indices_neg = batch_negatives(
+            batch_user_indices,
+            user_consumed,
+            n_items,
+            self.sampler,
+            self.num_threads
+        )
+        batch_item_indices_neg = self._hard_negatives(
+            batch_user_indices, batch_item_indices_neg, batch_slice)
+        return (
+            batch_user_indices,
+            batch_item_indices_pos,
+            batch_item_indices_neg
+        )
+
+    def _hard_negatives(self, user_indices, item_indices_neg, batch_slice):
+        if self.hard_sampler is None:
+            return item_indices_neg
+        return self.hard_sampler.sample(
+            user_indices, item_indices_neg, batch_slice.start)
 
 
 class PairwiseSamplingSeq(PairwiseSampling):
-    def __init__(self, dataset, data_info, num_neg=1, mode=None, num=None):
-        super(PairwiseSamplingSeq, self).__init__(dataset, data_info, num_neg)
+    def __init__(self, dataset, data_info, num_neg=1, mode=None, num=None,
+                 item_gen_mode="random", popular_power=1.0, num_threads=1,
+                 hard_sampler=None):
+        super(PairwiseSamplingSeq, self).__init__(
+            dataset, data_info, num_neg, item_gen_mode, popular_power,
+            num_threads, hard_sampler)
 
         self.seq_mode = mode
         self.seq_num = num
         self.n_items = data_info.n_items
         self.user_consumed = data_info.user_consumed
+        self.positions = dataset.interaction_positions(
+            self.user_consumed, orig=True)
 
-    def sample_batch(self, user_consumed_set, n_items, batch_size):
-        # avoid circular import
-        from ..data.sequence import user_interacted_seq
-
+    def sample_batch(self, user_consumed, n_items, batch_size):
         for k in tqdm(range(0, self.data_size, batch_size),
                       desc="pair_sampling sequence train"):
-            batch_slice = slice(k, k + batch_size)
-            batch_user_indices = self.user_indices[batch_slice]
-            batch_item_indices_pos = self.item_indices[batch_slice]
-
-            (
-                batch_interacted,
-                batch_interacted_len
-            ) = user_interacted_seq(
-                batch_user_indices,
-                batch_item_indices_pos,
+            yield self.get_batch(
+                slice(k, k + batch_size), user_consumed, n_items)
+
+    def get_batch(self, batch_slice, user_consumed=None, n_items=None):
+        if user_consumed is None:
+            user_consumed = self.data_info.user_consumed
+        if n_items is None:
+            n_items = self.data_info.n_items
+        rows = batch_rows(self.order, batch_slice)
+        batch_user_indices = self.user_indices[rows]
+        batch_item_indices_pos = self.item_indices[rows]
+
+        (
+            batch_interacted,
+            batch_interacted_len
+        ) = self._interacted_seq(
+            batch_user_indices,
+            batch_item_indices_pos,
+            self.positions[rows]
+        )
+
+        batch_item_indices_neg = batch_negatives(
+            batch_user_indices,
+            user_consumed,
+            n_items,
+            self.sampler,
+            self.num_threads
+        )
+        batch_item_indices_neg = self._hard_negatives(
+            batch_user_indices, batch_item_indices_neg, batch_slice)
+        return (
+            batch_user_indices,
+            batch_item_indices_pos,
+            batch_item_indices_neg,
+            batch_interacted,
+            batch_interacted_len
+        )
+
+    def _interacted_seq(self, user_indices, item_indices, positions):
+        if interacted_seq_parallel is None:
+            # avoid circular import
+            from ..data.sequence import user_interacted_seq
+            return user_interacted_seq(
+                user_indices,
+                item_indices,
                 self.user_consumed,
                 self.n_items,
                 self.seq_mode,
                 self.seq_num,
-                user_consumed_set
-            )
-
-            batch_item_indices_neg = list()
-            for u in batch_user_indices:
-                item_neg = floor(n_items * random())
-                while item_neg in user_consumed_set[u]:
-                    item_neg = floor(n_items * random())
-                batch_item_indices_neg.append(item_neg)
-
-            batch_item_indices_neg = np.asarray(batch_item_indices_neg)
-            yield (
-                batch_user_indices,
-                batch_item_indices_pos,
-                batch_item_indices_neg,
-                batch_interacted,
-                batch_interacted_len
+                positions
             )
+        return interacted_seq_parallel(
+            np.asarray(user_indices, dtype=np.int32),
+            positions.astype(np.int64, copy=False),
+            self.user_consumed.indices.astype(np.int32, copy=False),
+            self.user_consumed.indptr.astype(np.int64, copy=False),
+            self.n_items,
+            self.seq_num,
+            self.seq_mode == "random",
+            np.random.randint(np.iinfo(np.int32).max),
+            self.num_threads
+        )
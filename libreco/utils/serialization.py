@@ -97,7 +97,7 @@ def convert_last_interacted_to_json(model):
     seq_len = model.max_seq_len
     u_last_interacted = dict()
     for u, consumed in model.user_consumed.items():
-        u_last_interacted[int(u)] = list(consumed)[-seq_len:]
+        u_last_interacted[int(u)] = consumed[-seq_len:].tolist()
     return u_last_interacted
 
 
@@ -12,7 +12,10 @@ try:
         forward_pearson,
         invert_pearson,
         forward_jaccard,
-        invert_jaccard
+        invert_jaccard,
+        invert_cosine_topk,
+        invert_pearson_topk,
+        invert_jaccard_topk
     )
 except (ImportError, ModuleNotFoundError):
     LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
@@ -40,7 +43,8 @@ def _choose_blocks(num, b_size=None):
 
 
 def cosine_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
-               num_threads=1, min_common=1, mode="invert"):
+               num_threads=1, min_common=1, mode="invert", top_k=None):
+    _check_top_k_mode(mode, top_k)
     block_size, block_num = _choose_blocks(num_x, block_size)
     n_x, n_y = num_x, num_y
 
@@ -59,6 +63,11 @@ def cosine_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
         data = sparse_data_y.data.astype(np.float32)
         x_norm = compute_sparse_norm(sparse_data_x)
 
+        if top_k is not None:
+            return _top_k_matrix(*invert_cosine_topk(
+                indices, indptr, data, x_norm, min_common, n_x, n_y,
+                block_size, block_num, top_k, num_threads))
+
         res_indices, res_indptr, res_data = invert_cosine(
             indices, indptr, data, x_norm, min_common, n_x, n_y,
             block_size, block_num, num_threads)
@@ -74,7 +83,8 @@ def cosine_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
 
 
 def pearson_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
-                num_threads=1, min_common=1, mode="invert"):
+                num_threads=1, min_common=1, mode="invert", top_k=None):
+    _check_top_k_mode(mode, top_k)
     block_size, block_num = _choose_blocks(num_x, block_size)
     n_x, n_y = num_x, num_y
 
@@ -96,6 +106,12 @@ def pearson_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
         x_mean = compute_sparse_mean(sparse_data_x)
         x_mean_centered_norm = compute_sparse_mean_centered_norm(sparse_data_x)
 
+        if top_k is not None:
+            return _top_k_matrix(*invert_pearson_topk(
+                indices, indptr, data, x_mean, x_mean_centered_norm,
+                min_common, n_x, n_y, block_size, block_num, top_k,
+                num_threads))
+
         res_indices, res_indptr, res_data = invert_pearson(
             indices, indptr, data, x_mean, x_mean_centered_norm, min_common,
             n_x, n_y, block_size, block_num, num_threads)
@@ -111,7 +127,8 @@ def pearson_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
 
 
 def jaccard_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
-                num_threads=1, min_common=1, mode="invert"):
+                num_threads=1, min_common=1, mode="invert", top_k=None):
+    _check_top_k_mode(mode, top_k)
     block_size, block_num = _choose_blocks(num_x, block_size)
     n_x, n_y = num_x, num_y
 
@@ -130,6 +147,11 @@ def jaccard_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
         data = sparse_data_y.data.astype(np.float32)
         x_count = compute_sparse_count(sparse_data_x)
 
+        if top_k is not None:
+            return _top_k_matrix(*invert_jaccard_topk(
+                indices, indptr, data, x_count, min_common, n_x, n_y,
+                block_size, block_num, top_k, num_threads))
+
         res_indices, res_indptr, res_data = invert_jaccard(
             indices, indptr, data, x_count, min_common,
             n_x, n_y, block_size, block_num, num_threads)
@@ -144,6 +166,34 @@ def jaccard_sim(sparse_data_x, sparse_data_y, num_x, num_y, block_size=None,
     return sim_upper_triangular + sim_upper_triangular.transpose()
 
 
+def _check_top_k_mode(mode, top_k):
+    if top_k is None:
+        return
+    if mode != "invert":
+        raise ValueError(
+            "top_k similarities are only supported in 'invert' mode")
+    if top_k <= 0:
+        raise ValueError(f"top_k must be positive, got {top_k}")
+
+
+def _top_k_matrix(heap_ids, heap_sims, heap_sizes):
+    # Neighbors of each row are stored in an unordered (n_x, k) heap, so sort
+    # them by index to build a csr matrix with sorted indices. Empty slots get
+    # an index of n_x, which puts them at the end of each row.
+    n_x, k = heap_ids.shape
+    valid = np.arange(k) < heap_sizes[:, None]
+    heap_ids = np.where(valid, heap_ids, n_x)
+    order = np.argsort(heap_ids, axis=1, kind="stable")
+    res_indices = np.take_along_axis(heap_ids, order, axis=1)
+    res_data = np.take_along_axis(heap_sims, order, axis=1)
+    res_indptr = np.zeros(n_x + 1, dtype=np.int64)
+    np.cumsum(heap_sizes, out=res_indptr[1:])
+    return csr_matrix(
+        (res_data[valid], res_indices[valid], res_indptr),
+        shape=(n_x, n_x), dtype=np.float32
+    )
+
+
 def compute_sparse_norm(sparse_data):
     sparse_norm = spnorm(sparse_data, axis=1)
     return sparse_norm.astype(np.float32)
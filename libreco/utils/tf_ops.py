@@ -244,7 +244,7 @@ def modify_variable_names(model, trainable):
 
 
 def multi_sparse_combine_embedding(data_info, variables, all_sparse_indices,
-                                   combiner, embed_size):
+                                   combiner):
     field_offsets = data_info.multi_sparse_combine_info.field_offset
     field_lens = data_info.multi_sparse_combine_info.field_len
     feat_oovs = data_info.multi_sparse_combine_info.feat_oov
@@ -253,7 +253,7 @@ def multi_sparse_combine_embedding(data_info, variables, all_sparse_indices,
     # only one multi_sparse feature and no sparse features
     if sparse_end == 0 and len(field_offsets) == 1:
         result = multi_sparse_alone(variables, all_sparse_indices,
-                                    combiner, embed_size, field_offsets[0],
+                                    combiner, field_offsets[0],
                                     field_lens[0], feat_oovs[0])
     else:
         if sparse_end > 0:
@@ -266,31 +266,31 @@ def multi_sparse_combine_embedding(data_info, variables, all_sparse_indices,
         for offset, length, oov in zip(field_offsets, field_lens, feat_oovs):
             result.append(
                 multi_sparse_alone(variables, all_sparse_indices, combiner,
-                                   embed_size, offset, length, oov)
+                                   offset, length, oov)
             )
         result = tf.concat(result, axis=1)
     return result
 
 
 def multi_sparse_alone(variables, all_sparse_indices, combiner,
-                       embed_size, offset, length, oov):
+                       offset, length, oov):
     variable_dim = len(variables.get_shape().as_list())
-    # oov feats are padded to 0-vector
-    oov_indices = [oov] if variable_dim == 1 else oov
-    zero_padding_op = tf.scatter_update(
-        variables, oov_indices, tf.zeros([embed_size], dtype=tf.float32)
-    )
     multi_sparse_indices = all_sparse_indices[:, offset: offset + length]
+    # Padded and oov feats are dropped before the lookup, so only real
+    # tokens are embedded, then summed into their rows by segment ids.
+    # This is the same as treating oov feats as 0-vector.
+    token_mask = tf.not_equal(multi_sparse_indices, oov)
+    token_pos = tf.where(token_mask)
+    token_indices = tf.gather_nd(multi_sparse_indices, token_pos)
+    token_embed = tf.nn.embedding_lookup(variables, token_indices)
+    batch_size = tf.shape(multi_sparse_indices, out_type=tf.int64)[0]
+    res_embed = tf.math.unsorted_segment_sum(
+        token_embed, token_pos[:, 0], batch_size)
+    res_embed = tf.expand_dims(res_embed, axis=1)
 
-    with tf.control_dependencies([zero_padding_op]):
-        multi_sparse_embed = tf.nn.embedding_lookup(variables, multi_sparse_indices)
-
-    res_embed = tf.reduce_sum(multi_sparse_embed, axis=1, keepdims=True)
     if combiner in ("mean", "sqrtn"):
         multi_sparse_lens = tf.reduce_sum(
-            tf.cast(
-                tf.not_equal(multi_sparse_indices, oov), tf.float32
-            ), axis=1, keepdims=True
+            tf.cast(token_mask, tf.float32), axis=1, keepdims=True
         )
         if combiner == "sqrtn":
             multi_sparse_lens = tf.sqrt(multi_sparse_lens)
@@ -93,6 +93,12 @@ extensions = [
               language="c++",
               extra_compile_args=compile_args,
               extra_link_args=link_args),
+    Extension('libreco.utils._sampling',
+              [os.path.join("libreco", "utils", "_sampling.pyx")],
+              include_dirs=[np.get_include()],
+              language="c++",
+              extra_compile_args=compile_args,
+              extra_link_args=link_args),
     Extension('libreco.utils._similarities',
               [os.path.join("libreco", "utils", "_similarities.pyx")],
               include_dirs=[np.get_include()],
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+
+def feat_data(n=300, seed=0):
+    rng = np.random.RandomState(seed)
+    # string ids of different lengths, and an integer sparse column
+    users = np.array([f"user_{'x' * (i % 7)}{i}" for i in range(30)])
+    return pd.DataFrame({
+        "user": rng.choice(users, n),
+        "item": rng.randint(0, 25, n),
+        "label": rng.randint(0, 2, n).astype(np.float32),
+        "sex": rng.choice(["f", "m", "unknown"], n),
+        "city": rng.choice([10, 200, 3000], n),
+        "genre1": rng.choice(["a", "bb", "ccc"], n),
+        "genre2": rng.choice(["a", "bb", "missing"], n),
+        "price": rng.rand(n),
+    })
+
+
+FEAT_COLS = dict(
+    user_col=["sex", "city"],
+    item_col=["genre1", "genre2", "price"],
+    sparse_col=["sex", "city"],
+    multi_sparse_col=[["genre1", "genre2"]],
+    dense_col=["price"],
+)
+
+
+def assert_array_equal(loaded, expected):
+    """Compare arrays, lazy columns or ragged indices by their rows."""
+    if expected is None:
+        assert loaded is None
+        return
+    np.testing.assert_array_equal(np.asarray(loaded[:]),
+                                  np.asarray(expected[:]))
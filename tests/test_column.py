@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from libreco.feature.column import column_sparse_indices
+
+
+def test_unordered_indices_mixed_types():
+    unique = np.array(["b", "a", None, 3], dtype=object)
+    values = np.array([None, "a", 3, "z", "b"], dtype=object)
+    indices = column_sparse_indices(values, unique, "test", ordered=False)
+    np.testing.assert_array_equal(indices, [2, 1, 3, 4, 0])
+    with pytest.raises(KeyError):
+        column_sparse_indices(values, unique, "train", ordered=False)
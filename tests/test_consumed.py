@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from libreco.feature import ConsumedCSR
+
+
+def _dict_consumed(rows, cols):
+    # the former dict of lists, which appends in interaction order
+    consumed = defaultdict(list)
+    for r, c in zip(rows, cols):
+        consumed[r].append(c)
+    return consumed
+
+
+def _random_pairs(rng, n, n_rows, n_cols):
+    # few columns so that duplicate pairs are common
+    rows = rng.randint(0, n_rows, n)
+    cols = rng.randint(0, n_cols, n)
+    return rows, cols
+
+
+def _assert_same(csr, expected, n_rows):
+    assert sorted(csr.keys()) == sorted(expected.keys())
+    assert len(csr) == len(expected)
+    for r in range(n_rows + 3):
+        np.testing.assert_array_equal(csr[r], expected.get(r, []))
+        assert (r in csr) == (r in expected)
+
+
+def test_from_pairs_keeps_order_and_duplicates():
+    rng = np.random.RandomState(0)
+    # rows 0, 5 and 19 never appear
+    rows, cols = _random_pairs(rng, 300, 20, 8)
+    rows[np.isin(rows, [0, 5])] = 1
+    consumed = ConsumedCSR.from_pairs(rows, cols, n_rows=20)
+    expected = _dict_consumed(rows.tolist(), cols.tolist())
+    _assert_same(consumed, expected, 20)
+    assert len(consumed[5]) == 0
+    assert consumed.get(5) is None
+
+
+@pytest.mark.parametrize("sort_before", [False, True])
+def test_append_matches_dict(sort_before):
+    rng = np.random.RandomState(1)
+    rows, cols = _random_pairs(rng, 200, 10, 6)
+    consumed = ConsumedCSR.from_pairs(rows, cols)
+    expected = _dict_consumed(rows.tolist(), cols.tolist())
+    if sort_before:
+        # the cached sorted order is merged instead of recomputed
+        consumed.isin([0], [0])
+    for n_rows, n_cols in [(10, 6), (15, 6), (25, 9)]:
+        # new pairs reach rows and columns beyond the current size
+        new_rows, new_cols = _random_pairs(rng, 80, n_rows, n_cols)
+        consumed = consumed.append(new_rows, new_cols)
+        for r, c in zip(new_rows.tolist(), new_cols.tolist()):
+            expected[r].append(c)
+        _assert_same(consumed, expected, n_rows)
+        assert consumed.n_cols == n_cols
+        _check_queries(consumed, expected, rng, n_rows, n_cols)
+
+
+def _check_queries(consumed, expected, rng, n_rows, n_cols):
+    counts = consumed.unique_row_counts()
+    for r in range(consumed.n_rows):
+        assert counts[r] == len(set(expected.get(r, [])))
+
+    # query rows and columns beyond the stored ones as well
+    q_rows = rng.randint(0, n_rows + 3, 500)
+    q_cols = rng.randint(-1, n_cols + 2, 500)
+    isin = consumed.isin(q_rows, q_cols)
+    positions = consumed.first_positions(q_rows, q_cols)
+    for k, (r, c) in enumerate(zip(q_rows.tolist(), q_cols.tolist())):
+        seq = expected.get(r, [])
+        assert isin[k] == (c in seq)
+        assert positions[k] == (seq.index(c) if c in seq else -1)
+        assert consumed.contains(r, c) == (c in seq)
+        np.testing.assert_array_equal(consumed.sorted_row(r), sorted(seq))
+
+
+def test_queries_match_dict():
+    rng = np.random.RandomState(2)
+    rows, cols = _random_pairs(rng, 300, 12, 7)
+    consumed = ConsumedCSR.from_pairs(rows, cols, n_rows=14)
+    expected = _dict_consumed(rows.tolist(), cols.tolist())
+    _check_queries(consumed, expected, rng, 14, 7)
+
+
+def test_empty():
+    consumed = ConsumedCSR.from_pairs([], [])
+    assert len(consumed) == 0
+    assert not consumed.isin([0, 1], [0, 1]).any()
+    appended = consumed.append([2, 2], [1, 1])
+    np.testing.assert_array_equal(appended[2], [1, 1])
+    np.testing.assert_array_equal(appended.unique_row_counts(), [0, 0, 1])
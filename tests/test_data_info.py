@@ -0,0 +1,78 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from libreco.data import DataInfo, DatasetFeat
+
+from conftest import FEAT_COLS, assert_array_equal, feat_data
+
+
+def _assert_data_info_equal(loaded, data_info):
+    for name in ("user_unique_vals", "item_unique_vals",
+                 "user_sparse_unique", "user_dense_unique",
+                 "item_sparse_unique", "item_dense_unique",
+                 "sparse_offset", "sparse_oov"):
+        assert_array_equal(getattr(loaded, name), getattr(data_info, name))
+    # string ids keep their dtype instead of becoming fixed-width unicode
+    assert loaded.user_unique_vals.dtype == data_info.user_unique_vals.dtype
+    assert loaded.user2id == data_info.user2id
+    assert loaded.item2id == data_info.item2id
+    for col, vals in data_info.sparse_unique_vals.items():
+        assert loaded.sparse_unique_vals[col].dtype == vals.dtype
+        assert_array_equal(loaded.sparse_unique_vals[col], vals)
+    for col, vals in data_info.multi_sparse_unique_vals.items():
+        assert_array_equal(loaded.multi_sparse_unique_vals[col], vals)
+    assert (loaded.multi_sparse_combine_info
+            == data_info.multi_sparse_combine_info)
+    for consumed in ("user_consumed", "item_consumed"):
+        assert_array_equal(getattr(loaded, consumed).indptr,
+                            getattr(data_info, consumed).indptr)
+        assert_array_equal(getattr(loaded, consumed).indices,
+                            getattr(data_info, consumed).indices)
+    for field in data_info.interactions._fields:
+        assert_array_equal(getattr(loaded.interactions, field),
+                            getattr(data_info.interactions, field))
+    assert loaded.compact == data_info.compact
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+def test_data_info_round_trip(tmp_path, mmap, compact):
+    train, data_info = DatasetFeat.build_trainset(
+        feat_data(), **FEAT_COLS, reset_state=True, compact=compact)
+    data_info.save(str(tmp_path), mmap=mmap)
+    loaded = DataInfo.load(str(tmp_path), mmap_mode="r" if mmap else None)
+    _assert_data_info_equal(loaded, data_info)
+
+
+def test_data_info_load_v1(tmp_path):
+    train, data_info = DatasetFeat.build_trainset(
+        feat_data(), **FEAT_COLS, reset_state=True)
+    data_info.save(str(tmp_path), mmap=True)
+    array_path = os.path.join(str(tmp_path), "data_info")
+    meta_path = os.path.join(array_path, "meta.json")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # version 1 had no hashed columns and stored strings as unicode
+    meta["version"] = 1
+    del meta["hash_buckets"]
+    meta["pickled"].remove("user_unique_vals")
+    np.save(os.path.join(array_path, "user_unique_vals.npy"),
+            data_info.user_unique_vals.astype(str))
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+    loaded = DataInfo.load(str(tmp_path), mmap_mode="r")
+    assert loaded.user2id == data_info.user2id
+    assert_array_equal(loaded.user_consumed.indices,
+                        data_info.user_consumed.indices)
+    assert_array_equal(loaded.item_sparse_unique,
+                        data_info.item_sparse_unique)
+
+    meta["version"] = 3
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        DataInfo.load(str(tmp_path))
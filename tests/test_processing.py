@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from libreco.data import DenseScaler
+
+
+def _fit_chunks(data, normalizer, chunk_size=30):
+    scaler = DenseScaler(list(data.columns), normalizer)
+    for i in range(0, len(data), chunk_size):
+        scaler.partial_fit(data.iloc[i: i + chunk_size])
+    return scaler
+
+
+def test_dense_scaler_clips_below_fitted_min():
+    rng = np.random.RandomState(0)
+    train = pd.DataFrame({"price": rng.uniform(5.0, 10.0, 100)})
+    train.loc[0, "price"] = 5.0
+    train.loc[1, "price"] = 10.0
+    scaler = _fit_chunks(train, "min_max")
+    # derived columns only exist for non-negative scaled values
+    assert scaler.transformed_col == [
+        "price", "price_log", "price_sqrt", "price_square"]
+
+    # new values far below the fitted minimum
+    test = pd.DataFrame({"price": [-100.0, 0.0, 4.9, 5.0, 7.5]})
+    values = scaler.transform_data(test)
+    assert np.all(np.isfinite(values))
+    np.testing.assert_array_equal(values[:4, 1:], 0.0)
+    np.testing.assert_allclose(values[:, 0], (test["price"] - 5.0) / 5.0,
+                               rtol=1e-4)
+    np.testing.assert_allclose(values[4, 1:],
+                               [np.log1p(0.5), np.sqrt(0.5), 0.25], rtol=1e-5)
+
+    restored = DenseScaler.from_params(scaler.get_params())
+    columns = restored.transform_columns({"price": test["price"].to_numpy()})
+    for j, col in enumerate(scaler.transformed_col):
+        np.testing.assert_allclose(columns[col], values[:, j], rtol=1e-6)
+
+
+def test_dense_scaler_standard_matches_sklearn():
+    rng = np.random.RandomState(1)
+    train = pd.DataFrame({"price": rng.normal(3.0, 2.0, 100),
+                          "age": rng.uniform(10.0, 60.0, 100)})
+    # scaled values within 4, where float32 rounding stays below 2e-7
+    test = pd.DataFrame({"price": rng.normal(3.0, 2.0, 20),
+                         "age": rng.uniform(10.0, 60.0, 20)})
+    scaler = _fit_chunks(train, "standard")
+    # standardized columns always have negative values, so nothing derived
+    assert scaler.transformed_col == ["price", "age"]
+
+    expected = StandardScaler().fit(train).transform(test)
+    np.testing.assert_allclose(scaler.transform_data(test), expected,
+                               rtol=0, atol=2e-7)
+    restored = DenseScaler.from_params(scaler.get_params())
+    np.testing.assert_allclose(restored.transform_data(test), expected,
+                               rtol=0, atol=2e-7)
+    columns = restored.transform_columns(
+        {"age": test["age"].to_numpy()})
+    assert list(columns) == ["age"]
+    np.testing.assert_allclose(columns["age"], expected[:, 1],
+                               rtol=0, atol=2e-7)
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from libreco.data import DatasetFeat, TransformedSet
+
+
+def _feat_data(n=400, seed=0):
+    rng = np.random.RandomState(seed)
+    tags = np.array(["a", "b", "c", "d", "missing"])
+    data = pd.DataFrame({
+        "user": rng.randint(0, 40, n),
+        "item": rng.randint(0, 30, n),
+        "label": rng.randint(0, 2, n).astype(np.float32),
+        "sex": rng.choice(["f", "m"], n),
+        "genre1": rng.choice(tags, n),
+        "genre2": rng.choice(tags, n),
+        "genre3": "missing",
+        "tag1": rng.choice(tags, n),
+        "tag2": rng.choice(tags, n),
+    })
+    # an oov value in the middle of a row must survive
+    data.loc[:10, "genre1"] = "missing"
+    return data
+
+
+FEAT_COLS = dict(
+    user_col=["sex"],
+    item_col=["genre1", "genre2", "genre3", "tag1", "tag2"],
+    sparse_col=["sex"],
+    multi_sparse_col=[["genre1", "genre2", "genre3"], ["tag1", "tag2"]],
+)
+
+
+def _build(data, ragged, **kwargs):
+    train, data_info = DatasetFeat.build_trainset(
+        data, **FEAT_COLS, reset_state=True, ragged=ragged, **kwargs)
+    test = DatasetFeat.build_testset(data, ragged=ragged)
+    return train, test, data_info
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_ragged_matches_padded(shuffle):
+    data = _feat_data()
+    train, test, data_info = _build(data, False, shuffle=shuffle)
+    train_r, test_r, data_info_r = _build(data, True, shuffle=shuffle)
+    assert train_r.sparse_indices.nbytes < train.sparse_indices.nbytes
+    assert train_r.sparse_indices.shape == train.sparse_indices.shape
+    np.testing.assert_array_equal(train_r.sparse_indices[:],
+                                  train.sparse_indices)
+    np.testing.assert_array_equal(test_r.sparse_indices[:],
+                                  test.sparse_indices)
+    np.testing.assert_array_equal(data_info_r.item_sparse_unique,
+                                  data_info.item_sparse_unique)
+
+    rows = np.random.RandomState(1).randint(-len(data), len(data), 64)
+    np.testing.assert_array_equal(train_r.sparse_indices[rows],
+                                  train.sparse_indices[rows])
+    np.testing.assert_array_equal(train_r.sparse_indices[5],
+                                  train.sparse_indices[5])
+    np.testing.assert_array_equal(train_r.sparse_indices.take_rows(rows)[:],
+                                  train.sparse_indices[rows])
+
+
+def test_ragged_from_chunks():
+    data = _feat_data()
+    chunks = [data.iloc[i: i + 77] for i in range(0, len(data), 77)]
+    padded, _ = DatasetFeat.build_trainset_from_chunks(
+        chunks, **FEAT_COLS, shuffle=True, reset_state=True)
+    ragged, _ = DatasetFeat.build_trainset_from_chunks(
+        chunks, **FEAT_COLS, shuffle=True, reset_state=True, ragged=True)
+    np.testing.assert_array_equal(ragged.sparse_indices[:],
+                                  padded.sparse_indices)
+
+
+def test_ragged_save_load(tmp_path):
+    train, _, data_info = _build(_feat_data(), True)
+    train.build_negative_samples(data_info, num_neg=2, lazy=True)
+    train.save(str(tmp_path))
+    loaded = TransformedSet.load(str(tmp_path), data_info=data_info)
+    np.testing.assert_array_equal(loaded.sparse_indices_orig[:],
+                                  train.sparse_indices_orig[:])
+    np.testing.assert_array_equal(loaded.sparse_indices[:],
+                                  train.sparse_indices[:])
+
+
+@pytest.mark.parametrize("ragged", [False, True])
+def test_compact_from_chunks(ragged):
+    data = _feat_data()
+    chunks = [data.iloc[i: i + 77] for i in range(0, len(data), 77)]
+    train, data_info = DatasetFeat.build_trainset(
+        data, **FEAT_COLS, reset_state=True, compact=True)
+    train_c, data_info_c = DatasetFeat.build_trainset_from_chunks(
+        chunks, **FEAT_COLS, reset_state=True, compact=True, ragged=ragged)
+    assert data_info_c.compact
+    assert train_c.sparse_indices.dtype == train.sparse_indices.dtype
+    np.testing.assert_array_equal(train_c.sparse_indices[:],
+                                  train.sparse_indices)
+    assert (data_info_c.item_sparse_unique.dtype
+            == data_info.item_sparse_unique.dtype)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from libreco.utils.similarities import cosine_sim, jaccard_sim, pearson_sim
+
+
+def _interaction_data(seed=1):
+    user_item = sp.random(300, 120, density=0.08, format="csr",
+                          random_state=seed, dtype=np.float32)
+    user_item.data = np.ceil(user_item.data * 5).astype(np.float32)
+    return user_item.T.tocsr(), user_item
+
+
+def _top_k_rows(sim_matrix, k):
+    # neighbors sorted by similarity in descending order, ties by index
+    rows = []
+    for i in range(sim_matrix.shape[0]):
+        row = slice(sim_matrix.indptr[i], sim_matrix.indptr[i + 1])
+        indices = sim_matrix.indices[row]
+        sims = sim_matrix.data[row]
+        order = np.lexsort((indices, -sims))[:k]
+        rows.append(dict(zip(indices[order].tolist(), sims[order].tolist())))
+    return rows
+
+
+@pytest.mark.parametrize("sim_func", [cosine_sim, pearson_sim, jaccard_sim])
+@pytest.mark.parametrize("k, block_size, min_common",
+                         [(5, None, 1), (20, 37, 2), (1, 7, 1)])
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_top_k_equals_full_matrix(sim_func, k, block_size, min_common,
+                                  num_threads):
+    item_user, user_item = _interaction_data()
+    full = sim_func(item_user, user_item, 120, 300, block_size, num_threads,
+                    min_common, "invert")
+    top_k = sim_func(item_user, user_item, 120, 300, block_size, num_threads,
+                     min_common, "invert", top_k=k)
+    assert top_k.has_sorted_indices
+    expected = _top_k_rows(full, k)
+    result = _top_k_rows(top_k, k)
+    for expected_row, result_row in zip(expected, result):
+        assert expected_row.keys() == result_row.keys()
+        np.testing.assert_allclose(
+            [result_row[i] for i in expected_row],
+            list(expected_row.values()),
+            atol=1e-5
+        )
+
+
+def test_top_k_skips_zero_similarities():
+    # item 1 has the same rating from every user, so its mean-centered
+    # norm is zero and its pearson similarity to other items is exactly zero
+    user_item = sp.csr_matrix(np.array([
+        [2, 5, 1],
+        [4, 5, 0],
+        [0, 0, 3],
+    ], dtype=np.float32))
+    item_user = user_item.T.tocsr()
+    full = pearson_sim(item_user, user_item, 3, 3, mode="invert")
+    top_k = pearson_sim(item_user, user_item, 3, 3, mode="invert", top_k=2)
+    assert top_k.getrow(1).nnz == 0
+    assert np.all(top_k.data != 0.0)
+    assert _top_k_rows(top_k, 2) == _top_k_rows(full, 2)
+
+
+def test_top_k_same_for_any_num_threads():
+    item_user, user_item = _interaction_data(seed=2)
+    single = cosine_sim(item_user, user_item, 120, 300, 13, 1,
+                        mode="invert", top_k=10)
+    multi = cosine_sim(item_user, user_item, 120, 300, 13, 4,
+                       mode="invert", top_k=10)
+    np.testing.assert_array_equal(single.indptr, multi.indptr)
+    np.testing.assert_array_equal(single.indices, multi.indices)
+    np.testing.assert_array_equal(single.data, multi.data)
+
+
+def test_top_k_only_in_invert_mode():
+    item_user, user_item = _interaction_data()
+    with pytest.raises(ValueError):
+        cosine_sim(item_user, user_item, 120, 300, mode="forward", top_k=3)
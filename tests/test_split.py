@@ -0,0 +1,146 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.model_selection import train_test_split
+
+from libreco.data import random_split, split_by_num, split_by_ratio
+
+
+def _data(seed=0):
+    rng = np.random.RandomState(seed)
+    # user counts from 1 to 12, so some users have fewer rows than a split
+    # needs and some rows round to an empty test fold
+    users = np.repeat(np.arange(12), np.arange(1, 13))
+    users = users[rng.permutation(len(users))]
+    return pd.DataFrame({
+        "user": users,
+        "item": rng.randint(0, 20, len(users)),
+        "label": rng.randint(0, 2, len(users)),
+    })
+
+
+def _groupby_user(user_indices):
+    _, user_position, user_counts = np.unique(
+        user_indices, return_inverse=True, return_counts=True)
+    return np.split(np.argsort(user_position, kind="mergesort"),
+                    np.cumsum(user_counts)[:-1])
+
+
+def _old_split_by_ratio(data, ratios):
+    # former per-user loop
+    cum_ratios = np.cumsum(ratios).tolist()[:-1]
+    split_indices_all = [[] for _ in range(len(ratios))]
+    for u_data in _groupby_user(data.user.to_numpy()):
+        if len(u_data) <= 3:
+            split_indices_all[0].extend(u_data)
+        else:
+            u_split_data = np.split(u_data, [
+                round(cum * len(u_data)) for cum in cum_ratios
+            ])
+            for i in range(len(ratios)):
+                split_indices_all[i].extend(list(u_split_data[i]))
+    return [data.iloc[idx] for idx in split_indices_all]
+
+
+def _old_split_by_num(data, test_size):
+    train_indices, test_indices = [], []
+    for u_data in _groupby_user(data.user.to_numpy()):
+        u_data_len = len(u_data)
+        if u_data_len <= 3:
+            train_indices.extend(u_data)
+        elif u_data_len <= test_size:
+            train_indices.extend(u_data[:-1])
+            test_indices.extend(u_data[-1:])
+        else:
+            train_indices.extend(u_data[:(u_data_len - test_size)])
+            test_indices.extend(u_data[-test_size:])
+    return [data.iloc[train_indices], data.iloc[test_indices]]
+
+
+def _old_random_split(data, ratios, shuffle, seed):
+    ratios = list(ratios)
+    train_data = data
+    split_data_all = []
+    for _ in range(len(ratios) - 1):
+        size = ratios.pop(-1)
+        ratios = [r / math.fsum(ratios) for r in ratios]
+        train_data, split_data = train_test_split(
+            train_data, test_size=size, shuffle=shuffle, random_state=seed)
+        split_data_all.insert(0, split_data)
+    split_data_all.insert(0, train_data)
+    return split_data_all
+
+
+def _old_filter_unknown(data_list):
+    train_data = data_list[0]
+    users, items = set(train_data.user), set(train_data.item)
+    return [train_data] + [
+        d[[u in users and i in items for u, i in zip(d.user, d.item)]]
+        for d in data_list[1:]
+    ]
+
+
+def _assert_splits_equal(splits, expected):
+    assert len(splits) == len(expected)
+    for s, e in zip(splits, expected):
+        pd.testing.assert_frame_equal(s, e)
+
+
+@pytest.mark.parametrize("ratios", [[0.8, 0.2], [0.5, 0.3, 0.2]])
+@pytest.mark.parametrize("filter_unknown", [False, True])
+def test_split_by_ratio_matches_loop(ratios, filter_unknown):
+    data = _data()
+    splits = split_by_ratio(data, multi_ratios=ratios,
+                            filter_unknown=filter_unknown, seed=1)
+    expected = _old_split_by_ratio(data, ratios)
+    if filter_unknown:
+        expected = _old_filter_unknown(expected)
+    _assert_splits_equal(splits, expected)
+
+
+@pytest.mark.parametrize("test_size", [1, 2, 5])
+@pytest.mark.parametrize("filter_unknown", [False, True])
+def test_split_by_num_matches_loop(test_size, filter_unknown):
+    data = _data()
+    splits = split_by_num(data, test_size=test_size,
+                          filter_unknown=filter_unknown, seed=1)
+    expected = _old_split_by_num(data, test_size)
+    if filter_unknown:
+        expected = _old_filter_unknown(expected)
+    _assert_splits_equal(splits, expected)
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_split_shuffle_keeps_rows(shuffle):
+    data = _data()
+    for splits, expected in [
+        (split_by_ratio(data, test_size=0.3, shuffle=shuffle,
+                        filter_unknown=False, seed=3),
+         _old_split_by_ratio(data, [0.7, 0.3])),
+        (split_by_num(data, test_size=2, shuffle=shuffle,
+                      filter_unknown=False, seed=3),
+         _old_split_by_num(data, 2)),
+    ]:
+        for s, e in zip(splits, expected):
+            np.testing.assert_array_equal(np.sort(s.index), np.sort(e.index))
+
+
+@pytest.mark.parametrize("ratios", [[0.8, 0.2], [0.6, 0.25, 0.15]])
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_random_split_matches_iterative(ratios, shuffle):
+    data = _data()
+    splits = random_split(data, multi_ratios=ratios, shuffle=shuffle,
+                          filter_unknown=False, seed=7)
+    expected = _old_random_split(data, ratios, shuffle, seed=7)
+    # fold sizes are the same, and rows are only the same without shuffle
+    assert [len(s) for s in splits] == [len(e) for e in expected]
+    all_rows = np.concatenate([s.index for s in splits])
+    np.testing.assert_array_equal(np.sort(all_rows), data.index)
+    if not shuffle:
+        _assert_splits_equal(splits, expected)
+    else:
+        again = random_split(data, multi_ratios=ratios, shuffle=shuffle,
+                             filter_unknown=False, seed=7)
+        _assert_splits_equal(splits, again)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from libreco.data import DatasetFeat, DatasetPure, TransformedSet
+
+from conftest import FEAT_COLS, assert_array_equal, feat_data
+
+
+def _assert_transformed_equal(loaded, transformed):
+    assert len(loaded) == len(transformed)
+    assert loaded.has_sampled == transformed.has_sampled
+    for name in ("user_indices", "item_indices", "labels", "sparse_indices",
+                 "dense_values", "user_indices_orig", "item_indices_orig",
+                 "labels_orig", "sparse_indices_orig", "dense_values_orig"):
+        assert_array_equal(getattr(loaded, name),
+                            getattr(transformed, name))
+    rows = np.random.RandomState(0).permutation(len(transformed))[:50]
+    for loaded_part, part in zip(loaded[rows], transformed[rows]):
+        assert_array_equal(loaded_part, part)
+
+
+@pytest.mark.parametrize("sampling", [None, "eager", "lazy"])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_transformed_train_round_trip(tmp_path, sampling, mmap):
+    train, data_info = DatasetFeat.build_trainset(
+        feat_data(), **FEAT_COLS, reset_state=True)
+    if sampling is not None:
+        train.build_negative_samples(data_info, num_neg=2,
+                                     lazy=sampling == "lazy")
+    train.save(str(tmp_path))
+    loaded = TransformedSet.load(str(tmp_path), mmap=mmap,
+                                 data_info=data_info)
+    _assert_transformed_equal(loaded, train)
+    assert (loaded.sparse_interaction != train.sparse_interaction).nnz == 0
+
+
+def test_transformed_test_round_trip(tmp_path):
+    data = feat_data()
+    DatasetFeat.build_trainset(data, **FEAT_COLS, reset_state=True)
+    test = DatasetFeat.build_testset(feat_data(seed=1))
+    test.save(str(tmp_path))
+    loaded = TransformedSet.load(str(tmp_path))
+    _assert_transformed_equal(loaded, test)
+    assert_array_equal(loaded.user_consumed.indptr,
+                        test.user_consumed.indptr)
+    assert_array_equal(loaded.user_consumed.indices,
+                        test.user_consumed.indices)
+
+
+def test_transformed_lazy_pure_round_trip(tmp_path):
+    train, data_info = DatasetPure.build_trainset(
+        feat_data()[["user", "item", "label"]], reset_state=True)
+    train.build_negative_samples(data_info, num_neg=3, lazy=True)
+    train.save(str(tmp_path))
+    # pure lazy samples can be rebuilt without data_info
+    loaded = TransformedSet.load(str(tmp_path))
+    _assert_transformed_equal(loaded, train)